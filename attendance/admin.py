@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Student, Attendance
+from .models import Student, Attendance, RecognitionLog
 
 
 @admin.register(Student)
@@ -8,6 +8,7 @@ class StudentAdmin(admin.ModelAdmin):
     list_filter = ('created_at',)
     search_fields = ('name', 'roll_no', 'user__username')
     readonly_fields = ('created_at', 'updated_at')
+    filter_horizontal = ('classes',)
 
 
 @admin.register(Attendance)
@@ -17,3 +18,12 @@ class AttendanceAdmin(admin.ModelAdmin):
     search_fields = ('student__name', 'student__roll_no')
     readonly_fields = ('marked_at',)
     date_hierarchy = 'date'
+
+
+@admin.register(RecognitionLog)
+class RecognitionLogAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'status', 'student', 'confidence', 'camera_id')
+    list_filter = ('day', 'status', 'camera_id')
+    search_fields = ('student__name', 'student__roll_no')
+    readonly_fields = ('created_at', 'day', 'details')
+    date_hierarchy = 'day'
@@ -0,0 +1,223 @@
+# attendance/audit.py
+import atexit
+import itertools
+import os
+import random
+import threading
+import logging
+from collections import deque
+import cv2
+from django.conf import settings
+from django.db import InterfaceError, OperationalError, close_old_connections, transaction
+from django.utils import timezone
+from .models import RecognitionLog
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+AUDIT_SETTINGS = {
+    # Fraction of events kept per outcome; attendance-marking events are always kept
+    'sample_rates': {'success': 0.05, 'failed': 0.2, 'multiple': 0.05, 'none': 0.0},
+    'buffer_size': 5000,
+    'batch_size': 500,
+    'flush_interval': 2.0,
+    'save_images': True,
+    'retention_days': 30,
+    **getattr(settings, 'FACEPULSE_AUDIT', {}),
+}
+
+# Images go under <MEDIA_ROOT>/recognition_logs/YYYY/MM/DD/ so a day is one directory
+IMAGE_ROOT = 'recognition_logs'
+
+
+class AuditLogger:
+    """
+    Sampled recognition audit log that never blocks the frame loop.
+
+    record() decides sampling, copies the face crop and appends to a bounded
+    ring buffer; when the buffer is full the oldest event is overwritten and
+    counted as dropped. A background thread drains the buffer in batches,
+    writes the JPEGs and inserts the rows with one bulk_create per batch.
+    """
+
+    def __init__(self, options=None):
+        options = options or AUDIT_SETTINGS
+        self.sample_rates = options['sample_rates']
+        self.buffer = deque(maxlen=options['buffer_size'])
+        self.batch_size = options['batch_size']
+        self.flush_interval = options['flush_interval']
+        self.save_images = options['save_images']
+        self.wakeup = threading.Event()
+        self.thread = None
+        self.start_lock = threading.Lock()
+        self.sequence = itertools.count(1)
+        self.dropped_counter = metrics.counter(
+            'facepulse_audit_dropped_total', 'Audit events overwritten before they were written')
+        self.written_counter = metrics.counter(
+            'facepulse_audit_written_total', 'Audit events written to the database')
+        self.failed_counter = metrics.counter(
+            'facepulse_audit_failed_total', 'Audit events discarded because they could not be written')
+
+    def sampled(self, status):
+        rate = self.sample_rates.get(status, 0.0)
+        return rate >= 1.0 or (rate > 0.0 and random.random() < rate)
+
+    def record(self, status, camera_id, student_id=None, confidence=None,
+               image=None, details=None, force=False):
+        """Queue one outcome; image is an RGB array (copied only if the event is kept)"""
+        if not force and not self.sampled(status):
+            return False
+
+        if len(self.buffer) == self.buffer.maxlen:
+            self.dropped_counter.inc()
+        self.buffer.append({
+            'status': status,
+            'camera_id': camera_id,
+            'student_id': student_id,
+            'confidence': None if confidence is None else round(float(confidence), 4),
+            'image': image.copy() if image is not None and self.save_images else None,
+            'details': details or {},
+            'created_at': timezone.now(),
+        })
+
+        if self.thread is None:
+            self.start()
+        if len(self.buffer) >= self.batch_size:
+            self.wakeup.set()
+        return True
+
+    def start(self):
+        with self.start_lock:
+            if self.thread is None:
+                self.thread = threading.Thread(
+                    target=self._run, name='audit-flush', daemon=True)
+                self.thread.start()
+                atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error writing audit log: {e}")
+                close_old_connections()
+
+    def flush(self):
+        """
+        Write everything buffered, one batch at a time; returns the number written.
+
+        When the database cannot be reached the batch is put back at the
+        front of the buffer for the next flush and the error is raised.
+        Any other failure is narrowed down by writing the batch's events one
+        at a time: events that fail on their own are logged and discarded,
+        so one bad event never holds back the ones after it. Crops written
+        for events that were not stored are deleted either way.
+        """
+        written = 0
+        while self.buffer:
+            batch = []
+            while self.buffer and len(batch) < self.batch_size:
+                batch.append(self.buffer.popleft())
+            rows = []
+            try:
+                for event in batch:
+                    rows.append(self.to_row(event))
+                with transaction.atomic():
+                    RecognitionLog.objects.bulk_create(rows, batch_size=self.batch_size)
+            except (OperationalError, InterfaceError):
+                self.delete_images(rows)
+                self.requeue(batch)
+                raise
+            except Exception as e:
+                logger.warning(f"Audit batch of {len(batch)} events failed ({e}); writing them one at a time")
+                self.delete_images(rows)
+                count = self.write_each(batch)
+            else:
+                count = len(batch)
+            written += count
+            self.written_counter.inc(count)
+        return written
+
+    def write_each(self, batch):
+        """Insert events one at a time, discarding those that fail; returns the number written"""
+        written = 0
+        for index, event in enumerate(batch):
+            row = None
+            try:
+                row = self.to_row(event)
+                with transaction.atomic():
+                    row.save()
+            except (OperationalError, InterfaceError):
+                if row is not None:
+                    self.delete_images([row])
+                self.written_counter.inc(written)
+                self.requeue(batch[index:])
+                raise
+            except Exception as e:
+                if row is not None:
+                    self.delete_images([row])
+                self.failed_counter.inc()
+                logger.error(
+                    f"Discarding audit event {event['status']} from camera {event['camera_id']} "
+                    f"(student {event['student_id']}): {e}")
+                continue
+            written += 1
+        return written
+
+    def requeue(self, batch):
+        """Put unwritten events back in front of newer ones; if that overfills the buffer the oldest are dropped"""
+        overflow = len(self.buffer) + len(batch) - self.buffer.maxlen
+        if overflow > 0:
+            self.dropped_counter.inc(overflow)
+            batch = batch[overflow:]
+        self.buffer.extendleft(reversed(batch))
+
+    def delete_images(self, rows):
+        for row in rows:
+            if row.image:
+                try:
+                    os.remove(os.path.join(settings.MEDIA_ROOT, row.image.name))
+                except OSError:
+                    pass
+
+    def to_row(self, event):
+        created_at = event['created_at']
+        day = timezone.localtime(created_at).date()
+        image_name = ''
+        if event['image'] is not None:
+            image_name = self.save_image(event, day)
+        return RecognitionLog(
+            status=event['status'],
+            camera_id=event['camera_id'],
+            student_id=event['student_id'],
+            confidence=event['confidence'],
+            image=image_name,
+            details=event['details'],
+            created_at=created_at,
+            day=day,
+        )
+
+    def save_image(self, event, day):
+        """Write the crop under the day's directory; returns the media-relative name"""
+        relative = os.path.join(
+            IMAGE_ROOT, f'{day:%Y}', f'{day:%m}', f'{day:%d}',
+            f"{event['camera_id']}-{event['created_at']:%H%M%S}-{next(self.sequence)}.jpg")
+        path = os.path.join(settings.MEDIA_ROOT, relative)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if not cv2.imwrite(path, cv2.cvtColor(event['image'], cv2.COLOR_RGB2BGR)):
+            return ''
+        return relative
+
+    def stats(self):
+        return {
+            'buffered': len(self.buffer),
+            'dropped': self.dropped_counter.value,
+            'written': self.written_counter.value,
+            'failed': self.failed_counter.value,
+        }
+
+
+# Shared by every camera in this process
+audit = AuditLogger()
@@ -0,0 +1,651 @@
+# attendance/camera.py
+import threading
+import time
+import logging
+from collections import namedtuple
+from datetime import datetime
+import cv2
+import face_recognition
+from django.conf import settings
+from django.utils import timezone
+from faculty.models import StudentClass
+from .models import Student, Attendance, AttendanceSession
+from .gallery import gallery
+from .events import EventLog
+from .snapshot import StatusSnapshot
+from .metrics import metrics
+from .audit import audit
+from .replay import FrameRecorder, is_replay, open_replay
+from .detection import LANDMARK_MODELS, face_shapes, encode_shapes
+from .encoding import ENCODING_SETTINGS
+from .quality import QualityGate, REASONS
+from .regions import DEFAULT_REFINEMENT, SOURCES, RegionRefiner, covered
+from .unknowns import DEFAULT_UNKNOWNS, UnknownCache
+from .shortlist import DEFAULT_SHORTLIST, RecentShortlist
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CAMERA = 'default'
+
+# Whether class-bound sessions retry faces that match nobody in the class against every student
+CLASS_FALLBACK = getattr(settings, 'FACEPULSE_CLASS_FALLBACK', False)
+
+# Faces below these are skipped before encoding; see attendance.quality
+QUALITY_SETTINGS = {
+    'enabled': True,
+    **getattr(settings, 'FACEPULSE_QUALITY', {}),
+}
+
+# Second detection pass over candidate regions at a higher resolution; see attendance.regions
+REFINEMENT_SETTINGS = {
+    **DEFAULT_REFINEMENT,
+    'back_rows': {},
+    **getattr(settings, 'FACEPULSE_REFINEMENT', {}),
+}
+
+# Recently seen unknown faces skip the gallery search; see attendance.unknowns
+UNKNOWN_SETTINGS = {
+    **DEFAULT_UNKNOWNS,
+    **getattr(settings, 'FACEPULSE_UNKNOWNS', {}),
+}
+
+# Students recently recognized on a camera are searched before the gallery; see attendance.shortlist
+SHORTLIST_SETTINGS = {
+    **DEFAULT_SHORTLIST,
+    **getattr(settings, 'FACEPULSE_SHORTLIST', {}),
+}
+
+# Frames are downscaled by this much for the first detection pass
+PREPARE_SCALE = 0.25
+
+# One recognized (or unknown) face, in full-frame coordinates
+Detection = namedtuple(
+    'Detection', 'top right bottom left student_id name confidence')
+
+# A frame ready for recognition: the downscaled RGB copy, plus the full BGR
+# frame when the second detection pass is enabled
+PreparedFrame = namedtuple('PreparedFrame', 'small full')
+
+
+def to_frame(location, origin, factor):
+    """A (top, right, bottom, left) location in a scaled crop, in full-frame pixels"""
+    origin_top, origin_left = origin
+    top, right, bottom, left = location
+    return (int(top * factor) + origin_top, int(right * factor) + origin_left,
+            int(bottom * factor) + origin_top, int(left * factor) + origin_left)
+
+
+def is_device(source):
+    return isinstance(source, int) or str(source).isdigit()
+
+
+def is_file(source):
+    return not is_device(source) and not is_replay(source) and '://' not in str(source)
+
+
+def open_source(source):
+    """Open a device index, RTSP/HTTP URL, video file or replay: recording"""
+    if is_replay(source):
+        # Replays pace themselves from the recorded timestamps
+        return open_replay(source)
+    if is_device(source):
+        capture = cv2.VideoCapture(int(source))
+        if capture.isOpened():
+            # Set camera properties
+            capture.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
+            capture.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
+            capture.set(cv2.CAP_PROP_FPS, 30)
+        return capture
+    return cv2.VideoCapture(str(source))
+
+
+def resolve_classes(codes):
+    """Ids of the StudentClass codes given; raises ValueError naming unknown codes"""
+    codes = [code.strip() for code in codes if code.strip()]
+    found = dict(StudentClass.objects.filter(code__in=codes).values_list('code', 'id'))
+    missing = [code for code in codes if code not in found]
+    if missing:
+        raise ValueError(f"Unknown class: {', '.join(missing)}")
+    return [found[code] for code in codes]
+
+
+class FaceRecognitionCamera:
+    def __init__(self, camera_id=DEFAULT_CAMERA, source=0, face_gallery=None, pool=None):
+        self.camera_id = camera_id
+        self.source = source
+        self.pool = pool
+        self.camera = None
+        # The capture a frames() loop is reading from; stop_camera leaves it to that loop
+        self.reading = None
+        self.capture_lock = threading.Lock()
+        self.is_active = False
+        self.gallery = gallery if face_gallery is None else face_gallery
+        self.attendance_marked = set()
+        self.recognized = {}
+        self.detections = []
+        self.events = EventLog()
+        self.snapshot = StatusSnapshot()
+        self.frame_count = 0
+        self.frame_interval = 0.0
+        self.recognition_threshold = 0.5
+        self.class_ids = frozenset()
+        self.global_fallback = CLASS_FALLBACK
+        self.quality = QualityGate(**QUALITY_SETTINGS)
+        self.audit = audit
+        self.encoding = dict(ENCODING_SETTINGS['live'])
+        refinement = dict(REFINEMENT_SETTINGS)
+        back_rows = refinement.pop('back_rows').get(camera_id, ())
+        # Configuring back rows for a camera turns its second pass on
+        refinement['enabled'] = refinement['enabled'] or bool(back_rows)
+        self.refiner = RegionRefiner(back_rows, **refinement)
+        self.unknowns = UnknownCache(self.decision_gallery, self.recognition_threshold, **UNKNOWN_SETTINGS)
+        self.shortlist = RecentShortlist(self.decision_gallery, self.recognition_threshold, **SHORTLIST_SETTINGS)
+        if self.encoding['model'] not in LANDMARK_MODELS:
+            raise ValueError(f"Unknown landmark model: {self.encoding['model']}")
+        self.current_session = None
+        # Set by attendance.profiling while a cProfile capture is running
+        self.profiler = None
+        self.recorder = None
+        self.timers = metrics.stage_timers(camera_id)
+        self.frames_counter = metrics.counter(
+            'facepulse_frames_total', 'Frames read from the camera', camera=camera_id)
+        self.faces_counter = metrics.counter(
+            'facepulse_faces_total', 'Faces detected', camera=camera_id)
+        self.recognitions_counter = metrics.counter(
+            'facepulse_recognitions_total', 'Students recognized and marked present', camera=camera_id)
+        self.unknowns_counter = metrics.counter(
+            'facepulse_unknown_faces_total', 'Faces that matched no student', camera=camera_id)
+        self.shortlist_hits_counter = metrics.counter(
+            'facepulse_shortlist_hits_total',
+            'Faces matched from the recently recognized shortlist without a gallery search', camera=camera_id)
+        self.shortlist_misses_counter = metrics.counter(
+            'facepulse_shortlist_misses_total',
+            'Faces the recently recognized shortlist could not decide', camera=camera_id)
+        self.unknown_hits_counter = metrics.counter(
+            'facepulse_unknown_cache_hits_total',
+            'Unknown faces recognized from the unknown-face cache without a gallery search', camera=camera_id)
+        self.fallback_counter = metrics.counter(
+            'facepulse_class_fallback_matches_total',
+            'Faces matched outside the session classes by the global fallback', camera=camera_id)
+        self.skip_counters = {
+            reason: metrics.counter(
+                'facepulse_quality_skipped_total', 'Faces skipped before encoding by the quality gate',
+                camera=camera_id, reason=reason)
+            for reason in REASONS
+        }
+        self.refined_counters = {
+            source: metrics.counter(
+                'facepulse_refined_faces_total', 'Faces only the second, higher-resolution pass found',
+                camera=camera_id, source=source)
+            for source in SOURCES
+        }
+
+        # Load face encodings once per process; every camera shares them
+        if not self.gallery.loaded:
+            self.load_face_encodings()
+
+    def load_face_encodings(self):
+        """Load face encodings from database"""
+        return self.gallery.load()
+
+    def start_camera(self, user=None, class_ids=None):
+        """Start camera and create session; class_ids limits matching to those classes"""
+        try:
+            if self.camera is not None:
+                self.stop_camera()
+
+            self.camera = open_source(self.source)
+            if not self.camera.isOpened():
+                logger.error(f"Could not open camera {self.camera_id}")
+                self.camera = None
+                return False
+
+            # Play video files at their own frame rate instead of as fast as possible
+            self.frame_interval = 0.0
+            if is_file(self.source):
+                fps = self.camera.get(cv2.CAP_PROP_FPS) or 30
+                self.frame_interval = 1.0 / fps
+
+            self.is_active = True
+            self.attendance_marked.clear()
+            self.recognized = {}
+            self.detections = []
+            self.events.append('reset', {})
+            self.snapshot.start_session()
+            self.frame_count = 0
+            self.class_ids = frozenset(class_ids or ())
+            self.unknowns.clear()
+            self.shortlist.clear()
+
+            # Create attendance session
+            if user:
+                self.current_session = AttendanceSession.objects.create(
+                    name=f"Face Recognition ({self.camera_id}) - {datetime.now().strftime('%H:%M')}",
+                    camera_id=self.camera_id,
+                    created_by=user,
+                    is_active=True
+                )
+                if self.class_ids:
+                    self.current_session.classes.set(self.class_ids)
+
+            logger.info(f"Camera {self.camera_id} started successfully")
+            return True
+
+        except Exception as e:
+            logger.error(f"Error starting camera {self.camera_id}: {e}")
+            return False
+
+    def stop_camera(self):
+        """
+        Stop camera and end session.
+
+        A frame still queued for recognition is dropped. A capture that a
+        frames() loop is reading from is left for that loop to release once
+        its read returns, since releasing it mid-read is not safe.
+        """
+        try:
+            self.is_active = False
+            if self.pool is not None:
+                self.pool.cancel(self.camera_id)
+            self.snapshot.stop_session()
+            self.stop_recording()
+
+            with self.capture_lock:
+                if self.camera is not None and self.camera is not self.reading:
+                    self.camera.release()
+                self.camera = None
+
+            # End current session
+            if self.current_session:
+                self.current_session.total_recognized = len(
+                    self.attendance_marked)
+                self.current_session.end_session()
+                self.current_session = None
+
+            cv2.destroyAllWindows()
+            logger.info(f"Camera {self.camera_id} stopped successfully")
+            return True
+
+        except Exception as e:
+            logger.error(f"Error stopping camera {self.camera_id}: {e}")
+            return False
+
+    def start_recording(self, path, quality=90):
+        """Save every raw frame read from now on, with timestamps, for replay"""
+        self.stop_recording()
+        fps = self.camera.get(cv2.CAP_PROP_FPS) if self.camera is not None else 0
+        self.recorder = FrameRecorder(
+            path, fps=fps or 30.0, quality=quality, camera_id=self.camera_id)
+        logger.info(f"Recording camera {self.camera_id} to {path}")
+        return self.recorder
+
+    def stop_recording(self):
+        """Close the current recording; returns the recorder, or None when not recording"""
+        recorder, self.recorder = self.recorder, None
+        if recorder is not None:
+            recorder.close()
+            logger.info(
+                f"Recorded {recorder.frames_written} frames from camera {self.camera_id} to {recorder.path}")
+        return recorder
+
+    def frames(self):
+        """Read raw camera frames and queue every 3rd one for recognition; drawing is left to viewers"""
+        capture = self.camera
+        with self.capture_lock:
+            self.reading = capture
+        try:
+            yield from self._read_frames(capture)
+        finally:
+            with self.capture_lock:
+                if self.reading is capture:
+                    self.reading = None
+                # Stopped, or restarted on a new capture, while this loop was reading
+                if capture is not None and (not self.is_active or self.camera is not capture):
+                    capture.release()
+                    if self.camera is capture:
+                        self.camera = None
+
+    def _read_frames(self, capture):
+        next_frame_at = time.monotonic()
+        while self.is_active and capture is not None and self.camera is capture:
+            try:
+                started = time.perf_counter()
+                success, frame = capture.read()
+                if not success:
+                    break
+                self.timers['capture'].since(started)
+
+                self.frame_count += 1
+                self.frames_counter.inc()
+
+                recorder = self.recorder
+                if recorder is not None:
+                    recorder.write(frame)
+
+                # Pick up enrollment changes published by other processes
+                if self.gallery.refresh():
+                    self.snapshot.refresh_counts()
+                else:
+                    self.snapshot.maybe_refresh_counts()
+
+                # Process every 3rd frame for performance
+                if self.frame_count % 3 == 0:
+                    small_frame = self.prepare(frame)
+                    if self.pool is not None:
+                        self.pool.submit(self, small_frame)
+                    else:
+                        self.process(small_frame)
+
+                if self.frame_interval:
+                    next_frame_at += self.frame_interval
+                    delay = next_frame_at - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                    else:
+                        next_frame_at = time.monotonic()
+
+                yield frame
+
+            except Exception as e:
+                logger.error(f"Error generating frame: {e}")
+                break
+
+    def prepare(self, frame):
+        """Downscale and convert a BGR frame for recognition"""
+        started = time.perf_counter()
+        # Resize frame for faster processing
+        small_frame = cv2.resize(frame, (0, 0), fx=PREPARE_SCALE, fy=PREPARE_SCALE)
+        rgb_small_frame = cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB)
+        full = None
+        if self.refiner.enabled:
+            # Viewers draw on the original while recognition runs, so the second pass gets a copy
+            full = frame.copy()
+        self.timers['prepare'].since(started)
+        return PreparedFrame(rgb_small_frame, full)
+
+    def process(self, prepared):
+        """Recognize faces in a prepared frame; the result is drawn on later frames"""
+        profiler = self.profiler
+        if profiler is None:
+            self.detections = self.recognize(prepared)
+        else:
+            self.detections = profiler.runcall(self.recognize, prepared)
+
+    def process_frame(self, frame):
+        """Recognize and annotate a single full-size frame synchronously"""
+        self.process(self.prepare(frame))
+        self.annotate(frame)
+        return frame
+
+    def recognize(self, prepared):
+        """Detect, encode and match faces, marking attendance for new students"""
+        detections = []
+        rgb_small_frame = prepared.small
+        try:
+            # Find faces in current frame
+            started = time.perf_counter()
+            face_locations = face_recognition.face_locations(rgb_small_frame)
+            self.timers['detect'].since(started)
+
+            # (image, locations, origin, factor) for each image faces were found in
+            views = [(rgb_small_frame, face_locations, (0, 0), 1 / PREPARE_SCALE)]
+            if prepared.full is not None:
+                started = time.perf_counter()
+                views.extend(self.refine(prepared, face_locations))
+                self.timers['refine'].since(started)
+
+            face_count = sum(len(locations) for _, locations, _, _ in views)
+            if not face_count:
+                if self.refiner.enabled:
+                    self.refiner.track([])
+                self.audit.record('none', self.camera_id)
+                return detections
+            if face_count > 1:
+                self.audit.record('multiple', self.camera_id, image=rgb_small_frame,
+                                  details={'faces': face_count})
+
+            self.faces_counter.inc(face_count)
+
+            # Landmarks are needed for encoding anyway; score pose, size and blur from them first
+            started = time.perf_counter()
+            accepted = []
+            boxes = []
+            for image, locations, origin, factor in views:
+                shapes = face_shapes(image, locations, self.encoding['model'])
+                reasons = self.quality.check(image, locations, shapes, factor)
+                kept = []
+                for location, shape, reason in zip(locations, shapes, reasons):
+                    box = to_frame(location, origin, factor)
+                    boxes.append(box)
+                    if reason is None:
+                        kept.append((location, box, shape))
+                        continue
+                    # Not worth encoding; the face gets another chance on the next frame
+                    self.skip_counters[reason].inc()
+                    detections.append(Detection(*box, None, reason.capitalize(), 0))
+                if kept:
+                    accepted.append((image, kept))
+            self.timers['quality'].since(started)
+            if self.refiner.enabled:
+                self.refiner.track(boxes)
+            if not accepted:
+                return detections
+
+            started = time.perf_counter()
+            faces = []
+            for image, kept in accepted:
+                encodings = encode_shapes(
+                    image, [shape for _, _, shape in kept], self.encoding['num_jitters'])
+                faces.extend(
+                    (image, location, box, encoding)
+                    for (location, box, _), encoding in zip(kept, encodings))
+            self.timers['encode'].since(started)
+
+            # Process each face
+            for image, (top, right, bottom, left), box, face_encoding in faces:
+                # Compare with known faces
+                name = "Unknown"
+                confidence = 0
+                student_id = None
+                distance = None
+                marked = False
+
+                started = time.perf_counter()
+                match, scope, cluster = self.search(face_encoding, image[top:bottom, left:right])
+                self.timers['match'].since(started)
+                if not match:
+                    self.unknowns_counter.inc()
+                else:
+                    student_id, name, roll_no, distance = match
+                    confidence = 1 - distance
+
+                    # Mark attendance if not already marked
+                    if student_id not in self.attendance_marked and confidence > 0.4:
+                        started = time.perf_counter()
+                        created = self.mark_attendance(student_id, confidence)
+                        self.timers['db_write'].since(started)
+                        self.recognitions_counter.inc()
+                        self.attendance_marked.add(student_id)
+                        self.record_recognition(
+                            student_id, name, roll_no, confidence, created)
+                        marked = True
+
+                # Every attendance mark is audited; other outcomes are sampled
+                self.audit.record(
+                    'success' if student_id else 'failed', self.camera_id,
+                    student_id=student_id, confidence=confidence,
+                    image=image[top:bottom, left:right],
+                    details={'distance': distance, 'box': list(box),
+                             'marked': marked, 'scope': scope,
+                             'unknown_cluster': cluster.id if cluster is not None else None},
+                    force=marked)
+
+                detections.append(Detection(*box, student_id, name, confidence))
+
+        except Exception as e:
+            logger.error(f"Error processing frame: {e}")
+
+        return detections
+
+    def decision_gallery(self):
+        """Gallery whose search decides whether a face is unknown"""
+        if self.class_ids and not self.global_fallback:
+            return self.gallery.subset(self.class_ids)
+        return self.gallery
+
+    def refine(self, prepared, face_locations):
+        """Re-detect candidate regions of the full frame that the coarse pass may have missed"""
+        factor = 1 / PREPARE_SCALE
+        coarse = [to_frame(location, (0, 0), factor) for location in face_locations]
+        # Measured here rather than in prepare(), so frames the pool replaces before
+        # recognition do not count and motion is always since the last recognized frame
+        motion = self.refiner.motion(prepared.small, factor)
+        regions = self.refiner.plan(prepared.full.shape, coarse, motion)
+        views = []
+        for image, locations, origin, scale, source in self.refiner.detect(prepared.full, regions):
+            # Faces the coarse pass found are encoded from the downscaled frame only
+            locations = [
+                location for location in locations
+                if not covered(to_frame(location, origin, scale), coarse)
+            ]
+            if locations:
+                self.refined_counters[source].inc(len(locations))
+                views.append((image, locations, origin, scale))
+        return views
+
+    def search(self, face_encoding, face=None):
+        """
+        Match a face, answering from the per-camera caches when they can.
+
+        The shortlist of recently recognized students and the cache of
+        recently seen unknown faces only answer when their answer is certain
+        to equal the gallery search's. A face the gallery search does not
+        match joins the unknown cache, with its crop (face) when given.
+        Returns (match or None, scope, unknown cluster or None).
+        """
+        if self.shortlist.enabled:
+            match = self.shortlist.lookup(face_encoding)
+            if match is not None:
+                self.shortlist_hits_counter.inc()
+                return match, 'shortlist', None
+            self.shortlist_misses_counter.inc()
+
+        cluster = self.unknowns.lookup(face_encoding)
+        if cluster is not None:
+            # Seen recently and certainly nobody in the gallery
+            self.unknown_hits_counter.inc()
+            return None, 'unknown_cache', cluster
+
+        match, scope, distance = self.match(face_encoding)
+        if match is None:
+            # Nobody is within the threshold; remember the face with how far the nearest student was
+            image = None if face is None else face.copy()
+            return None, scope, self.unknowns.add(face_encoding, image, distance=distance)
+        # Fallback matches are outside the session's classes, which are searched first
+        if not self.class_ids or scope == 'class':
+            self.shortlist.add(match[0])
+        return match, scope, None
+
+    def match(self, face_encoding):
+        """
+        Closest student within the threshold and where it was found.
+
+        Class-bound sessions search only their classes' sub-gallery; with
+        global_fallback a face nobody in the class matches is retried
+        against every student. Returns (match or None, 'class' or 'global',
+        distance to the nearest student of the last gallery searched). On a
+        miss that gallery is decision_gallery(), and the distance is kept as
+        the unknown-face cache's margin.
+        """
+        if not self.class_ids:
+            match, distance = self.within(self.gallery.match(face_encoding, float('inf')))
+            return match, 'global', distance
+
+        match, distance = self.within(
+            self.gallery.subset(self.class_ids).match(face_encoding, float('inf')))
+        if match is not None or not self.global_fallback:
+            return match, 'class', distance
+
+        match, distance = self.within(self.gallery.match(face_encoding, float('inf')))
+        if match is not None:
+            self.fallback_counter.inc()
+        return match, 'global', distance
+
+    def within(self, nearest):
+        """(nearest if within the threshold else None, its distance or inf for an empty gallery)"""
+        if nearest is None:
+            return None, float('inf')
+        return (nearest if nearest[3] <= self.recognition_threshold else None), nearest[3]
+
+    def annotate(self, frame):
+        """Draw the latest detections and the status overlay"""
+        started = time.perf_counter()
+        for top, right, bottom, left, student_id, name, confidence in self.detections:
+            # Draw rectangle and label
+            color = (0, 255, 0) if student_id else (0, 0, 255)
+            cv2.rectangle(frame, (left, top), (right, bottom), color, 2)
+
+            # Draw label
+            label = f"{name} ({confidence:.2f})" if confidence > 0 else name
+            cv2.rectangle(frame, (left, bottom - 35),
+                          (right, bottom), color, cv2.FILLED)
+            cv2.putText(frame, label, (left + 6, bottom - 6),
+                        cv2.FONT_HERSHEY_DUPLEX, 0.6, (255, 255, 255), 1)
+
+        # Add status overlay
+        self.add_status_overlay(frame)
+        self.timers['draw'].since(started)
+
+    def add_status_overlay(self, frame):
+        """Add status information to frame"""
+        try:
+            # Status background
+            cv2.rectangle(frame, (10, 10), (300, 100), (0, 0, 0), -1)
+            cv2.rectangle(frame, (10, 10), (300, 100), (255, 255, 255), 2)
+
+            # Status text
+            cv2.putText(frame, f"Students: {len(self.gallery)}",
+                        (20, 35), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+            cv2.putText(frame, f"Present: {len(self.attendance_marked)}",
+                        (20, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+            cv2.putText(frame, f"Frame: {self.frame_count}",
+                        (20, 85), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+
+        except Exception as e:
+            logger.error(f"Error adding overlay: {e}")
+
+    def record_recognition(self, student_id, name, roll_no, confidence, created=False):
+        """Publish a recognition to connected event streams and the status snapshot"""
+        data = {
+            'id': student_id,
+            'name': name,
+            'roll_no': roll_no,
+            'confidence': round(float(confidence), 3),
+            'time': timezone.now().isoformat(),
+        }
+        self.recognized[student_id] = data
+        self.events.append('recognized', data)
+        self.snapshot.add_recognized(data, created)
+
+    def mark_attendance(self, student_id, confidence):
+        """Mark attendance for recognized student"""
+        try:
+            student = Student.objects.get(id=student_id)
+            attendance, created = Attendance.mark_attendance(
+                student=student,
+                status='present',
+                confidence=confidence,
+                notes=f'Face recognition ({self.camera_id}) - {confidence:.2f} confidence'
+            )
+
+            if created:
+                logger.info(
+                    f"Marked attendance for {student.name} ({confidence:.2f})")
+            else:
+                logger.info(
+                    f"Updated attendance for {student.name} ({confidence:.2f})")
+            return created
+
+        except Exception as e:
+            logger.error(f"Error marking attendance: {e}")
+            return False
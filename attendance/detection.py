@@ -0,0 +1,186 @@
+# attendance/detection.py
+"""
+Face detection for large still images such as classroom group photos.
+
+Distant faces are too small to survive the 0.25 downscale used for live
+video, so the photo is also scanned at full resolution in overlapping tiles.
+Tiles can be spread over worker processes; like attendance/video.py this
+module does not touch Django so those workers stay lightweight.
+"""
+import functools
+import multiprocessing
+import threading
+import dlib
+import numpy as np
+import cv2
+import face_recognition
+import face_recognition_models
+from concurrent.futures import ProcessPoolExecutor
+
+# Smallest face, in pixels, the HOG detector finds without upsampling
+HOG_WINDOW = 80
+
+# dlib landmark models: 'small' finds 5 points and is what face_recognition
+# uses by default, 'large' finds 68 and is slower
+LANDMARK_MODELS = ('small', 'large')
+
+# The dlib models face_recognition ships, loaded here rather than taken from
+# face_recognition.api's private globals
+MODEL_FILES = {
+    'small': (dlib.shape_predictor, face_recognition_models.pose_predictor_five_point_model_location),
+    'large': (dlib.shape_predictor, face_recognition_models.pose_predictor_model_location),
+    'encoder': (dlib.face_recognition_model_v1, face_recognition_models.face_recognition_model_location),
+}
+
+_executor = None
+_executor_workers = 0
+_executor_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=None)
+def dlib_model(name):
+    """A dlib model from MODEL_FILES, loaded once per process on first use"""
+    load, location = MODEL_FILES[name]
+    return load(location())
+
+
+def tile_origins(length, tile, overlap):
+    """Start offsets along one axis so tiles of size tile overlap by at least overlap"""
+    if length <= tile:
+        return [0]
+    stride = max(1, tile - overlap)
+    origins = list(range(0, length - tile, stride))
+    origins.append(length - tile)
+    return origins
+
+
+def tiles(height, width, tile=1024, overlap=256):
+    """(top, left) origins of overlapping tiles covering an image"""
+    return [
+        (top, left)
+        for top in tile_origins(height, tile, overlap)
+        for left in tile_origins(width, tile, overlap)
+    ]
+
+
+def detect_tile(image, upsample=0):
+    """face_locations for one tile; runs in a worker process"""
+    return face_recognition.face_locations(image, number_of_times_to_upsample=upsample)
+
+
+def get_executor(workers):
+    """Process pool reused across photos so workers load dlib only once"""
+    global _executor, _executor_workers
+    with _executor_lock:
+        if _executor is None or _executor_workers != workers:
+            if _executor is not None:
+                _executor.shutdown(wait=False)
+            _executor = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+            _executor_workers = workers
+        return _executor
+
+
+def non_max_suppression(boxes, iou_threshold=0.3, containment_threshold=0.6):
+    """
+    Drop duplicate (top, right, bottom, left) boxes, keeping the larger one.
+
+    Boxes from overlapping tiles or from different scales rarely line up
+    exactly, and a face cut by a tile edge yields a partial box inside the
+    complete one, so a box is also dropped when most of it lies inside a
+    box already kept.
+    """
+    if not boxes:
+        return []
+    array = np.asarray(boxes, dtype=np.float64)
+    top, right, bottom, left = array.T
+    areas = np.maximum(0, bottom - top) * np.maximum(0, right - left)
+    order = np.argsort(-areas, kind='stable')
+
+    keep = []
+    while len(order):
+        best = order[0]
+        keep.append(int(best))
+        rest = order[1:]
+        overlap_h = np.maximum(0, np.minimum(bottom[best], bottom[rest]) - np.maximum(top[best], top[rest]))
+        overlap_w = np.maximum(0, np.minimum(right[best], right[rest]) - np.maximum(left[best], left[rest]))
+        intersection = overlap_h * overlap_w
+        union = areas[best] + areas[rest] - intersection
+        iou = intersection / np.maximum(union, 1)
+        contained = intersection / np.maximum(areas[rest], 1)
+        order = rest[(iou <= iou_threshold) & (contained <= containment_threshold)]
+
+    return [tuple(int(value) for value in boxes[index]) for index in sorted(keep)]
+
+
+def detect_faces(image, tile=1024, overlap=256, upsample=0, coarse_scale=None, workers=1):
+    """
+    Face locations in a large RGB image, in full-resolution coordinates.
+
+    Every face smaller than overlap lies whole inside some tile, so the tiled
+    pass at full resolution finds small faces. Larger faces may be cut by
+    tile edges; the coarse pass finds them on a downscaled copy, by default
+    scaled so that overlap-sized faces still fill the detector's 80px window.
+    """
+    height, width = image.shape[:2]
+    boxes = []
+
+    coarse_scale = coarse_scale or min(1.0, HOG_WINDOW / overlap)
+    if coarse_scale < 1.0:
+        small = cv2.resize(image, (0, 0), fx=coarse_scale, fy=coarse_scale,
+                           interpolation=cv2.INTER_AREA)
+        factor = 1 / coarse_scale
+        boxes.extend(
+            tuple(int(round(value * factor)) for value in location)
+            for location in face_recognition.face_locations(small, number_of_times_to_upsample=0)
+        )
+
+    origins = tiles(height, width, tile, overlap)
+    crops = [image[top:top + tile, left:left + tile] for top, left in origins]
+    if workers > 1 and len(crops) > 1:
+        results = get_executor(workers).map(detect_tile, crops, [upsample] * len(crops))
+    else:
+        results = (detect_tile(crop, upsample) for crop in crops)
+
+    for (origin_top, origin_left), locations in zip(origins, results):
+        boxes.extend(
+            (top + origin_top, right + origin_left, bottom + origin_top, left + origin_left)
+            for top, right, bottom, left in locations
+        )
+
+    return non_max_suppression(boxes)
+
+
+def face_shapes(image, locations, model='small'):
+    """dlib landmark shapes of the faces at locations; 'small' is what face_encodings uses"""
+    if model not in LANDMARK_MODELS:
+        # face_recognition quietly treats anything but 'small' as 'large'
+        raise ValueError(f'Unknown landmark model: {model}')
+    predictor = dlib_model(model)
+    return [predictor(image, dlib.rectangle(left, top, right, bottom))
+            for top, right, bottom, left in locations]
+
+
+def encode_shapes(image, shapes, num_jitters=1):
+    """128-d encodings for faces with known landmarks in one descriptor batch; an (n, 128) array"""
+    if not shapes:
+        return np.empty((0, 128))
+    batch = dlib.full_object_detections()
+    for landmarks in shapes:
+        batch.append(landmarks)
+    return np.array(dlib_model('encoder').compute_face_descriptor(image, batch, num_jitters))
+
+
+def encode_faces(image, locations, num_jitters=1, model='small'):
+    """128-d encodings for all faces in one descriptor batch; returns an (n, 128) array"""
+    if not locations:
+        return np.empty((0, 128))
+    return encode_shapes(image, face_shapes(image, locations, model), num_jitters)
+
+
+def decode_image(data):
+    """Decode uploaded image bytes to an RGB array; None if unreadable"""
+    bgr = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if bgr is None:
+        return None
+    return cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
@@ -0,0 +1,10 @@
+# attendance/encoding.py
+from django.conf import settings
+
+# Landmark model ('small' 5-point or 'large' 68-point) and num_jitters used to
+# encode faces; enrollment can afford slower settings than live recognition
+_encoding = getattr(settings, 'FACEPULSE_ENCODING', {})
+ENCODING_SETTINGS = {
+    purpose: {'model': 'small', 'num_jitters': 1, **_encoding.get(purpose, {})}
+    for purpose in ('live', 'enrollment')
+}
@@ -0,0 +1,158 @@
+# attendance/events.py
+import asyncio
+import json
+import threading
+import time
+from collections import deque
+from .streaming import LoopWaiter
+
+
+def sse(event_type, data, event_id=None):
+    """Format one server-sent event"""
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {event_type}')
+    lines.append(f'data: {json.dumps(data)}')
+    return ('\n'.join(lines) + '\n\n').encode()
+
+
+class EventLog:
+    """
+    Bounded in-memory log of recognition events.
+
+    Event ids are "<epoch>-<n>" so a client reconnecting with a Last-Event-ID
+    from an earlier server process, or one that has fallen out of the buffer,
+    is detected and sent a fresh snapshot instead of a partial replay.
+    """
+
+    def __init__(self, maxlen=1000):
+        self.epoch = int(time.time())
+        self.events = deque(maxlen=maxlen)
+        self.last_id = 0
+        self.condition = threading.Condition()
+        self.loop_waiters = {}
+
+    def append(self, event_type, data):
+        """Record an event and wake every waiting stream"""
+        with self.condition:
+            self.last_id += 1
+            self.events.append((self.last_id, event_type, data))
+            self.condition.notify_all()
+            waiters = list(self.loop_waiters.values())
+        for waiter in waiters:
+            try:
+                waiter.loop.call_soon_threadsafe(waiter.wake)
+            except RuntimeError:
+                pass
+
+    def format_id(self, number):
+        return f'{self.epoch}-{number}'
+
+    def parse_id(self, event_id):
+        """Return the sequence number of a Last-Event-ID from this log, or None"""
+        try:
+            epoch, number = event_id.split('-')
+            if int(epoch) == self.epoch:
+                return int(number)
+        except (AttributeError, ValueError):
+            pass
+        return None
+
+    def since(self, number):
+        """Events after number, or None if some of them are no longer buffered"""
+        with self.condition:
+            if number > self.last_id:
+                return None
+            if self.events and number < self.events[0][0] - 1:
+                return None
+            return [event for event in self.events if event[0] > number]
+
+    def wait(self, number, timeout):
+        with self.condition:
+            if self.last_id <= number:
+                self.condition.wait(timeout)
+
+    async def wait_async(self, number, timeout):
+        loop = asyncio.get_running_loop()
+        with self.condition:
+            waiter = self.loop_waiters.get(loop)
+            if waiter is None:
+                waiter = self.loop_waiters[loop] = LoopWaiter(loop)
+            waiter.viewers += 1
+        try:
+            if self.last_id <= number:
+                await asyncio.wait_for(asyncio.shield(waiter.future), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self.condition:
+                waiter.viewers -= 1
+                if not waiter.viewers:
+                    self.loop_waiters.pop(loop, None)
+
+
+class EventStream:
+    """
+    State of one SSE connection: replay or snapshot on connect, then new
+    events as they arrive plus a status event every status_interval seconds.
+    """
+
+    def __init__(self, log, snapshot, status, last_event_id=None, status_interval=5.0):
+        self.log = log
+        self.snapshot = snapshot
+        self.status = status
+        self.status_interval = status_interval
+        self.position = log.parse_id(last_event_id)
+
+    def opening(self):
+        """Chunks sent when the client connects"""
+        chunks = [b'retry: 3000\n\n']
+        missed = self.log.since(self.position) if self.position is not None else None
+        if missed is None:
+            # Unknown or expired position; resynchronise the client
+            self.position = self.log.last_id
+            chunks.append(sse('snapshot', self.snapshot(),
+                              self.log.format_id(self.position)))
+        else:
+            chunks.extend(self.pending(missed))
+        chunks.append(sse('status', self.status()))
+        return chunks
+
+    def pending(self, events=None):
+        """Chunks for events after the current position"""
+        if events is None:
+            events = self.log.since(self.position)
+            if events is None:
+                # Fell out of the buffer while connected
+                return self.opening()[1:]
+        chunks = []
+        for number, event_type, data in events:
+            chunks.append(sse(event_type, data, self.log.format_id(number)))
+            self.position = number
+        return chunks
+
+    def blocking(self):
+        """Blocking generator for the WSGI handler"""
+        yield from self.opening()
+        next_status = time.monotonic() + self.status_interval
+        while True:
+            self.log.wait(self.position, max(0.0, next_status - time.monotonic()))
+            yield from self.pending()
+            if time.monotonic() >= next_status:
+                next_status = time.monotonic() + self.status_interval
+                yield sse('status', self.status())
+
+    async def asynchronous(self):
+        """Async generator for the ASGI handler"""
+        for chunk in self.opening():
+            yield chunk
+        next_status = time.monotonic() + self.status_interval
+        while True:
+            await self.log.wait_async(
+                self.position, max(0.0, next_status - time.monotonic()))
+            for chunk in self.pending():
+                yield chunk
+            if time.monotonic() >= next_status:
+                next_status = time.monotonic() + self.status_interval
+                yield sse('status', self.status())
@@ -0,0 +1,437 @@
+# attendance/gallery.py
+import threading
+import time
+import logging
+import numpy as np
+from django.conf import settings
+from django.db.models import Max, Q
+from .models import Student, GalleryChange
+from .quantization import QuantizedEncodings
+
+logger = logging.getLogger(__name__)
+
+ENCODING_SIZE = 128
+
+# Queries matched at a time, and gallery rows compared with them at a time, so a
+# batch needs at most a 1024 x 4096 float64 distance block (32MB) whatever its size
+MATCH_BLOCK = 1024
+GALLERY_BLOCK = 4096
+
+# How long a skipped change id is re-polled before it is treated as rolled back
+GAP_TIMEOUT = 60.0
+
+# codes: None keeps float64 encodings; 'float16' or 'int8' keeps compact codes
+# resident and a memory-mapped float32 copy for re-ranking the top `rerank` candidates
+GALLERY_QUANTIZATION = {
+    'codes': None,
+    'rerank': 16,
+    **getattr(settings, 'FACEPULSE_GALLERY_QUANTIZATION', {}),
+}
+
+
+class FaceGallery:
+    """
+    In-memory face encodings kept in sync with the database.
+
+    A full load happens once; afterwards only the students named in new
+    GalleryChange rows are re-read and applied. Rows live in a preallocated
+    matrix so upserts append and deletes swap the last row into the hole.
+    With quantization the matrix holds compact codes instead (see
+    attendance.quantization) and matches are re-ranked at full precision.
+
+    Class memberships are kept alongside, so sessions bound to classes can
+    match against a small per-class sub-gallery; sub-galleries are built
+    on first use and dropped when one of their students changes.
+
+    Searches run outside the lock so the recognition pool's workers do not
+    queue behind each other; every write bumps generation, and a search
+    that overlapped a write is repeated under the lock.
+    """
+
+    def __init__(self, poll_interval=2.0, codes=None, rerank=16):
+        self.codes = codes
+        self.rerank = rerank
+        self.lock = threading.RLock()
+        self.poll_lock = threading.Lock()
+        self.poll_interval = poll_interval
+        self.loaded = False
+        self.version = 0
+        self.last_poll = 0.0
+        self.pending_gaps = {}
+        self.generation = 0
+        self._clear()
+
+    def _clear(self):
+        self.generation += 1
+        self._buffer = np.empty((0, ENCODING_SIZE), dtype=np.float64)
+        self.quantized = QuantizedEncodings(self.codes) if self.codes else None
+        self.size = 0
+        self.student_ids = []
+        self.names = []
+        self.roll_nos = []
+        self.rows = {}
+        self.memberships = {}
+        self.class_members = {}
+        self._subsets = {}
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def encodings(self):
+        """Active rows of the encoding matrix (the float32 copy when quantized)"""
+        if self.quantized is not None:
+            return self.quantized.full[:self.size]
+        return self._buffer[:self.size]
+
+    def load(self):
+        """Replace the gallery with every valid encoding in the database"""
+        try:
+            version = GalleryChange.objects.aggregate(
+                latest=Max('id'))['latest'] or 0
+            students = Student.objects.filter(face_encoding__isnull=False).values_list(
+                'id', 'name', 'roll_no', 'face_encoding')
+            memberships = self.read_memberships()
+
+            with self.lock:
+                self._clear()
+                for student_id, name, roll_no, encoding in students.iterator(chunk_size=2000):
+                    self.upsert(student_id, name, roll_no, encoding)
+                for student_id, class_ids in memberships.items():
+                    self.set_classes(student_id, class_ids)
+                self.version = version
+                self.pending_gaps.clear()
+                self.last_poll = time.monotonic()
+                self.loaded = True
+
+            logger.info(f"Loaded {self.size} face encodings (gallery v{version})")
+            return True
+
+        except Exception as e:
+            logger.error(f"Error loading face encodings: {e}")
+            return False
+
+    def replace(self, student_ids, names, roll_nos, encodings):
+        """Replace the gallery with the given rows without touching the database"""
+        encodings = np.asarray(encodings, dtype=np.float64).reshape(-1, ENCODING_SIZE)
+        with self.lock:
+            self._clear()
+            self.generation += 1
+            if self.quantized is not None:
+                self.quantized.assign(encodings)
+            else:
+                self._buffer = encodings.copy()
+            self.size = len(encodings)
+            self.student_ids = list(student_ids)
+            self.names = list(names)
+            self.roll_nos = list(roll_nos)
+            self.rows = {student_id: row for row, student_id in enumerate(self.student_ids)}
+            self.loaded = True
+
+    def refresh(self, force=False):
+        """Apply new deltas if the poll interval has elapsed; returns the number of students changed"""
+        now = time.monotonic()
+        if not force and now - self.last_poll < self.poll_interval:
+            return 0
+
+        # Several cameras share the gallery; only one of them polls at a time
+        if not self.poll_lock.acquire(blocking=force):
+            return 0
+        try:
+            self.last_poll = now
+            return self.apply_changes(now)
+        except Exception as e:
+            logger.error(f"Error applying gallery changes: {e}")
+            return 0
+        finally:
+            self.poll_lock.release()
+
+    def apply_changes(self, now=None):
+        """Re-read the students named in unseen GalleryChange rows"""
+        now = time.monotonic() if now is None else now
+        query = Q(id__gt=self.version)
+        if self.pending_gaps:
+            query |= Q(id__in=list(self.pending_gaps))
+
+        changes = list(GalleryChange.objects.filter(
+            query).values_list('id', 'student_id'))
+
+        # Ids are allocated before commit, so a lower id can become visible
+        # after a higher one; keep polling skipped ids for a while.
+        for change_id, started in list(self.pending_gaps.items()):
+            if now - started > GAP_TIMEOUT:
+                del self.pending_gaps[change_id]
+
+        if not changes:
+            return 0
+
+        student_ids = {student_id for _, student_id in changes}
+        current = {
+            row[0]: row for row in Student.objects.filter(id__in=student_ids).values_list(
+                'id', 'name', 'roll_no', 'face_encoding')
+        }
+        memberships = self.read_memberships(student_ids)
+
+        with self.lock:
+            for student_id in student_ids:
+                if student_id in current:
+                    self.upsert(*current[student_id])
+                    self.set_classes(student_id, memberships.get(student_id, ()))
+                else:
+                    self.remove(student_id)
+                    self.set_classes(student_id, ())
+
+            seen = {change_id for change_id, _ in changes}
+            for change_id in seen:
+                self.pending_gaps.pop(change_id, None)
+            latest = max(seen)
+            if latest > self.version:
+                if latest - self.version < 10000:
+                    for change_id in range(self.version + 1, latest):
+                        if change_id not in seen:
+                            self.pending_gaps[change_id] = now
+                self.version = latest
+
+        logger.info(
+            f"Applied {len(student_ids)} gallery changes (gallery v{self.version})")
+        return len(student_ids)
+
+    def upsert(self, student_id, name, roll_no, encoding):
+        """Insert or replace one student's encoding; invalid encodings remove the student"""
+        if encoding is None or len(encoding) != ENCODING_SIZE:
+            self.remove(student_id)
+            return
+
+        with self.lock:
+            self.generation += 1
+            self._invalidate(self.memberships.get(student_id, ()))
+            row = self.rows.get(student_id)
+            if row is None:
+                row = self.size
+                if self.quantized is not None:
+                    if row == self.quantized.capacity:
+                        self.quantized.grow(max(64, row * 2))
+                elif row == len(self._buffer):
+                    grown = np.empty(
+                        (max(64, row * 2), ENCODING_SIZE), dtype=np.float64)
+                    grown[:row] = self._buffer[:row]
+                    self._buffer = grown
+                self.size += 1
+                self.rows[student_id] = row
+                self.student_ids.append(student_id)
+                self.names.append(name)
+                self.roll_nos.append(roll_no)
+            else:
+                self.names[row] = name
+                self.roll_nos[row] = roll_no
+            if self.quantized is not None:
+                self.quantized.set(row, encoding)
+            else:
+                self._buffer[row] = encoding
+
+    def remove(self, student_id):
+        """Drop a student by moving the last row into its slot"""
+        with self.lock:
+            row = self.rows.pop(student_id, None)
+            if row is None:
+                return
+            self.generation += 1
+            self._invalidate(self.memberships.get(student_id, ()))
+            last = self.size - 1
+            if row != last:
+                if self.quantized is not None:
+                    self.quantized.move(last, row)
+                else:
+                    self._buffer[row] = self._buffer[last]
+                self.student_ids[row] = self.student_ids[last]
+                self.names[row] = self.names[last]
+                self.roll_nos[row] = self.roll_nos[last]
+                self.rows[self.student_ids[row]] = row
+            self.student_ids.pop()
+            self.names.pop()
+            self.roll_nos.pop()
+            self.size = last
+
+    def read_memberships(self, student_ids=None):
+        """student id -> set of class ids, for all students or the given ones"""
+        links = Student.classes.through.objects.all()
+        if student_ids is not None:
+            links = links.filter(student_id__in=student_ids)
+        memberships = {}
+        for student_id, class_id in links.values_list('student_id', 'studentclass_id').iterator(chunk_size=2000):
+            memberships.setdefault(student_id, set()).add(class_id)
+        return memberships
+
+    def set_classes(self, student_id, class_ids):
+        """Record a student's classes, dropping the sub-galleries the change affects"""
+        class_ids = frozenset(class_ids)
+        with self.lock:
+            previous = self.memberships.get(student_id, frozenset())
+            if class_ids == previous:
+                return
+            for class_id in previous - class_ids:
+                self.class_members[class_id].discard(student_id)
+            for class_id in class_ids - previous:
+                self.class_members.setdefault(class_id, set()).add(student_id)
+            if class_ids:
+                self.memberships[student_id] = class_ids
+            else:
+                self.memberships.pop(student_id, None)
+            self._invalidate(previous | class_ids)
+
+    def _invalidate(self, class_ids):
+        if self._subsets and class_ids:
+            for key in [key for key in self._subsets if not key.isdisjoint(class_ids)]:
+                del self._subsets[key]
+
+    def subset(self, class_ids):
+        """Gallery of the students in any of the given classes, cached until one of them changes"""
+        key = frozenset(class_ids)
+        with self.lock:
+            subset = self._subsets.get(key)
+            if subset is None:
+                members = set().union(*(self.class_members.get(class_id, ()) for class_id in key))
+                rows = sorted(self.rows[student_id] for student_id in members if student_id in self.rows)
+                subset = FaceGallery(poll_interval=self.poll_interval)
+                subset.replace(
+                    [self.student_ids[row] for row in rows],
+                    [self.names[row] for row in rows],
+                    [self.roll_nos[row] for row in rows],
+                    self.encodings[rows],
+                )
+                subset.version = self.version
+                self._subsets[key] = subset
+            return subset
+
+    def _consistent(self, search, finish):
+        """
+        finish(search()) with search run outside the lock.
+
+        search may read rows a concurrent write is moving, so its result is
+        only used if generation did not change meanwhile; otherwise it is
+        repeated under the lock. finish always runs under the lock, where
+        rows can be mapped to students.
+        """
+        with self.lock:
+            generation = self.generation
+        try:
+            result = search()
+        except Exception:
+            # A write replaced the arrays mid-search; an error only if nothing changed
+            with self.lock:
+                if self.generation == generation:
+                    raise
+            generation = None
+        with self.lock:
+            if self.generation != generation:
+                result = search()
+            return finish(result)
+
+    def nearest_other(self, student_id):
+        """(encoding, name, roll_no, distance to the closest other student) of a student, or None"""
+        def search():
+            row = self.rows.get(student_id)
+            if row is None:
+                return None
+            encodings = self.encodings
+            encoding = np.array(encodings[row], dtype=np.float64)
+            nearest = float('inf')
+            # In blocks, so a memory-mapped quantized gallery is not read in one piece
+            for start in range(0, len(encodings), GALLERY_BLOCK):
+                distances = np.linalg.norm(encodings[start:start + GALLERY_BLOCK] - encoding, axis=1)
+                if start <= row < start + GALLERY_BLOCK:
+                    distances[row - start] = np.inf
+                if len(distances):
+                    nearest = min(nearest, float(distances.min()))
+            return row, encoding, nearest
+
+        def finish(result):
+            if result is None:
+                return None
+            row, encoding, nearest = result
+            return encoding, self.names[row], self.roll_nos[row], nearest
+
+        return self._consistent(search, finish)
+
+    def match(self, encoding, tolerance):
+        """Return (student_id, name, roll_no, distance) of the closest encoding within tolerance, or None"""
+        if self.quantized is not None:
+            return self.match_many([encoding], tolerance)[0]
+
+        def search():
+            known = self.encodings
+            if not len(known):
+                return None
+            distances = np.linalg.norm(known - encoding, axis=1)
+            best = int(np.argmin(distances))
+            return best, float(distances[best])
+
+        def finish(result):
+            if result is None or result[1] > tolerance:
+                return None
+            best, distance = result
+            return self.student_ids[best], self.names[best], self.roll_nos[best], distance
+
+        return self._consistent(search, finish)
+
+    def match_many(self, encodings, tolerance):
+        """match() for a batch of encodings, MATCH_BLOCK at a time; returns a list of matches or None"""
+        encodings = np.asarray(encodings, dtype=np.float64).reshape(-1, ENCODING_SIZE)
+
+        def search():
+            rows, distances = [], []
+            if self.size:
+                for start in range(0, len(encodings), MATCH_BLOCK):
+                    block_rows, block_distances = self._search(encodings[start:start + MATCH_BLOCK])
+                    rows.extend(block_rows)
+                    distances.extend(block_distances)
+            return rows, distances
+
+        def finish(result):
+            rows, distances = result
+            if not rows:
+                return [None] * len(encodings)
+            return self._matches(rows, distances, tolerance)
+
+        return self._consistent(search, finish)
+
+    def _search(self, queries):
+        """(best row, distance) lists for a block of queries"""
+        quantized, size = self.quantized, self.size
+        if quantized is not None:
+            best, distances = quantized.search(queries, size, self.rerank)
+            return best.tolist(), distances.tolist()
+        known = self._buffer[:size]
+        query_norms = np.einsum('ij,ij->i', queries, queries)
+        best_rows = np.zeros(len(queries), dtype=np.int64)
+        best_squared = np.full(len(queries), np.inf)
+        picked = np.arange(len(queries))
+        for start in range(0, size, GALLERY_BLOCK):
+            block = known[start:start + GALLERY_BLOCK]
+            # ||a - b||^2 = ||a||^2 + ||b||^2 - 2ab, clipped against rounding below zero
+            squared = (query_norms[:, None]
+                       + np.einsum('ij,ij->i', block, block)[None, :]
+                       - 2.0 * queries @ block.T)
+            rows = np.argmin(squared, axis=1)
+            values = squared[picked, rows]
+            better = values < best_squared
+            best_rows[better] = rows[better] + start
+            best_squared[better] = values[better]
+        return best_rows.tolist(), np.sqrt(np.maximum(best_squared, 0.0)).tolist()
+
+    def _matches(self, rows, distances, tolerance):
+        return [
+            (self.student_ids[row], self.names[row], self.roll_nos[row], float(distance))
+            if distance <= tolerance else None
+            for row, distance in zip(rows, distances)
+        ]
+
+    def memory(self):
+        """(resident, memory-mapped) bytes held for the encodings"""
+        if self.quantized is not None:
+            return self.quantized.nbytes(self.size)
+        return self.size * ENCODING_SIZE * self._buffer.itemsize, 0
+
+
+# Shared by every recognizer in this process
+gallery = FaceGallery(codes=GALLERY_QUANTIZATION['codes'], rerank=GALLERY_QUANTIZATION['rerank'])
@@ -0,0 +1,197 @@
+# attendance/management/commands/audit_gallery.py
+import json
+import time
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from attendance.models import Student
+
+
+class Command(BaseCommand):
+    help = 'Find near-duplicate face encodings and report nearest-neighbour margins'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--threshold',
+            type=float,
+            default=0.35,
+            help='Report pairs closer than this distance (default: 0.35)',
+        )
+        parser.add_argument(
+            '--tolerance',
+            type=float,
+            default=0.5,
+            help='Recognition tolerance used to compute margins (default: 0.5)',
+        )
+        parser.add_argument(
+            '--block-size',
+            type=int,
+            default=2048,
+            help='Rows per distance block; memory is block-size^2 floats (default: 2048)',
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=50,
+            help='Number of pairs and margins to print (default: 50)',
+        )
+        parser.add_argument(
+            '--output',
+            type=str,
+            default='',
+            help='Write the full report as JSON to this file',
+        )
+
+    def handle(self, *args, **options):
+        threshold = options['threshold']
+        tolerance = options['tolerance']
+        block_size = options['block_size']
+        limit = options['limit']
+
+        if block_size < 1:
+            raise CommandError('--block-size must be positive.')
+
+        ids, roll_nos, names, encodings = self.load_gallery()
+        total = len(ids)
+
+        if total < 2:
+            self.stdout.write(
+                self.style.WARNING('Need at least two face encodings to audit'))
+            return
+
+        self.stdout.write(
+            f'Auditing {total} encodings in blocks of {block_size}...')
+
+        started = time.perf_counter()
+        pairs, nn_dist, nn_index = self.blocked_all_pairs(
+            encodings, threshold, block_size)
+        elapsed = time.perf_counter() - started
+
+        pairs.sort(key=lambda pair: pair[2])
+        margins = nn_dist - tolerance
+        order = np.argsort(margins)
+
+        self.stdout.write('\n' + '='*50)
+        self.stdout.write(self.style.SUCCESS(
+            f'Audit complete in {elapsed:.1f}s'))
+        self.stdout.write(f'Pairs below {threshold}: {len(pairs)}')
+        self.stdout.write(
+            f'Students within tolerance of another: {int((margins < 0).sum())}')
+
+        if pairs:
+            self.stdout.write('\nClosest pairs:')
+            for a, b, distance in pairs[:limit]:
+                self.stdout.write(
+                    self.style.WARNING(
+                        f'  {roll_nos[a]} ({names[a]}) <-> '
+                        f'{roll_nos[b]} ({names[b]}): {distance:.3f}')
+                )
+
+        self.stdout.write('\nSmallest nearest-neighbour margins:')
+        for row in order[:limit]:
+            neighbour = nn_index[row]
+            self.stdout.write(
+                f'  {roll_nos[row]} ({names[row]}): nearest {roll_nos[neighbour]} '
+                f'at {nn_dist[row]:.3f}, margin {margins[row]:+.3f}'
+            )
+
+        if options['output']:
+            report = {
+                'total': total,
+                'threshold': threshold,
+                'tolerance': tolerance,
+                'elapsed_seconds': round(elapsed, 3),
+                'pairs': [
+                    {
+                        'a': {'id': ids[a], 'roll_no': roll_nos[a]},
+                        'b': {'id': ids[b], 'roll_no': roll_nos[b]},
+                        'distance': round(float(distance), 4),
+                    }
+                    for a, b, distance in pairs
+                ],
+                'margins': [
+                    {
+                        'id': ids[row],
+                        'roll_no': roll_nos[row],
+                        'nearest_id': ids[nn_index[row]],
+                        'distance': round(float(nn_dist[row]), 4),
+                        'margin': round(float(margins[row]), 4),
+                    }
+                    for row in order
+                ],
+            }
+            with open(options['output'], 'w') as handle:
+                json.dump(report, handle, indent=2)
+            self.stdout.write(f'\nReport written to {options["output"]}')
+
+    def load_gallery(self):
+        """Load all valid encodings into a float32 matrix"""
+        ids, roll_nos, names, rows = [], [], [], []
+        students = Student.objects.filter(face_encoding__isnull=False).values_list(
+            'id', 'roll_no', 'name', 'face_encoding')
+
+        for student_id, roll_no, name, encoding in students.iterator(chunk_size=2000):
+            if encoding and len(encoding) == 128:
+                ids.append(student_id)
+                roll_nos.append(roll_no)
+                names.append(name)
+                rows.append(encoding)
+
+        encodings = np.asarray(rows, dtype=np.float32).reshape(-1, 128)
+        return ids, roll_nos, names, encodings
+
+    def blocked_all_pairs(self, encodings, threshold, block_size):
+        """
+        Compute all pairwise distances block by block.
+
+        Only one block_size x block_size distance block is alive at a time,
+        using ||a-b||^2 = ||a||^2 + ||b||^2 - 2ab so each block is one matrix
+        product. Returns pairs below threshold plus each row's nearest
+        neighbour distance and index.
+        """
+        total = len(encodings)
+        norms = np.einsum('ij,ij->i', encodings, encodings)
+        nn_dist = np.full(total, np.inf, dtype=np.float32)
+        nn_index = np.zeros(total, dtype=np.int64)
+        pairs = []
+        blocks = range(0, total, block_size)
+        done = 0
+        block_count = len(blocks) * (len(blocks) + 1) // 2
+
+        for i in blocks:
+            a = encodings[i:i + block_size]
+            a_norms = norms[i:i + block_size]
+
+            for j in range(i, total, block_size):
+                b = encodings[j:j + block_size]
+                distances = a @ b.T
+                distances *= -2
+                distances += a_norms[:, None]
+                distances += norms[j:j + block_size][None, :]
+                np.maximum(distances, 0, out=distances)
+                np.sqrt(distances, out=distances)
+
+                if i == j:
+                    # Each pair once, never a row against itself
+                    distances[np.tril_indices(len(a))] = np.inf
+
+                self.update_nearest(nn_dist, nn_index, distances, i, j, axis=1)
+                self.update_nearest(nn_dist, nn_index, distances, j, i, axis=0)
+
+                rows, cols = np.nonzero(distances < threshold)
+                pairs.extend(zip((rows + i).tolist(), (cols + j).tolist(),
+                                 distances[rows, cols].tolist()))
+
+                done += 1
+                if done % 100 == 0:
+                    self.stdout.write(f'  {done}/{block_count} blocks')
+
+        return pairs, nn_dist, nn_index
+
+    def update_nearest(self, nn_dist, nn_index, distances, offset, partner_offset, axis):
+        """Fold a block's row (axis=1) or column (axis=0) minima into the running nearest neighbours"""
+        best = distances.argmin(axis=axis)
+        best_dist = distances.min(axis=axis)
+        target = slice(offset, offset + len(best))
+        improved = best_dist < nn_dist[target]
+        nn_dist[target] = np.where(improved, best_dist, nn_dist[target])
+        nn_index[target] = np.where(improved, best + partner_offset, nn_index[target])
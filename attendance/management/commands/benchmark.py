@@ -0,0 +1,409 @@
+# attendance/management/commands/benchmark.py
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+import cv2
+import django
+import numpy as np
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError, OutputWrapper
+from django.db import connection, transaction
+from django.utils import timezone
+from attendance.camera import FaceRecognitionCamera
+from attendance.gallery import FaceGallery, ENCODING_SIZE
+from attendance.models import Student, Attendance, GalleryChange
+from .load_encodings import Command as LoadEncodingsCommand, SUPPORTED_FORMATS
+
+SUITES = ('gallery_load', 'matching', 'frame', 'enrollment', 'db_writes')
+
+
+def parse_sizes(value):
+    try:
+        return [int(size) for size in value.split(',') if size.strip()]
+    except ValueError:
+        raise CommandError(f'Invalid size list: {value}')
+
+
+def synthetic_encodings(rng, count):
+    """Random vectors about 0.8 apart, like encodings of different people"""
+    return rng.normal(0.0, 0.05, size=(count, ENCODING_SIZE))
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the recognition pipeline without a camera or Postgres; run with --settings=facepulse.settings_bench'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--suite',
+            action='append',
+            choices=SUITES,
+            default=[],
+            help='Suite to run; repeat for several (default: all)',
+        )
+        parser.add_argument(
+            '--gallery-sizes',
+            type=str,
+            default='1000,10000',
+            help='Students in the database for gallery load timing (default: 1000,10000)',
+        )
+        parser.add_argument(
+            '--match-sizes',
+            type=str,
+            default='1000,10000,100000,1000000',
+            help='Synthetic gallery sizes for matching latency; 1M needs about 3GB (default: 1k-1M)',
+        )
+        parser.add_argument(
+            '--queries',
+            type=int,
+            default=200,
+            help='Match queries per gallery size (default: 200)',
+        )
+        parser.add_argument(
+            '--frames',
+            type=int,
+            default=30,
+            help='Frames per process_frame case (default: 30)',
+        )
+        parser.add_argument(
+            '--video',
+            type=str,
+            default='',
+            help='Recorded video whose frames are also timed through process_frame',
+        )
+        parser.add_argument(
+            '--images',
+            type=str,
+            default=os.path.join(settings.MEDIA_ROOT, 'students'),
+            help='Enrollment images to encode (default: media/students)',
+        )
+        parser.add_argument(
+            '--rows',
+            type=int,
+            default=2000,
+            help='Students written for enrollment and attendance write throughput (default: 2000)',
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='Random seed for synthetic data (default: 0)',
+        )
+        parser.add_argument(
+            '--output',
+            type=str,
+            default='',
+            help='Where to save results as JSON (default: .bench/benchmark.json)',
+        )
+        parser.add_argument(
+            '--compare',
+            type=str,
+            default='',
+            help='Baseline JSON to compare against; exits non-zero on regressions',
+        )
+        parser.add_argument(
+            '--threshold',
+            type=float,
+            default=0.10,
+            help='Relative slowdown reported as a regression (default: 0.10)',
+        )
+        parser.add_argument(
+            '--allow-database',
+            action='store_true',
+            help='Run against a non-SQLite database; the benchmark deletes and writes students',
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite' and not options['allow_database']:
+            raise CommandError(
+                'The benchmark deletes students and attendance; run it with '
+                '--settings=facepulse.settings_bench or pass --allow-database.')
+
+        self.rng = np.random.default_rng(options['seed'])
+        self.results = {}
+        if connection.vendor == 'sqlite':
+            call_command('migrate', verbosity=0, interactive=False)
+
+        suites = options['suite'] or SUITES
+        for suite in suites:
+            self.stdout.write(self.style.MIGRATE_HEADING(f'{suite}'))
+            getattr(self, f'bench_{suite}')(options)
+
+        report = {'metadata': self.metadata(), 'results': self.results}
+        output = options['output']
+        if not output:
+            bench_dir = getattr(settings, 'BENCH_DIR', settings.BASE_DIR / '.bench')
+            os.makedirs(bench_dir, exist_ok=True)
+            output = os.path.join(bench_dir, 'benchmark.json')
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
+        self.stdout.write(f'Results written to {output}')
+
+        if options['compare']:
+            self.compare(options['compare'], options['threshold'])
+
+    def record(self, name, value, unit, better='lower'):
+        self.results[name] = {'value': round(value, 4), 'unit': unit, 'better': better}
+        self.stdout.write(f'  {name:<40} {value:>12.3f} {unit}')
+
+    def metadata(self):
+        """Machine and software details needed to compare runs fairly"""
+        try:
+            commit = subprocess.run(
+                ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                cwd=settings.BASE_DIR, timeout=5).stdout.strip()
+        except (OSError, subprocess.SubprocessError):
+            commit = ''
+        try:
+            import dlib
+            dlib_version = dlib.__version__
+        except ImportError:
+            dlib_version = None
+        return {
+            'timestamp': timezone.now().isoformat(),
+            'commit': commit,
+            'hostname': platform.node(),
+            'platform': platform.platform(),
+            'machine': platform.machine(),
+            'processor': platform.processor(),
+            'cpu_count': os.cpu_count(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'opencv': cv2.__version__,
+            'dlib': dlib_version,
+            'django': django.get_version(),
+            'database': connection.vendor,
+        }
+
+    def reset_tables(self):
+        """Empty the benchmark tables without firing per-row delete signals"""
+        with connection.cursor() as cursor:
+            for model in (Attendance, GalleryChange, Student):
+                cursor.execute(f'DELETE FROM {model._meta.db_table}')
+            cursor.execute(
+                f'DELETE FROM {User._meta.db_table} WHERE username LIKE %s', ['bench-%'])
+
+    def create_students(self, count):
+        """Bulk insert students with synthetic encodings; returns them"""
+        self.reset_tables()
+        encodings = synthetic_encodings(self.rng, count)
+        User.objects.bulk_create(
+            [User(username=f'bench-{i}') for i in range(count)], batch_size=1000)
+        users = User.objects.filter(username__startswith='bench-').order_by('id')
+        return Student.objects.bulk_create(
+            [
+                Student(user=user, name=f'Student {i}', roll_no=f'B{i:07d}',
+                        face_encoding=encoding.tolist())
+                for i, (user, encoding) in enumerate(zip(users, encodings))
+            ],
+            batch_size=1000,
+        )
+
+    def synthetic_gallery(self, size):
+        face_gallery = FaceGallery()
+        face_gallery.replace(
+            range(1, size + 1),
+            [f'Student {i}' for i in range(size)],
+            [f'B{i:07d}' for i in range(size)],
+            synthetic_encodings(self.rng, size),
+        )
+        return face_gallery
+
+    def bench_gallery_load(self, options):
+        """Full gallery load time against the number of enrolled students"""
+        for size in parse_sizes(options['gallery_sizes']):
+            self.create_students(size)
+            samples = []
+            for _ in range(3):
+                face_gallery = FaceGallery()
+                started = time.perf_counter()
+                face_gallery.load()
+                samples.append(time.perf_counter() - started)
+            self.record(f'gallery_load.{size}', min(samples) * 1000, 'ms')
+        self.reset_tables()
+
+    def bench_matching(self, options):
+        """Single-query latency and batched throughput against synthetic galleries"""
+        queries = options['queries']
+        for size in parse_sizes(options['match_sizes']):
+            face_gallery = self.synthetic_gallery(size)
+            # Half the probes are noisy copies of enrolled faces, half are strangers
+            rows = self.rng.integers(0, size, queries)
+            probes = face_gallery.encodings[rows] + self.rng.normal(0.0, 0.01, (queries, ENCODING_SIZE))
+            probes[queries // 2:] = synthetic_encodings(self.rng, queries - queries // 2)
+
+            samples = []
+            for probe in probes:
+                started = time.perf_counter()
+                face_gallery.match(probe, 0.5)
+                samples.append(time.perf_counter() - started)
+            self.record(f'matching.{size}.median', statistics.median(samples) * 1000, 'ms')
+            self.record(f'matching.{size}.p95', percentile(samples, 0.95) * 1000, 'ms')
+
+            started = time.perf_counter()
+            face_gallery.match_many(probes, 0.5)
+            elapsed = time.perf_counter() - started
+            self.record(f'matching.{size}.batch', queries / elapsed, 'queries/s', 'higher')
+            del face_gallery, probes
+
+    def bench_frame(self, options):
+        """process_frame latency on synthetic frames and, if given, recorded ones"""
+        cases = {
+            'empty': [self.rng.integers(0, 255, (480, 640, 3), dtype=np.uint8)
+                      for _ in range(options['frames'])],
+        }
+
+        face = self.sample_face(options['images'])
+        if face is not None:
+            frame = np.full((480, 640, 3), 127, dtype=np.uint8)
+            height, width = face.shape[:2]
+            scale = min(1.0, 360 / height, 300 / width)
+            face = cv2.resize(face, (int(width * scale), int(height * scale)))
+            frame[60:60 + face.shape[0], 170:170 + face.shape[1]] = face
+            cases['one_face'] = [frame.copy() for _ in range(options['frames'])]
+
+        if options['video']:
+            cases['recorded'] = self.video_frames(options['video'], options['frames'])
+
+        # Nobody in this gallery matches, so no attendance is written while timing
+        camera = FaceRecognitionCamera(
+            'benchmark', source=None, face_gallery=self.synthetic_gallery(1000))
+        for case, frames in cases.items():
+            samples = []
+            for frame in frames:
+                started = time.perf_counter()
+                camera.process_frame(frame)
+                samples.append(time.perf_counter() - started)
+            self.record(f'frame.{case}.median', statistics.median(samples) * 1000, 'ms')
+            self.record(f'frame.{case}.p95', percentile(samples, 0.95) * 1000, 'ms')
+
+    def sample_face(self, directory):
+        for path in self.image_paths(directory):
+            image = cv2.imread(path)
+            if image is not None:
+                return image
+        return None
+
+    def image_paths(self, directory):
+        if not os.path.isdir(directory):
+            return []
+        return [
+            os.path.join(directory, filename)
+            for filename in sorted(os.listdir(directory))
+            if filename.lower().endswith(SUPPORTED_FORMATS)
+        ]
+
+    def video_frames(self, path, count):
+        capture = cv2.VideoCapture(path)
+        if not capture.isOpened():
+            raise CommandError(f'Could not open video: {path}')
+        frames = []
+        try:
+            while len(frames) < count:
+                success, frame = capture.read()
+                if not success:
+                    break
+                frames.append(frame)
+        finally:
+            capture.release()
+        return frames
+
+    def bench_enrollment(self, options):
+        """Image encoding throughput and student write throughput"""
+        paths = self.image_paths(options['images'])
+        if paths:
+            loader = LoadEncodingsCommand(stdout=OutputWrapper(io.StringIO()))
+            started = time.perf_counter()
+            for path in paths:
+                loader.extract_face_encoding(path)
+            elapsed = time.perf_counter() - started
+            self.record('enrollment.encode', len(paths) / elapsed, 'images/s', 'higher')
+        else:
+            self.stdout.write(f"  no images in {options['images']}, skipping encoding")
+
+        # Individual saves in batches of 20, as watch_students writes them;
+        # each save also publishes a GalleryChange row
+        self.reset_tables()
+        count = options['rows']
+        encodings = synthetic_encodings(self.rng, count)
+        started = time.perf_counter()
+        for first in range(0, count, 20):
+            with transaction.atomic():
+                for i in range(first, min(first + 20, count)):
+                    user = User.objects.create(username=f'bench-{i}')
+                    Student.objects.create(
+                        user=user, name=f'Student {i}', roll_no=f'B{i:07d}',
+                        face_encoding=encodings[i].tolist())
+        elapsed = time.perf_counter() - started
+        self.record('enrollment.write', count / elapsed, 'students/s', 'higher')
+        self.reset_tables()
+
+    def bench_db_writes(self, options):
+        """Attendance write throughput, one row at a time and in bulk"""
+        students = self.create_students(options['rows'])
+
+        started = time.perf_counter()
+        for student in students:
+            Attendance.mark_attendance(student=student, confidence=0.9, notes='benchmark')
+        elapsed = time.perf_counter() - started
+        self.record('db_writes.mark_attendance', len(students) / elapsed, 'rows/s', 'higher')
+
+        now = timezone.now()
+        started = time.perf_counter()
+        Attendance.objects.bulk_create(
+            [
+                Attendance(student=student, date=now.date(), status='present',
+                           marked_at=now, confidence=0.8, notes='benchmark')
+                for student in students
+            ],
+            update_conflicts=True,
+            unique_fields=['student', 'date'],
+            update_fields=['status', 'marked_at', 'confidence', 'notes'],
+        )
+        elapsed = time.perf_counter() - started
+        self.record('db_writes.bulk_upsert', len(students) / elapsed, 'rows/s', 'higher')
+        self.reset_tables()
+
+    def compare(self, path, threshold):
+        """Flag results that got worse than the baseline by more than threshold"""
+        try:
+            with open(path) as f:
+                baseline = json.load(f)
+        except (OSError, ValueError) as e:
+            raise CommandError(f'Could not read baseline {path}: {e}')
+
+        self.stdout.write("=" * 50)
+        base_meta = baseline.get('metadata', {})
+        self.stdout.write(
+            f"Baseline: {base_meta.get('commit', '')[:10]} on {base_meta.get('hostname', '?')} "
+            f"({base_meta.get('timestamp', '?')})")
+
+        regressions = []
+        for name, result in self.results.items():
+            base = baseline.get('results', {}).get(name)
+            if not base or not base['value']:
+                continue
+            change = (result['value'] - base['value']) / base['value']
+            worse = change if result['better'] == 'lower' else -change
+            flag = ''
+            if worse > threshold:
+                regressions.append(name)
+                flag = '  REGRESSION'
+            self.stdout.write(
+                f"  {name:<40} {base['value']:>10.3f} -> {result['value']:>10.3f} "
+                f"{result['unit']:<10} {change:+.1%}{flag}")
+
+        if regressions:
+            raise CommandError(
+                f'{len(regressions)} regressions above {threshold:.0%}: {", ".join(regressions)}')
+        self.stdout.write(self.style.SUCCESS('No regressions'))
@@ -0,0 +1,181 @@
+# attendance/management/commands/benchmark_encoding.py
+import json
+import os
+import statistics
+import time
+import cv2
+import face_recognition
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from attendance.encoding import ENCODING_SETTINGS
+from attendance.detection import LANDMARK_MODELS, face_shapes, encode_shapes
+from attendance.gallery import FaceGallery
+from .load_encodings import SUPPORTED_FORMATS, parse_student_filename
+
+
+def labelled_images(directory):
+    """
+    (label, path) pairs from a labelled folder, sorted by label then path.
+
+    Images in a subdirectory are labelled with its name; images directly
+    in the folder are labelled by roll number (STU001_John_Doe.jpg), so
+    media/students/ works as is when students have several photos.
+    """
+    images = []
+    for entry in sorted(os.listdir(directory)):
+        path = os.path.join(directory, entry)
+        if os.path.isdir(path):
+            images.extend(
+                (entry, os.path.join(path, name)) for name in sorted(os.listdir(path))
+                if name.lower().endswith(SUPPORTED_FORMATS))
+        elif entry.lower().endswith(SUPPORTED_FORMATS):
+            parsed = parse_student_filename(entry)
+            images.append((parsed[0] if parsed else os.path.splitext(entry)[0], path))
+    return images
+
+
+class Command(BaseCommand):
+    help = ('Measure per-face encode time and match accuracy for each landmark model '
+            'and num_jitters on a labelled folder of face images')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'directory',
+            type=str,
+            help='One subdirectory of images per person, or STU001_Name.jpg files with several photos per roll number',
+        )
+        parser.add_argument(
+            '--models',
+            type=str,
+            default='small,large',
+            help='Comma-separated landmark models to try (default: small,large)',
+        )
+        parser.add_argument(
+            '--jitters',
+            type=str,
+            default='1,2,5',
+            help='Comma-separated num_jitters values to try (default: 1,2,5)',
+        )
+        parser.add_argument(
+            '--scale',
+            type=float,
+            default=0.25,
+            help='Downscale probe images by this factor, as the live loop does (default: 0.25)',
+        )
+        parser.add_argument(
+            '--tolerance',
+            type=float,
+            default=0.5,
+            help='Match tolerance (default: 0.5)',
+        )
+        parser.add_argument(
+            '--json',
+            action='store_true',
+            help='Print the report as JSON',
+        )
+
+    def handle(self, *args, **options):
+        directory = options['directory']
+        if not os.path.isdir(directory):
+            raise CommandError(f'Not a directory: {directory}')
+        models = [model for model in options['models'].split(',') if model]
+        for model in models:
+            if model not in LANDMARK_MODELS:
+                raise CommandError(f'Unknown landmark model: {model}')
+        try:
+            jitters = [int(value) for value in options['jitters'].split(',') if value]
+        except ValueError:
+            raise CommandError('--jitters must be comma-separated integers')
+
+        # The first image of each person is enrolled with the enrollment settings;
+        # the others are probes encoded the way the live loop would
+        references, probes = {}, []
+        for label, path in labelled_images(directory):
+            image = face_recognition.load_image_file(path)
+            if label not in references:
+                locations = face_recognition.face_locations(image)
+                if locations:
+                    references[label] = face_recognition.face_encodings(
+                        image, locations[:1], **ENCODING_SETTINGS['enrollment'])[0]
+                continue
+            small = cv2.resize(image, (0, 0), fx=options['scale'], fy=options['scale'])
+            locations = face_recognition.face_locations(small)
+            if locations:
+                probes.append((label, small, locations[:1]))
+        if not probes:
+            raise CommandError('No probes: at least one person needs two images with a detectable face')
+
+        labels = sorted(references)
+        face_gallery = FaceGallery()
+        face_gallery.replace(
+            range(len(labels)), labels, labels, np.array([references[label] for label in labels]))
+
+        tolerance = options['tolerance']
+        results = [
+            self.measure(face_gallery, probes, model, num_jitters, tolerance)
+            for model in models for num_jitters in jitters
+        ]
+        best = max(result['accuracy'] for result in results)
+        recommended = min(
+            (result for result in results if result['accuracy'] >= best - 0.01),
+            key=lambda result: result['median_ms'])
+
+        if options['json']:
+            self.stdout.write(json.dumps({
+                'directory': directory,
+                'people': len(labels),
+                'probes': len(probes),
+                'enrollment': ENCODING_SETTINGS['enrollment'],
+                'results': results,
+                'recommended': {'model': recommended['model'], 'num_jitters': recommended['num_jitters']},
+            }, indent=2))
+            return
+
+        enrollment = ENCODING_SETTINGS['enrollment']
+        self.stdout.write(
+            f"{len(labels)} people enrolled with {enrollment['model']}/{enrollment['num_jitters']} jitter, "
+            f"{len(probes)} probes at scale {options['scale']}, tolerance {tolerance}")
+        self.stdout.write(
+            f"{'model':<6} {'jitters':>7} {'median ms':>10} {'p95 ms':>8} "
+            f"{'accuracy':>9} {'wrong':>6} {'missed':>7} {'mean dist':>10}")
+        for result in results:
+            mean_distance = result['mean_distance']
+            self.stdout.write(
+                f"{result['model']:<6} {result['num_jitters']:>7} {result['median_ms']:>10.2f} "
+                f"{result['p95_ms']:>8.2f} {result['accuracy']:>9.2%} {result['wrong']:>6} "
+                f"{result['missed']:>7} {'-' if mean_distance is None else f'{mean_distance:.3f}':>10}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Fastest within 1 point of the best accuracy: model={recommended['model']} "
+            f"num_jitters={recommended['num_jitters']} (FACEPULSE_ENCODING['live'])"))
+
+    def measure(self, face_gallery, probes, model, num_jitters, tolerance):
+        """Encode every probe with one setting and match it against the references"""
+        samples = []
+        correct = wrong = missed = 0
+        distances = []
+        for label, image, locations in probes:
+            # Landmarks plus descriptor: what the live loop pays per face after detection
+            started = time.perf_counter()
+            encoding = encode_shapes(image, face_shapes(image, locations, model), num_jitters)[0]
+            samples.append(time.perf_counter() - started)
+
+            match = face_gallery.match(encoding, tolerance)
+            if match is None:
+                missed += 1
+            elif match[1] == label:
+                correct += 1
+                distances.append(match[3])
+            else:
+                wrong += 1
+
+        samples.sort()
+        return {
+            'model': model,
+            'num_jitters': num_jitters,
+            'median_ms': statistics.median(samples) * 1000,
+            'p95_ms': samples[min(len(samples) - 1, int(0.95 * len(samples)))] * 1000,
+            'accuracy': correct / len(probes),
+            'wrong': wrong,
+            'missed': missed,
+            'mean_distance': statistics.fmean(distances) if distances else None,
+        }
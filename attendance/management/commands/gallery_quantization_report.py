@@ -0,0 +1,155 @@
+# attendance/management/commands/gallery_quantization_report.py
+import json
+import statistics
+import time
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from attendance.gallery import FaceGallery, ENCODING_SIZE
+from attendance.models import Student
+from attendance.quantization import CODE_TYPES
+
+
+class Command(BaseCommand):
+    help = 'Compare float64, float16 and int8 galleries for match accuracy, memory and latency'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--synthetic',
+            type=int,
+            default=0,
+            help='Use this many random encodings instead of the enrolled students',
+        )
+        parser.add_argument(
+            '--queries',
+            type=int,
+            default=500,
+            help='Probe encodings; half are noisy copies of enrolled faces, half strangers (default: 500)',
+        )
+        parser.add_argument(
+            '--noise',
+            type=float,
+            default=0.02,
+            help='Per-dimension noise added to enrolled faces to make probes (default: 0.02)',
+        )
+        parser.add_argument(
+            '--rerank',
+            type=str,
+            default='4,16,64',
+            help='Comma-separated candidate counts re-ranked at full precision (default: 4,16,64)',
+        )
+        parser.add_argument(
+            '--tolerance',
+            type=float,
+            default=0.5,
+            help='Match tolerance used to compare decisions (default: 0.5)',
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='Random seed for synthetic encodings and probes (default: 0)',
+        )
+        parser.add_argument(
+            '--json',
+            action='store_true',
+            help='Print the report as JSON',
+        )
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        try:
+            reranks = [int(value) for value in options['rerank'].split(',') if value]
+        except ValueError:
+            raise CommandError('--rerank must be comma-separated integers')
+
+        if options['synthetic']:
+            encodings = rng.normal(0.0, 0.05, size=(options['synthetic'], ENCODING_SIZE))
+            source = f"{options['synthetic']} synthetic encodings"
+        else:
+            rows = [encoding for encoding in Student.objects.filter(
+                face_encoding__isnull=False).values_list('face_encoding', flat=True).iterator(chunk_size=2000)
+                if encoding is not None and len(encoding) == ENCODING_SIZE]
+            if not rows:
+                raise CommandError('No enrolled encodings; pass --synthetic N to use random ones')
+            encodings = np.asarray(rows, dtype=np.float64)
+            source = f'{len(encodings)} enrolled students'
+
+        size = len(encodings)
+        queries = options['queries']
+        picked = rng.integers(0, size, queries)
+        probes = encodings[picked] + rng.normal(0.0, options['noise'], (queries, ENCODING_SIZE))
+        probes[queries // 2:] = rng.normal(0.0, 0.05, (queries - queries // 2, ENCODING_SIZE))
+
+        tolerance = options['tolerance']
+        baseline_gallery = self.build(encodings)
+        baseline = self.measure(baseline_gallery, probes, tolerance)
+        results = [dict(codes='float64', rerank=None, **baseline['summary'])]
+        del baseline_gallery
+
+        for codes in CODE_TYPES:
+            for rerank in reranks:
+                face_gallery = self.build(encodings, codes, rerank)
+                measured = self.measure(face_gallery, probes, tolerance)
+                results.append(dict(
+                    codes=codes, rerank=rerank,
+                    **self.compare(baseline['matches'], measured['matches'], tolerance),
+                    **measured['summary']))
+                del face_gallery
+
+        if options['json']:
+            self.stdout.write(json.dumps({'source': source, 'queries': queries, 'results': results}, indent=2))
+            return
+
+        self.stdout.write(f'{source}, {queries} probes, tolerance {tolerance}')
+        self.stdout.write(
+            f"{'codes':<8} {'rerank':>6} {'resident MB':>12} {'mapped MB':>10} "
+            f"{'same best':>10} {'same decision':>14} {'max dist err':>13} {'median ms':>10} {'batch q/s':>10}")
+        for result in results:
+            self.stdout.write(
+                f"{result['codes']:<8} {result['rerank'] or '-':>6} {result['resident_mb']:>12.1f} "
+                f"{result['mapped_mb']:>10.1f} {result.get('same_best', 1.0):>10.2%} "
+                f"{result.get('same_decision', 1.0):>14.2%} {result.get('max_distance_error', 0.0):>13.4f} "
+                f"{result['median_ms']:>10.3f} {result['batch_qps']:>10.0f}")
+
+    def build(self, encodings, codes=None, rerank=16):
+        face_gallery = FaceGallery(codes=codes, rerank=rerank)
+        size = len(encodings)
+        face_gallery.replace(
+            range(1, size + 1), [''] * size, [''] * size, encodings)
+        return face_gallery
+
+    def measure(self, face_gallery, probes, tolerance):
+        """Best match (ignoring tolerance) per probe, with latency and memory"""
+        samples = []
+        for probe in probes[:200]:
+            started = time.perf_counter()
+            face_gallery.match(probe, tolerance)
+            samples.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        matches = face_gallery.match_many(probes, float('inf'))
+        elapsed = time.perf_counter() - started
+
+        resident, mapped = face_gallery.memory()
+        return {
+            'matches': [(match[0], match[3]) for match in matches],
+            'summary': {
+                'resident_mb': resident / 1e6,
+                'mapped_mb': mapped / 1e6,
+                'median_ms': statistics.median(samples) * 1000,
+                'batch_qps': len(probes) / elapsed if elapsed else 0.0,
+            },
+        }
+
+    def compare(self, expected, actual, tolerance):
+        """Agreement with the exact float64 search"""
+        same_best = sum(a[0] == b[0] for a, b in zip(expected, actual))
+        same_decision = sum(
+            (a[1] <= tolerance) == (b[1] <= tolerance) and (a[1] > tolerance or a[0] == b[0])
+            for a, b in zip(expected, actual))
+        errors = [abs(a[1] - b[1]) for a, b in zip(expected, actual) if a[0] == b[0]]
+        return {
+            'same_best': same_best / len(expected),
+            'same_decision': same_decision / len(expected),
+            'max_distance_error': max(errors, default=0.0),
+        }
@@ -5,10 +5,35 @@ import numpy as np
 from PIL import Image
 from django.core.management.base import BaseCommand, CommandError
 from django.conf import settings
+from attendance.encoding import ENCODING_SETTINGS
 from attendance.models import Student
 from django.contrib.auth.models import User
 from django.db import transaction
 
+SUPPORTED_FORMATS = ('.jpg', '.jpeg', '.png', '.bmp', '.tiff')
+
+
+def parse_student_filename(filename):
+    """
+    Parse (roll_no, name) from an image filename, or return None.
+
+    Expected format: STU001_John_Doe.jpg or 001_John_Doe.jpg
+    """
+    name_part = os.path.splitext(filename)[0]
+
+    if name_part.startswith('STU'):
+        # Extract roll number and name from STU001_John_Doe format
+        parts = name_part.split('_', 1)
+        if len(parts) >= 2:
+            return parts[0].replace('STU', '').zfill(3), parts[1].replace('_', ' ')
+        return None
+
+    # Try format: 001_John_Doe.jpg
+    parts = name_part.split('_', 1)
+    if len(parts) >= 2 and parts[0].isdigit():
+        return parts[0].zfill(3), parts[1].replace('_', ' ')
+    return None
+
 
 class Command(BaseCommand):
     help = 'Load face encodings from student images'
@@ -39,11 +64,10 @@ class Command(BaseCommand):
                 f'Directory "{image_directory}" does not exist.')
 
         # Get all image files
-        supported_formats = ('.jpg', '.jpeg', '.png', '.bmp', '.tiff')
         image_files = []
 
         for filename in os.listdir(image_directory):
-            if filename.lower().endswith(supported_formats):
+            if filename.lower().endswith(SUPPORTED_FORMATS):
                 image_files.append(filename)
 
         if not image_files:
@@ -62,33 +86,14 @@ class Command(BaseCommand):
         for filename in image_files:
             try:
                 # Parse filename for student information
-                # Expected format: STU001_John_Doe.jpg or 001_John_Doe.jpg
-                name_part = os.path.splitext(filename)[0]
-
-                if name_part.startswith('STU'):
-                    # Extract roll number and name from STU001_John_Doe format
-                    parts = name_part.split('_', 1)
-                    if len(parts) >= 2:
-                        roll_no = parts[0].replace('STU', '').zfill(3)
-                        student_name = parts[1].replace('_', ' ')
-                    else:
-                        self.stdout.write(
-                            self.style.WARNING(
-                                f'Skipping {filename}: Invalid filename format')
-                        )
-                        continue
-                else:
-                    # Try format: 001_John_Doe.jpg
-                    parts = name_part.split('_', 1)
-                    if len(parts) >= 2 and parts[0].isdigit():
-                        roll_no = parts[0].zfill(3)
-                        student_name = parts[1].replace('_', ' ')
-                    else:
-                        self.stdout.write(
-                            self.style.WARNING(
-                                f'Skipping {filename}: Invalid filename format')
-                        )
-                        continue
+                parsed = parse_student_filename(filename)
+                if parsed is None:
+                    self.stdout.write(
+                        self.style.WARNING(
+                            f'Skipping {filename}: Invalid filename format')
+                    )
+                    continue
+                roll_no, student_name = parsed
 
                 # Check if student exists or create
                 student = self.get_or_create_student(roll_no, student_name)
@@ -217,9 +222,9 @@ class Command(BaseCommand):
                     )
                 )
 
-            # Extract face encodings
+            # Extract face encodings; enrollment runs once per student, so it can use more jitter
             face_encodings = face_recognition.face_encodings(
-                image, face_locations)
+                image, face_locations[:1], **ENCODING_SETTINGS['enrollment'])
 
             if len(face_encodings) > 0:
                 return face_encodings[0]  # Return first encoding
@@ -0,0 +1,113 @@
+# attendance/management/commands/process_video.py
+import json
+import os
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from attendance.recordings import process_recording
+
+
+class Command(BaseCommand):
+    help = 'Mark attendance from a recorded lecture video, faster than real time and without a camera'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'video',
+            type=str,
+            help='Path to the recorded video file',
+        )
+        parser.add_argument(
+            '--sample-rate',
+            type=float,
+            default=2.0,
+            help='Frames analysed per second of video (default: 2)',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=0,
+            help='Decoding processes; each takes one contiguous chunk (default: CPU count)',
+        )
+        parser.add_argument(
+            '--tolerance',
+            type=float,
+            default=0.5,
+            help='Face match tolerance (default: 0.5)',
+        )
+        parser.add_argument(
+            '--start',
+            type=str,
+            default='',
+            help='Recording start time, e.g. 2025-03-01T09:00 (default: file mtime minus duration)',
+        )
+        parser.add_argument(
+            '--user',
+            type=str,
+            default='',
+            help='Username that owns the attendance session (no session is created without one)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report who would be marked without writing anything',
+        )
+        parser.add_argument(
+            '--json',
+            action='store_true',
+            help='Print the full report as JSON',
+        )
+
+    def handle(self, *args, **options):
+        path = options['video']
+        if not os.path.isfile(path):
+            raise CommandError(f'Video file not found: {path}')
+
+        started_at = None
+        if options['start']:
+            started_at = parse_datetime(options['start'])
+            if started_at is None:
+                raise CommandError(f'Invalid --start: {options["start"]}')
+            if timezone.is_naive(started_at):
+                started_at = timezone.make_aware(started_at)
+
+        user = None
+        if options['user']:
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f'User not found: {options["user"]}')
+
+        try:
+            report = process_recording(
+                path,
+                user=user,
+                started_at=started_at,
+                sample_rate=options['sample_rate'],
+                workers=options['workers'] or None,
+                tolerance=options['tolerance'],
+                dry_run=options['dry_run'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        for student in report['recognized_students']:
+            self.stdout.write(
+                f"  {student['roll_no']} - {student['name']} at {student['marked_at']} "
+                f"({student['confidence']:.2f}, {student['sightings']} sightings)")
+
+        self.stdout.write("=" * 50)
+        self.stdout.write(
+            f"Video: {report['duration_seconds']}s, {report['frames_decoded']} frames, "
+            f"{report['faces']} faces in {report['frames_with_faces']} frames")
+        self.stdout.write(
+            f"Throughput: {report['decode_fps']} frames/s, "
+            f"{report['realtime_factor']}x real time ({report['elapsed_seconds']}s)")
+
+        action = 'Would mark' if options['dry_run'] else 'Marked'
+        self.stdout.write(self.style.SUCCESS(
+            f"{action} {len(report['recognized_students'])} students present"))
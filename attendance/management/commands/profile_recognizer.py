@@ -0,0 +1,87 @@
+# attendance/management/commands/profile_recognizer.py
+import time
+from django.core.management.base import BaseCommand, CommandError
+from attendance.profiling import profile_camera, PROFILE_MODES, PROFILE_SORTS, MAX_SECONDS
+from attendance.registry import registry
+
+
+class Command(BaseCommand):
+    help = 'Run one camera headless and profile its recognition loop for a few seconds'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--camera',
+            type=str,
+            default='default',
+            help='Camera id from FACEPULSE_CAMERAS (default: default)',
+        )
+        parser.add_argument(
+            '--seconds',
+            type=float,
+            default=10,
+            help=f'Length of the capture, at most {MAX_SECONDS} (default: 10)',
+        )
+        parser.add_argument(
+            '--warmup',
+            type=float,
+            default=3,
+            help='Seconds to run before profiling starts, so gallery loading is left out (default: 3)',
+        )
+        parser.add_argument(
+            '--mode',
+            choices=PROFILE_MODES,
+            default='sample',
+            help='sample: collapsed stacks of every thread working for the camera; '
+                 'cprofile: pstats of recognize() calls (default: sample)',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=0.01,
+            help='Seconds between stack samples (default: 0.01)',
+        )
+        parser.add_argument(
+            '--sort',
+            choices=PROFILE_SORTS,
+            default='cumulative',
+            help='pstats sort key in cprofile mode (default: cumulative)',
+        )
+        parser.add_argument(
+            '--output',
+            type=str,
+            default='',
+            help='Write the report to this file; in cprofile mode a .prof name gets the raw stats',
+        )
+
+    def handle(self, *args, **options):
+        camera_id = options['camera']
+        if camera_id not in registry:
+            raise CommandError(f'Unknown camera: {camera_id}')
+
+        camera = registry.camera(camera_id)
+        hub = registry.hub(camera_id)
+        if not camera.start_camera():
+            raise CommandError(f'Could not start camera {camera_id}')
+        hub.start()
+
+        output = options['output']
+        dump = output if options['mode'] == 'cprofile' and output.endswith('.prof') else None
+        try:
+            time.sleep(options['warmup'])
+            self.stderr.write(f"Profiling {camera_id} for {options['seconds']:.0f}s ({options['mode']})")
+            report = profile_camera(
+                camera, options['seconds'], mode=options['mode'], pool=registry.pool,
+                interval=options['interval'], sort=options['sort'], dump=dump)
+        finally:
+            hub.stop()
+            camera.stop_camera()
+
+        if dump:
+            self.stdout.write(report)
+            self.stdout.write(self.style.SUCCESS(f'Raw stats written to {dump}'))
+        elif output:
+            with open(output, 'w') as f:
+                f.write(report)
+            self.stdout.write(self.style.SUCCESS(f'Profile written to {output}'))
+        else:
+            self.stdout.write(report)
@@ -0,0 +1,81 @@
+# attendance/management/commands/prune_recognition_logs.py
+import os
+import shutil
+from datetime import date, timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from attendance.audit import AUDIT_SETTINGS, IMAGE_ROOT
+from attendance.models import RecognitionLog
+
+
+class Command(BaseCommand):
+    help = 'Delete recognition audit logs and their images older than the retention period'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=AUDIT_SETTINGS['retention_days'],
+            help=f"Days of logs to keep (default: {AUDIT_SETTINGS['retention_days']})",
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report what would be deleted without deleting anything',
+        )
+
+    def handle(self, *args, **options):
+        days = options['days']
+        dry_run = options['dry_run']
+        if days < 0:
+            raise CommandError('--days must not be negative')
+
+        cutoff = timezone.localdate() - timedelta(days=days)
+        expired = RecognitionLog.objects.filter(day__lt=cutoff)
+
+        if dry_run:
+            rows = expired.count()
+        else:
+            # Whole days go at once through the day index; no per-row signals or file deletes
+            rows, _ = expired.delete()
+
+        directories = self.expired_directories(cutoff)
+        if not dry_run:
+            for path in directories:
+                shutil.rmtree(path, ignore_errors=True)
+            self.remove_empty_parents()
+
+        verb = 'Would delete' if dry_run else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {rows} logs and {len(directories)} image directories older than {cutoff}'))
+
+    def expired_directories(self, cutoff):
+        """Day directories (YYYY/MM/DD) under the image root dated before the cutoff"""
+        root = os.path.join(settings.MEDIA_ROOT, IMAGE_ROOT)
+        expired = []
+        for dirpath, dirnames, _ in os.walk(root):
+            parts = os.path.relpath(dirpath, root).split(os.sep)
+            if len(parts) != 2:
+                continue
+            # dirpath is YYYY/MM; its children are days
+            year, month = parts
+            for name in dirnames:
+                try:
+                    day = date(int(year), int(month), int(name))
+                except ValueError:
+                    continue
+                if day < cutoff:
+                    expired.append(os.path.join(dirpath, name))
+            dirnames.clear()
+        return expired
+
+    def remove_empty_parents(self):
+        """Drop month and year directories left empty by the prune"""
+        root = os.path.join(settings.MEDIA_ROOT, IMAGE_ROOT)
+        for dirpath, _, _ in os.walk(root, topdown=False):
+            if dirpath != root and not os.listdir(dirpath):
+                try:
+                    os.rmdir(dirpath)
+                except OSError:
+                    pass
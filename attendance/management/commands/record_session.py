@@ -0,0 +1,59 @@
+# attendance/management/commands/record_session.py
+import time
+from django.core.management.base import BaseCommand, CommandError
+from attendance.registry import registry
+
+
+class Command(BaseCommand):
+    help = 'Record a camera to a replayable file with per-frame timestamps'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'output',
+            type=str,
+            help='Recording to write, e.g. room-101.fprec',
+        )
+        parser.add_argument(
+            '--camera',
+            type=str,
+            default='default',
+            help='Camera id from FACEPULSE_CAMERAS (default: default)',
+        )
+        parser.add_argument(
+            '--duration',
+            type=float,
+            default=60,
+            help='Seconds to record (default: 60)',
+        )
+        parser.add_argument(
+            '--quality',
+            type=int,
+            default=90,
+            help='JPEG quality of the stored frames (default: 90)',
+        )
+
+    def handle(self, *args, **options):
+        camera_id = options['camera']
+        if camera_id not in registry:
+            raise CommandError(f'Unknown camera: {camera_id}')
+
+        camera = registry.camera(camera_id)
+        hub = registry.hub(camera_id)
+        if not camera.start_camera():
+            raise CommandError(f'Could not start camera {camera_id}')
+
+        recorder = camera.start_recording(options['output'], quality=options['quality'])
+        hub.start()
+        deadline = time.monotonic() + options['duration']
+        try:
+            while hub.running and time.monotonic() < deadline:
+                time.sleep(0.5)
+        except KeyboardInterrupt:
+            self.stdout.write('Interrupted')
+        finally:
+            hub.stop()
+            camera.stop_camera()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Recorded {recorder.frames_written} frames '
+            f'({recorder.bytes_written / 1e6:.1f} MB) to {options["output"]}'))
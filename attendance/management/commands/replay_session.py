@@ -0,0 +1,133 @@
+# attendance/management/commands/replay_session.py
+import hashlib
+import json
+import time
+from django.core.management.base import BaseCommand, CommandError
+from attendance.camera import FaceRecognitionCamera
+from attendance.replay import REPLAY_PREFIX, ReplaySource
+
+
+class DiscardedAudit:
+    """Stands in for the audit log when a replay must not write"""
+
+    def record(self, *args, **kwargs):
+        return False
+
+
+class ReplayCamera(FaceRecognitionCamera):
+    """Recognizes like a live camera but writes no attendance or audit rows"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.audit = DiscardedAudit()
+
+    def mark_attendance(self, student_id, confidence):
+        return True
+
+
+class Command(BaseCommand):
+    help = ('Replay a recorded session through the recognition pipeline and report '
+            'throughput and recognitions; nothing is written to the database unless --write is given')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'recording',
+            type=str,
+            help='Recording written by record_session',
+        )
+        parser.add_argument(
+            '--speed',
+            type=float,
+            default=0,
+            help='Playback speed: 1 is real time, 2 twice as fast, 0 as fast as possible (default: 0)',
+        )
+        parser.add_argument(
+            '--runs',
+            type=int,
+            default=1,
+            help='Replay this many times and check every run recognized the same faces (default: 1)',
+        )
+        parser.add_argument(
+            '--write',
+            action='store_true',
+            help='Mark attendance and write audit rows as a live camera would',
+        )
+        parser.add_argument(
+            '--json',
+            action='store_true',
+            help='Print the results as JSON',
+        )
+
+    def handle(self, *args, **options):
+        path = options['recording']
+        try:
+            source = ReplaySource(path)
+        except (OSError, ValueError) as e:
+            raise CommandError(f'Could not open recording: {e}')
+        frame_count = len(source.index)
+        duration = source.duration
+        source.release()
+
+        results = [
+            self.replay(path, options['speed'], options['write'])
+            for _ in range(max(1, options['runs']))
+        ]
+        deterministic = len({result['digest'] for result in results}) == 1
+
+        if options['json']:
+            self.stdout.write(json.dumps({
+                'recording': path,
+                'frames': frame_count,
+                'duration': round(duration, 2),
+                'speed': options['speed'],
+                'deterministic': deterministic,
+                'runs': results,
+            }, indent=2))
+        else:
+            self.stdout.write(f'{path}: {frame_count} frames, {duration:.1f}s recorded')
+            for number, result in enumerate(results, 1):
+                self.stdout.write(
+                    f"run {number}: {result['fps']:.1f} fps, {result['faces']} faces, "
+                    f"{result['recognitions']} recognitions ({result['recognitions_per_second']:.2f}/s), "
+                    f"digest {result['digest'][:12]}")
+            if len(results) > 1:
+                style = self.style.SUCCESS if deterministic else self.style.ERROR
+                self.stdout.write(style(
+                    'All runs recognized the same faces' if deterministic
+                    else 'Runs differ; the pipeline is not deterministic'))
+
+        if not deterministic:
+            raise CommandError('Replays produced different recognitions')
+
+    def replay(self, path, speed, write=False):
+        """One pass over the recording with recognition inline, so no frame is skipped"""
+        camera_class = FaceRecognitionCamera if write else ReplayCamera
+        camera = camera_class('replay', f'{REPLAY_PREFIX}{path}?speed={speed}')
+        faces_before = camera.faces_counter.value
+        if not camera.start_camera():
+            raise CommandError(f'Could not replay {path}')
+
+        digest = hashlib.sha256()
+        started = time.perf_counter()
+        try:
+            for _ in camera.frames():
+                if camera.frame_count % 3 == 0:
+                    digest.update(repr((camera.frame_count, [
+                        (student_id, top, right, bottom, left)
+                        for top, right, bottom, left, student_id, _, _ in camera.detections
+                    ])).encode())
+        finally:
+            elapsed = time.perf_counter() - started
+            recognized = sorted(camera.attendance_marked)
+            camera.stop_camera()
+
+        return {
+            'frames': camera.frame_count,
+            'seconds': round(elapsed, 3),
+            'fps': camera.frame_count / elapsed if elapsed else 0.0,
+            'faces': camera.faces_counter.value - faces_before,
+            'recognitions': len(recognized),
+            'recognitions_per_second': len(recognized) / elapsed if elapsed else 0.0,
+            'students': recognized,
+            'digest': digest.hexdigest(),
+        }
@@ -0,0 +1,116 @@
+# attendance/management/commands/run_recognizer.py
+import time
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from attendance.camera import resolve_classes
+from attendance.registry import registry
+
+
+class Command(BaseCommand):
+    help = 'Run capture and recognition without a browser; frames are never drawn or JPEG-encoded'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--camera',
+            action='append',
+            default=[],
+            help='Camera id from FACEPULSE_CAMERAS; repeat for several (default: all)',
+        )
+        parser.add_argument(
+            '--user',
+            type=str,
+            default='',
+            help='Username that owns the attendance sessions (no session is created without one)',
+        )
+        parser.add_argument(
+            '--class',
+            dest='classes',
+            action='append',
+            default=[],
+            help='StudentClass code the sessions are bound to; repeat for several (default: match every student)',
+        )
+        parser.add_argument(
+            '--duration',
+            type=float,
+            default=0,
+            help='Stop after this many seconds (default: run until interrupted)',
+        )
+        parser.add_argument(
+            '--stats-interval',
+            type=float,
+            default=30,
+            help='Seconds between progress lines (default: 30)',
+        )
+
+    def handle(self, *args, **options):
+        camera_ids = options['camera'] or list(registry)
+        unknown = [camera_id for camera_id in camera_ids if camera_id not in registry]
+        if unknown:
+            raise CommandError(f'Unknown camera: {", ".join(unknown)}')
+
+        user = None
+        if options['user']:
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f'User not found: {options["user"]}')
+
+        try:
+            class_ids = resolve_classes(options['classes'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        started = []
+        for camera_id in camera_ids:
+            camera = registry.camera(camera_id)
+            if not camera.start_camera(user, class_ids):
+                self.stdout.write(self.style.ERROR(f'Could not start camera {camera_id}'))
+                continue
+            registry.hub(camera_id).start()
+            started.append(camera_id)
+            self.stdout.write(f'Recognizing on camera {camera_id}')
+
+        if not started:
+            raise CommandError('No camera could be started.')
+
+        deadline = time.monotonic() + options['duration'] if options['duration'] else None
+        last_counts = {camera_id: 0 for camera_id in started}
+        last_report = time.monotonic()
+
+        try:
+            while any(registry.hub(camera_id).running for camera_id in started):
+                if deadline is not None and time.monotonic() >= deadline:
+                    break
+                time.sleep(1)
+
+                now = time.monotonic()
+                if now - last_report >= options['stats_interval']:
+                    self.report(started, last_counts, now - last_report)
+                    last_report = now
+
+        except KeyboardInterrupt:
+            self.stdout.write('Interrupted')
+
+        finally:
+            for camera_id in started:
+                registry.hub(camera_id).stop()
+                registry.camera(camera_id).stop_camera()
+
+        for camera_id in started:
+            camera = registry.camera(camera_id)
+            self.stdout.write(self.style.SUCCESS(
+                f'{camera_id}: {camera.frame_count} frames, '
+                f'{len(camera.attendance_marked)} students marked present'))
+
+    def report(self, camera_ids, last_counts, seconds):
+        """Print frame rate and recognitions per camera"""
+        for camera_id in camera_ids:
+            camera = registry.camera(camera_id)
+            rate = (camera.frame_count - last_counts[camera_id]) / seconds
+            last_counts[camera_id] = camera.frame_count
+            self.stdout.write(
+                f'{camera_id}: {rate:.1f} fps, {len(camera.attendance_marked)} present, '
+                f'{registry.hub(camera_id).frames_rendered} frames rendered')
+        pool = registry.pool.stats()
+        self.stdout.write(
+            f"recognition: {pool['completed']} frames done, {pool['replaced']} skipped while busy")
@@ -0,0 +1,265 @@
+# attendance/management/commands/watch_students.py
+import os
+import time
+from collections import OrderedDict
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from django.db import transaction
+from attendance.models import Student
+from attendance.management.commands.load_encodings import (
+    Command as LoadEncodingsCommand, SUPPORTED_FORMATS, parse_student_filename)
+
+
+class FolderIndex:
+    """
+    mtime/size index of an image folder tree.
+
+    A directory whose mtime has not changed since the last scan is not listed
+    again, so a tick over an unchanged 100k-file folder costs one stat per
+    directory. Files rewritten in place do not touch the directory mtime;
+    those are caught by the periodic full scan.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.files = {}        # path -> (mtime_ns, size) of the last processed version
+        self.dir_files = {}    # dir path -> set of image paths seen in it
+        self.dirs = {}         # dir path -> (mtime_ns, [subdir paths])
+
+    def scan(self, full=False):
+        """Return [(path, (mtime_ns, size))] for images that are new or changed"""
+        changed = []
+        stack = [self.root]
+
+        while stack:
+            path = stack.pop()
+            try:
+                mtime = os.stat(path).st_mtime_ns
+            except FileNotFoundError:
+                self.forget_dir(path)
+                continue
+
+            cached = self.dirs.get(path)
+            if cached and cached[0] == mtime and not full:
+                stack.extend(cached[1])
+                continue
+
+            subdirs = []
+            seen = set()
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                        continue
+                    if not entry.name.lower().endswith(SUPPORTED_FORMATS):
+                        continue
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    seen.add(entry.path)
+                    key = (stat.st_mtime_ns, stat.st_size)
+                    if self.files.get(entry.path) != key:
+                        changed.append((entry.path, key))
+
+            for removed in self.dir_files.get(path, set()) - seen:
+                self.files.pop(removed, None)
+            for removed in set(cached[1] if cached else ()) - set(subdirs):
+                self.forget_dir(removed)
+
+            self.dir_files[path] = seen
+            self.dirs[path] = (mtime, subdirs)
+            stack.extend(subdirs)
+
+        return changed
+
+    def forget_dir(self, path):
+        """Drop a directory that no longer exists, including everything under it"""
+        cached = self.dirs.pop(path, None)
+        for removed in self.dir_files.pop(path, set()):
+            self.files.pop(removed, None)
+        for subdir in (cached[1] if cached else ()):
+            self.forget_dir(subdir)
+
+
+class Command(BaseCommand):
+    help = 'Watch the student image folder and enroll new or changed images'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--directory',
+            type=str,
+            default='media/students/',
+            help='Directory containing student images (default: media/students/)',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=2.0,
+            help='Seconds between folder polls (default: 2.0)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=20,
+            help='Images enrolled per database transaction (default: 20)',
+        )
+        parser.add_argument(
+            '--settle',
+            type=float,
+            default=1.0,
+            help='Seconds a file must stay unchanged before it is read (default: 1.0)',
+        )
+        parser.add_argument(
+            '--full-scan-interval',
+            type=float,
+            default=300.0,
+            help='Seconds between full rescans that catch in-place rewrites (default: 300)',
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Enroll every image on startup, even if it is already enrolled',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Process the folder once and exit',
+        )
+
+    def handle(self, *args, **options):
+        directory = os.path.abspath(options['directory'])
+        interval = options['interval']
+        batch_size = max(1, options['batch_size'])
+        settle = options['settle']
+        full_scan_interval = options['full_scan_interval']
+
+        if not os.path.isdir(directory):
+            raise CommandError(f'Directory "{directory}" does not exist.')
+
+        self.enroller = LoadEncodingsCommand(stdout=self.stdout, stderr=self.stderr)
+        self.enroller.style = self.style
+        self.directory = directory
+        self.index = FolderIndex(directory)
+        # path -> [(mtime_ns, size), first seen]; waits here until the file settles
+        self.pending = OrderedDict()
+
+        started = time.monotonic()
+        initial = self.index.scan(full=True)
+        enrolled = set() if options['force'] else self.enrolled_images()
+        for path, key in initial:
+            if self.image_field(path) in enrolled:
+                self.index.files[path] = key
+            else:
+                self.pending[path] = [key, 0.0]
+        self.stdout.write(
+            f'Indexed {len(self.index.files) + len(self.pending)} images in '
+            f'{time.monotonic() - started:.1f}s, {len(self.pending)} to enroll')
+
+        last_full_scan = time.monotonic()
+        try:
+            while True:
+                now = time.monotonic()
+                full = now - last_full_scan >= full_scan_interval
+                if full:
+                    last_full_scan = now
+                for path, key in self.index.scan(full=full):
+                    if path not in self.pending:
+                        self.pending[path] = [key, now]
+
+                ready = self.settled(now, settle, batch_size)
+                if ready:
+                    self.enroll_batch(ready)
+
+                if options['once'] and not self.pending:
+                    break
+                if not ready:
+                    time.sleep(interval)
+
+        except KeyboardInterrupt:
+            self.stdout.write('\nStopped watching')
+
+    def enrolled_images(self):
+        """Image paths of students that already have an encoding"""
+        return set(
+            Student.objects.filter(face_encoding__isnull=False)
+            .exclude(image='').values_list('image', flat=True)
+        )
+
+    def image_field(self, path):
+        """Value stored in Student.image for a file under the watched folder"""
+        media_root = os.path.abspath(settings.MEDIA_ROOT)
+        if path.startswith(media_root + os.sep):
+            return os.path.relpath(path, media_root).replace(os.sep, '/')
+        return 'students/' + os.path.relpath(path, self.directory).replace(os.sep, '/')
+
+    def settled(self, now, settle, limit):
+        """Pop up to limit pending files whose size and mtime have stopped changing"""
+        ready = []
+        for path, entry in list(self.pending.items()):
+            if len(ready) >= limit:
+                break
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                del self.pending[path]
+                continue
+            key = (stat.st_mtime_ns, stat.st_size)
+            if key != entry[0]:
+                # Still being written
+                entry[0], entry[1] = key, now
+                continue
+            if now - entry[1] >= settle:
+                del self.pending[path]
+                ready.append((path, key))
+        return ready
+
+    def enroll_batch(self, batch):
+        """Encode a batch of images, then write all of them in one transaction"""
+        started = time.monotonic()
+        encoded = []
+
+        for path, key in batch:
+            # Record the version even if it fails, so it is retried only once changed
+            self.index.files[path] = key
+            parsed = parse_student_filename(os.path.basename(path))
+            if parsed is None:
+                self.stdout.write(
+                    self.style.WARNING(
+                        f'Skipping {os.path.basename(path)}: Invalid filename format')
+                )
+                continue
+            encoding = self.enroller.extract_face_encoding(path)
+            if encoding is None:
+                self.stdout.write(
+                    self.style.ERROR(
+                        f'✗ Failed to extract face from {os.path.basename(path)}')
+                )
+                continue
+            encoded.append((path, parsed, encoding))
+
+        if not encoded:
+            return
+
+        try:
+            with transaction.atomic():
+                for path, (roll_no, student_name), encoding in encoded:
+                    student = self.enroller.get_or_create_student(
+                        roll_no, student_name)
+                    student.face_encoding = encoding.tolist()
+                    student.image = self.image_field(path)
+                    student.save()
+                    self.stdout.write(
+                        self.style.SUCCESS(
+                            f'✓ Enrolled {student.name} ({roll_no})')
+                    )
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f'✗ Error saving batch: {e}'))
+            # Retry after the settle delay
+            for path, _, _ in encoded:
+                self.pending[path] = [self.index.files.pop(path), time.monotonic()]
+            return
+
+        self.stdout.write(
+            f'Enrolled {len(encoded)}/{len(batch)} images in '
+            f'{time.monotonic() - started:.1f}s')
@@ -0,0 +1,213 @@
+# attendance/metrics.py
+import abc
+import bisect
+import threading
+import time
+from functools import partial
+
+# Upper bounds in seconds; sized for per-frame stages from sub-millisecond to seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# Upper bounds for per-request query counts
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+STAGES = ('capture', 'prepare', 'detect', 'refine', 'quality', 'encode', 'match',
+          'db_write', 'draw', 'jpeg')
+
+
+class Sharded(abc.ABC):
+    """
+    Base for metrics updated from several threads.
+
+    Each thread writes to its own shard, so the hot path takes no lock; the
+    shard list is only locked when a thread writes for the first time and
+    when the metric is read.
+    """
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+        self._local = threading.local()
+        self._shards = []
+        self._lock = threading.Lock()
+
+    @abc.abstractmethod
+    def _new_shard(self):
+        """Fresh per-thread storage for this metric"""
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = self._new_shard()
+            with self._lock:
+                self._shards.append(shard)
+        return shard
+
+    def _all_shards(self):
+        with self._lock:
+            return list(self._shards)
+
+
+class Counter(Sharded):
+    def _new_shard(self):
+        return [0]
+
+    def inc(self, amount=1):
+        self._shard()[0] += amount
+
+    @property
+    def value(self):
+        return sum(shard[0] for shard in self._all_shards())
+
+
+class Histogram(Sharded):
+    """Fixed-bucket histogram; a shard is [count per bucket..., +Inf count, sum]"""
+
+    def __init__(self, name, labels, buckets=LATENCY_BUCKETS):
+        super().__init__(name, labels)
+        self.buckets = buckets
+
+    def _new_shard(self):
+        return [0] * (len(self.buckets) + 1) + [0.0]
+
+    def observe(self, value):
+        shard = self._shard()
+        shard[bisect.bisect_left(self.buckets, value)] += 1
+        shard[-1] += value
+
+    def since(self, started):
+        """Observe the time elapsed since a time.perf_counter() reading"""
+        self.observe(time.perf_counter() - started)
+
+    def totals(self):
+        """(per-bucket counts, total count, sum) across threads"""
+        counts = [0] * (len(self.buckets) + 1)
+        total = 0.0
+        for shard in self._all_shards():
+            for index in range(len(counts)):
+                counts[index] += shard[index]
+            total += shard[-1]
+        return counts, sum(counts), total
+
+    def quantile(self, fraction, counts=None):
+        """Upper bound of the bucket holding the given quantile"""
+        if counts is None:
+            counts = self.totals()[0]
+        target = fraction * sum(counts)
+        running = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            running += count
+            if count and running >= target:
+                return bound
+        return 0.0
+
+
+def format_labels(labels, extra=None):
+    items = dict(labels, **(extra or {}))
+    if not items:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in sorted(items.items())) + '}'
+
+
+class Metrics:
+    """Named counters and histograms, exported as Prometheus text or JSON"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.help = {}
+
+    def _get(self, store, factory, name, help_text, labels):
+        key = (name, tuple(sorted(labels.items())))
+        metric = store.get(key)
+        if metric is None:
+            with self.lock:
+                metric = store.get(key)
+                if metric is None:
+                    metric = store[key] = factory(name, labels)
+                    self.help.setdefault(name, help_text)
+        return metric
+
+    def counter(self, name, help_text='', **labels):
+        return self._get(self.counters, Counter, name, help_text, labels)
+
+    def histogram(self, name, help_text='', buckets=LATENCY_BUCKETS, **labels):
+        return self._get(self.histograms, partial(Histogram, buckets=buckets), name, help_text, labels)
+
+    def stage_timers(self, camera_id):
+        """Histogram per pipeline stage for one camera"""
+        return {
+            stage: self.histogram(
+                'facepulse_stage_seconds', 'Time spent in each pipeline stage',
+                camera=camera_id, stage=stage)
+            for stage in STAGES
+        }
+
+    def render(self):
+        """Prometheus text exposition format"""
+        with self.lock:
+            counters = sorted(self.counters.values(), key=lambda m: m.name)
+            histograms = sorted(self.histograms.values(), key=lambda m: m.name)
+
+        lines = []
+        seen = set()
+        for counter in counters:
+            if counter.name not in seen:
+                seen.add(counter.name)
+                lines.append(f'# HELP {counter.name} {self.help[counter.name]}')
+                lines.append(f'# TYPE {counter.name} counter')
+            lines.append(f'{counter.name}{format_labels(counter.labels)} {counter.value}')
+
+        for histogram in histograms:
+            if histogram.name not in seen:
+                seen.add(histogram.name)
+                lines.append(f'# HELP {histogram.name} {self.help[histogram.name]}')
+                lines.append(f'# TYPE {histogram.name} histogram')
+            counts, count, total = histogram.totals()
+            running = 0
+            for bound, bucket_count in zip(histogram.buckets + ('+Inf',), counts):
+                running += bucket_count
+                lines.append(
+                    f'{histogram.name}_bucket{format_labels(histogram.labels, {"le": bound})} {running}')
+            lines.append(f'{histogram.name}_sum{format_labels(histogram.labels)} {total}')
+            lines.append(f'{histogram.name}_count{format_labels(histogram.labels)} {count}')
+
+        return '\n'.join(lines) + '\n'
+
+    def summary(self, **labels):
+        """Counters and stage latencies (milliseconds) whose labels include the given ones"""
+        def selected(metric):
+            return all(metric.labels.get(key) == value for key, value in labels.items())
+
+        with self.lock:
+            counters = [metric for metric in self.counters.values() if selected(metric)]
+            histograms = [metric for metric in self.histograms.values() if selected(metric)]
+
+        stages = {}
+        for histogram in histograms:
+            counts, count, total = histogram.totals()
+            if not count:
+                continue
+            stages[histogram.labels.get('stage', histogram.name)] = {
+                'count': count,
+                'avg_ms': round(total / count * 1000, 2),
+                'p50_ms': round(histogram.quantile(0.5, counts) * 1000, 2),
+                'p95_ms': round(histogram.quantile(0.95, counts) * 1000, 2),
+            }
+        def key(counter):
+            # Counters split by a label the caller did not select (reason, source) stay apart
+            extra = ','.join(
+                f'{name}="{value}"' for name, value in sorted(counter.labels.items())
+                if name not in labels)
+            return f'{counter.name}{{{extra}}}' if extra else counter.name
+
+        return {
+            'counters': {key(counter): counter.value for counter in counters},
+            'stages': stages,
+        }
+
+
+# Shared by every camera and view in this process
+metrics = Metrics()
@@ -0,0 +1,73 @@
+# attendance/middleware.py
+import time
+import logging
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from .metrics import metrics, QUERY_BUCKETS
+from .queries import recording
+
+logger = logging.getLogger(__name__)
+
+# Requests slower than this are logged with their slowest queries
+SLOW_REQUEST_SECONDS = getattr(settings, 'FACEPULSE_SLOW_REQUEST_SECONDS', 1.0)
+
+
+class RequestMetricsMiddleware:
+    """
+    Query count, database time and wall time for every request, by view.
+
+    Numbers go to the shared metrics registry next to the recognizer's
+    stage timings. Slow requests and views that exceed the budget declared
+    with @query_budget are logged with their slowest statements. Streaming
+    responses are timed until the response is returned, not until the
+    stream ends.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        with recording() as recorder:
+            started = time.perf_counter()
+            response = self.get_response(request)
+            self.finish(request, recorder, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        with recording() as recorder:
+            started = time.perf_counter()
+            response = await self.get_response(request)
+            self.finish(request, recorder, time.perf_counter() - started)
+        return response
+
+    def finish(self, request, recorder, elapsed):
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        budget = getattr(match.func, 'query_budget', None) if match else None
+
+        metrics.histogram(
+            'facepulse_request_seconds', 'Wall time per request', view=view).observe(elapsed)
+        metrics.histogram(
+            'facepulse_request_db_seconds', 'Database time per request', view=view).observe(recorder.seconds)
+        metrics.histogram(
+            'facepulse_request_queries', 'Database queries per request',
+            buckets=QUERY_BUCKETS, view=view).observe(recorder.count)
+
+        if budget is not None and recorder.count > budget:
+            metrics.counter(
+                'facepulse_query_budget_exceeded_total', 'Requests that ran more queries than their view allows',
+                view=view).inc()
+            logger.warning(
+                f"{request.method} {request.path} ({view}) ran {recorder.count} queries, "
+                f"budget {budget}; slowest:\n{recorder.describe()}")
+        elif elapsed >= SLOW_REQUEST_SECONDS:
+            logger.warning(
+                f"Slow request {request.method} {request.path} ({view}): {elapsed * 1000:.0f}ms, "
+                f"{recorder.count} queries in {recorder.seconds * 1000:.0f}ms; slowest:\n{recorder.describe()}")
@@ -0,0 +1,74 @@
+# Generated by Django 5.2.6 on 2026-10-19 02:52
+
+import django.contrib.postgres.fields
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttendanceSession',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(help_text='Session name (e.g., Morning Class)', max_length=100)),
+                ('date', models.DateField(default=django.utils.timezone.now)),
+                ('start_time', models.DateTimeField(default=django.utils.timezone.now)),
+                ('end_time', models.DateTimeField(blank=True, null=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('total_recognized', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['-date', '-start_time'],
+            },
+        ),
+        migrations.AlterModelOptions(
+            name='student',
+            options={'ordering': ['roll_no']},
+        ),
+        migrations.AddField(
+            model_name='attendance',
+            name='notes',
+            field=models.TextField(blank=True, help_text='Additional notes'),
+        ),
+        migrations.AlterField(
+            model_name='attendance',
+            name='confidence',
+            field=models.FloatField(blank=True, help_text='Face recognition confidence', null=True),
+        ),
+        migrations.AlterField(
+            model_name='attendance',
+            name='date',
+            field=models.DateField(default=django.utils.timezone.now),
+        ),
+        migrations.AlterField(
+            model_name='student',
+            name='face_encoding',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.FloatField(), blank=True, help_text='128-dimensional face encoding', null=True, size=128),
+        ),
+        migrations.AddIndex(
+            model_name='attendance',
+            index=models.Index(fields=['date'], name='attendance__date_61f2e1_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='attendance',
+            index=models.Index(fields=['student', 'date'], name='attendance__student_76a8d7_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['roll_no'], name='attendance__roll_no_382915_idx'),
+        ),
+        migrations.AddField(
+            model_name='attendancesession',
+            name='created_by',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-19 03:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0003_gallerychange'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attendancesession',
+            name='camera_id',
+            field=models.CharField(default='default', help_text='Camera that recorded the session', max_length=50),
+        ),
+    ]
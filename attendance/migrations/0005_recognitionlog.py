@@ -0,0 +1,33 @@
+# Generated by Django 5.2.6 on 2026-10-19 03:18
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0004_attendancesession_camera_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecognitionLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('image', models.ImageField(blank=True, upload_to='recognition_logs/')),
+                ('status', models.CharField(choices=[('success', 'Success'), ('failed', 'Failed'), ('multiple', 'Multiple Faces'), ('none', 'No Face Detected')], max_length=10)),
+                ('confidence', models.FloatField(blank=True, null=True)),
+                ('camera_id', models.CharField(default='default', max_length=50)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('day', models.DateField(help_text='Partition key; logs and images are pruned a whole day at a time')),
+                ('details', models.JSONField(default=dict)),
+                ('student', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='attendance.student')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['day', 'status'], name='attendance__day_e14855_idx')],
+            },
+        ),
+    ]
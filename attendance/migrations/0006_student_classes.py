@@ -0,0 +1,24 @@
+# Generated by Django 5.2.6 on 2026-10-19 03:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0005_recognitionlog'),
+        ('faculty', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attendancesession',
+            name='classes',
+            field=models.ManyToManyField(blank=True, help_text='Classes being taught; empty matches against every student', related_name='sessions', to='faculty.studentclass'),
+        ),
+        migrations.AddField(
+            model_name='student',
+            name='classes',
+            field=models.ManyToManyField(blank=True, help_text='Classes the student attends; class-bound sessions only match these students', related_name='students', to='faculty.studentclass'),
+        ),
+    ]
@@ -18,6 +18,9 @@ class Student(models.Model):
         help_text="128-dimensional face encoding"
     )
     image = models.ImageField(upload_to='students/', null=True, blank=True)
+    classes = models.ManyToManyField(
+        'faculty.StudentClass', blank=True, related_name='students',
+        help_text="Classes the student attends; class-bound sessions only match these students")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -85,14 +88,15 @@ class Attendance(models.Model):
         return f"{self.student.name} - {self.date} - {self.status}"
 
     @classmethod
-    def mark_attendance(cls, student, status='present', confidence=None, notes=''):
-        """Mark attendance for a student"""
+    def mark_attendance(cls, student, status='present', confidence=None, notes='', marked_at=None):
+        """Mark attendance for a student; marked_at backdates the record to when it was observed"""
+        marked_at = marked_at or timezone.now()
         attendance, created = cls.objects.update_or_create(
             student=student,
-            date=timezone.now().date(),
+            date=marked_at.date(),
             defaults={
                 'status': status,
-                'marked_at': timezone.now(),
+                'marked_at': marked_at,
                 'confidence': confidence,
                 'notes': notes,
             }
@@ -109,6 +113,11 @@ class AttendanceSession(models.Model):
     end_time = models.DateTimeField(null=True, blank=True)
     is_active = models.BooleanField(default=True)
     total_recognized = models.PositiveIntegerField(default=0)
+    camera_id = models.CharField(
+        max_length=50, default='default', help_text="Camera that recorded the session")
+    classes = models.ManyToManyField(
+        'faculty.StudentClass', blank=True, related_name='sessions',
+        help_text="Classes being taught; empty matches against every student")
     created_by = models.ForeignKey(User, on_delete=models.CASCADE)
 
     class Meta:
@@ -122,3 +131,57 @@ class AttendanceSession(models.Model):
         self.end_time = timezone.now()
         self.is_active = False
         self.save()
+
+
+class GalleryChange(models.Model):
+    """Append-only log of face gallery changes; the id is the gallery version"""
+    OPERATION_CHOICES = [
+        ('upsert', 'Upsert'),
+        ('delete', 'Delete'),
+    ]
+
+    student_id = models.BigIntegerField(
+        help_text="Changed student (kept after the student is deleted)")
+    operation = models.CharField(max_length=10, choices=OPERATION_CHOICES)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['id']
+
+    def __str__(self):
+        return f"v{self.id} {self.operation} student {self.student_id}"
+
+    @classmethod
+    def publish(cls, student_id, operation='upsert'):
+        """Record a gallery change for running recognizers to pick up"""
+        return cls.objects.create(student_id=student_id, operation=operation)
+
+
+class RecognitionLog(models.Model):
+    """Sampled audit trail of recognition outcomes, written in batches by attendance.audit"""
+    STATUS_CHOICES = [
+        ('success', 'Success'),
+        ('failed', 'Failed'),
+        ('multiple', 'Multiple Faces'),
+        ('none', 'No Face Detected'),
+    ]
+
+    image = models.ImageField(upload_to='recognition_logs/', blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES)
+    student = models.ForeignKey(
+        Student, on_delete=models.SET_NULL, null=True, blank=True)
+    confidence = models.FloatField(null=True, blank=True)
+    camera_id = models.CharField(max_length=50, default='default')
+    created_at = models.DateTimeField(default=timezone.now)
+    day = models.DateField(
+        help_text="Partition key; logs and images are pruned a whole day at a time")
+    details = models.JSONField(default=dict)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['day', 'status']),
+        ]
+
+    def __str__(self):
+        return f"{self.status} - {self.created_at}"
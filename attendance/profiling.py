@@ -0,0 +1,182 @@
+# attendance/profiling.py
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+
+# Longest capture accepted from the endpoint and the command
+MAX_SECONDS = 120
+
+PROFILE_MODES = ('sample', 'cprofile')
+PROFILE_SORTS = ('cumulative', 'tottime', 'ncalls')
+
+# Cameras currently being profiled; one capture per camera at a time
+_profiling = set()
+_profiling_lock = threading.Lock()
+
+
+def frame_label(code):
+    """Function name and short path; never contains ';' so it is safe in collapsed stacks"""
+    path = code.co_filename.replace(os.sep, '/').split('/')
+    return f"{code.co_name} ({'/'.join(path[-2:])}:{code.co_firstlineno})"
+
+
+def collapse(frame):
+    """Root-first 'a;b;c' stack for one thread's current frame"""
+    labels = []
+    while frame is not None:
+        labels.append(frame_label(frame.f_code))
+        frame = frame.f_back
+    return ';'.join(reversed(labels))
+
+
+class StackSampler:
+    """
+    Samples the Python stacks of the threads working for one camera.
+
+    A camera's work runs on its frame hub thread (capture, drawing, JPEG
+    encoding) and, while a worker holds one of its frames, on a shared
+    recognition worker. Nothing is installed in those threads; a separate
+    thread reads sys._current_frames() every interval, so the loop runs
+    unmodified and the cost disappears when sampling stops.
+    """
+
+    def __init__(self, camera, pool=None, interval=0.01):
+        self.camera = camera
+        self.pool = pool
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+
+    def _threads(self):
+        """Idents of the threads currently working for the camera"""
+        hub_name = f'frame-hub-{self.camera.camera_id}'
+        idents = {thread.ident for thread in threading.enumerate() if thread.name == hub_name}
+        if self.pool is not None:
+            idents.update(ident for ident, camera_id in list(self.pool.busy.items())
+                          if camera_id == self.camera.camera_id)
+        return idents
+
+    def run(self, seconds):
+        sampler = threading.current_thread().ident
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            idents = self._threads()
+            for ident, frame in sys._current_frames().items():
+                if ident in idents and ident != sampler:
+                    self.stacks[collapse(frame)] += 1
+            self.samples += 1
+            time.sleep(self.interval)
+
+    def collapsed(self):
+        """Brendan Gregg's collapsed-stack format, one 'stack count' line per stack"""
+        return '\n'.join(f'{stack} {count}' for stack, count in self.stacks.most_common())
+
+
+class CallProfiler:
+    """
+    cProfile for calls made from whichever thread recognizes a camera's frames.
+
+    The camera checks one attribute per frame and only routes recognize()
+    through here while a capture is running; the lock lets the capture wait
+    for a call still in flight before reading the stats.
+    """
+
+    def __init__(self):
+        self.profiler = cProfile.Profile()
+        self.lock = threading.Lock()
+        self.calls = 0
+
+    def runcall(self, func, *args):
+        with self.lock:
+            self.calls += 1
+            return self.profiler.runcall(func, *args)
+
+
+def counters(camera, face_gallery):
+    return {
+        'frames': camera.frames_counter.value,
+        'faces': camera.faces_counter.value,
+        'recognitions': camera.recognitions_counter.value,
+        'unknowns': camera.unknowns_counter.value,
+        'gallery_size': len(face_gallery),
+    }
+
+
+def header(camera, mode, seconds, before, after, samples=None):
+    """Comment lines describing the load the profile was taken under"""
+    lines = [
+        f'# camera={camera.camera_id} mode={mode} seconds={seconds:.1f} active={camera.is_active}',
+        f"# frames={after['frames'] - before['frames']} faces={after['faces'] - before['faces']} "
+        f"recognitions={after['recognitions'] - before['recognitions']} "
+        f"unknowns={after['unknowns'] - before['unknowns']} gallery_size={after['gallery_size']}",
+    ]
+    if samples is not None:
+        lines.append(f'# samples={samples}')
+    return '\n'.join(lines)
+
+
+def profile_camera(camera, seconds, mode='sample', pool=None, interval=0.01,
+                   sort='cumulative', limit=40, dump=None):
+    """
+    Profile a running camera for some seconds and return the report as text.
+
+    'sample' reports collapsed stacks of the hub and recognition threads;
+    'cprofile' runs each recognize() call under cProfile and reports pstats,
+    optionally also dumping the raw stats to a file for other viewers.
+    """
+    if mode not in PROFILE_MODES:
+        raise ValueError(f'Unknown profile mode: {mode}')
+    if sort not in PROFILE_SORTS:
+        raise ValueError(f'Unknown sort key: {sort}')
+    seconds = min(max(seconds, 0.1), MAX_SECONDS)
+
+    with _profiling_lock:
+        if camera.camera_id in _profiling:
+            raise RuntimeError(f'Camera {camera.camera_id} is already being profiled')
+        _profiling.add(camera.camera_id)
+
+    try:
+        face_gallery = camera.gallery
+        before = counters(camera, face_gallery)
+        started = time.perf_counter()
+
+        if mode == 'sample':
+            sampler = StackSampler(camera, pool, interval)
+            sampler.run(seconds)
+            elapsed = time.perf_counter() - started
+            after = counters(camera, face_gallery)
+            return header(camera, mode, elapsed, before, after, sampler.samples) + \
+                '\n' + sampler.collapsed() + '\n'
+
+        profiler = CallProfiler()
+        camera.profiler = profiler
+        try:
+            time.sleep(seconds)
+        finally:
+            camera.profiler = None
+            # Let a recognize() call that started before the flag cleared finish
+            with profiler.lock:
+                pass
+        elapsed = time.perf_counter() - started
+        after = counters(camera, face_gallery)
+
+        output = io.StringIO()
+        output.write(header(camera, mode, elapsed, before, after) + '\n')
+        output.write(f'# recognize_calls={profiler.calls}\n')
+        if profiler.calls:
+            stats = pstats.Stats(profiler.profiler, stream=output)
+            stats.sort_stats(sort).print_stats(limit)
+            if dump:
+                stats.dump_stats(dump)
+        else:
+            output.write('# no frames were recognized while profiling\n')
+        return output.getvalue()
+
+    finally:
+        with _profiling_lock:
+            _profiling.discard(camera.camera_id)
@@ -0,0 +1,122 @@
+# attendance/quality.py
+"""
+Cheap face quality checks run between detection and encoding.
+
+Encoding is the most expensive step per face, and faces that are tiny,
+blurred or turned away produce encodings that will not match anyway.
+Each detected face is scored on box size, sharpness (variance of the
+Laplacian on a fixed-size crop, so the score does not depend on distance)
+and head pose from the landmarks the encoder needs regardless. Faces that
+fail are skipped for this frame; the same person is tried again on the
+next one.
+"""
+import math
+from collections import namedtuple
+import cv2
+import numpy as np
+
+# Faces are rescaled to this size before measuring sharpness
+SHARPNESS_SIZE = 64
+
+# Reasons a face is skipped, in the order they are checked
+REASONS = ('small', 'blurry', 'turned', 'tilted')
+
+DEFAULT_THRESHOLDS = {
+    # Shortest box side in pixels of the full frame, whatever resolution the face was detected at
+    'min_size': 40,
+    # Variance of the Laplacian of the 64x64 grayscale crop; sharp faces score several hundred
+    'min_sharpness': 50.0,
+    # Nose offset from the midpoint between the eyes, as a fraction of half the eye distance;
+    # 0 is frontal and about 1 is a 45 degree turn
+    'max_yaw': 0.6,
+    # Angle of the line through the eyes, in degrees; off by default because the
+    # encoder aligns in-plane rotation and tilted faces still match
+    'max_roll': None,
+}
+
+Quality = namedtuple('Quality', 'size sharpness yaw roll')
+
+
+def sharpness(face):
+    """Variance of the Laplacian of an RGB face crop, rescaled to SHARPNESS_SIZE"""
+    if face.size == 0:
+        return 0.0
+    face = cv2.resize(face, (SHARPNESS_SIZE, SHARPNESS_SIZE), interpolation=cv2.INTER_AREA)
+    face = cv2.cvtColor(face, cv2.COLOR_RGB2GRAY)
+    return float(cv2.Laplacian(face, cv2.CV_64F).var())
+
+
+def landmark_points(shape):
+    """(eye, eye, nose) points of a 5-point or 68-point dlib landmark shape"""
+    points = np.array([(part.x, part.y) for part in shape.parts()], dtype=np.float64)
+    if len(points) == 5:
+        # Two corners of each eye, then the base of the nose
+        return points[0:2].mean(axis=0), points[2:4].mean(axis=0), points[4]
+    return points[36:42].mean(axis=0), points[42:48].mean(axis=0), points[33]
+
+
+def pose(shape):
+    """(yaw, roll) of a face from its landmarks; see DEFAULT_THRESHOLDS for the units"""
+    first_eye, second_eye, nose = landmark_points(shape)
+    axis = second_eye - first_eye
+    length = axis @ axis
+    if length == 0:
+        return float('inf'), 0.0
+    # Where the nose falls along the eye line: 0.5 is halfway between the eyes
+    position = ((nose - first_eye) @ axis) / length
+    yaw = abs(position - 0.5) * 2
+    roll = math.degrees(math.atan2(axis[1], axis[0]))
+    # Eye order depends on the landmark model; only the line's angle matters
+    roll = abs((roll + 90) % 180 - 90)
+    return float(yaw), float(roll)
+
+
+class QualityGate:
+    """
+    Splits detected faces into those worth encoding and those to skip.
+
+    Thresholds set to None are not checked.
+    """
+
+    def __init__(self, enabled=True, **thresholds):
+        self.enabled = enabled
+        self.thresholds = {**DEFAULT_THRESHOLDS, **thresholds}
+
+    def score(self, image, location, shape, factor=1.0):
+        """Quality of one face of an RGB image that is 1/factor of the full frame's size"""
+        top, right, bottom, left = location
+        size = min(bottom - top, right - left) * factor
+        sharp = None
+        if self.thresholds['min_sharpness'] is not None:
+            sharp = sharpness(image[max(top, 0):bottom, max(left, 0):right])
+        yaw, roll = pose(shape)
+        return Quality(size, sharp, yaw, roll)
+
+    def reason(self, quality):
+        """First failed check, or None when the face is good enough to encode"""
+        thresholds = self.thresholds
+        if thresholds['min_size'] is not None and quality.size < thresholds['min_size']:
+            return 'small'
+        if (thresholds['min_sharpness'] is not None and quality.sharpness is not None
+                and quality.sharpness < thresholds['min_sharpness']):
+            return 'blurry'
+        if thresholds['max_yaw'] is not None and quality.yaw > thresholds['max_yaw']:
+            return 'turned'
+        if thresholds['max_roll'] is not None and quality.roll > thresholds['max_roll']:
+            return 'tilted'
+        return None
+
+    def check(self, image, locations, shapes, factor=1.0):
+        """
+        Skip reason (or None) per face of an RGB image, given its landmark shapes.
+
+        factor maps image pixels to full-frame pixels, so a 40px face in a
+        0.25 downscale counts as 160px, the same as when it is detected in
+        a full-resolution crop.
+        """
+        if not self.enabled:
+            return [None] * len(locations)
+        return [
+            self.reason(self.score(image, location, shape, factor))
+            for location, shape in zip(locations, shapes)
+        ]
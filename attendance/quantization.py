@@ -0,0 +1,148 @@
+# attendance/quantization.py
+"""
+Compact encoding storage for very large galleries.
+
+Encodings are kept twice: as float16 or int8 codes that stay resident and
+are scanned for every query, and as a full float32 copy in a memory-mapped
+temporary file that is only read for the few candidate rows of each query.
+At 1M students the resident part is 256MB (float16) or 128MB (int8)
+instead of 1GB of float64.
+"""
+import tempfile
+import numpy as np
+
+ENCODING_SIZE = 128
+
+CODE_TYPES = ('float16', 'int8')
+
+# dlib encodings stay well inside +-0.5; int8 codes cover that range and clip beyond it
+INT8_RANGE = 0.5
+INT8_SCALE = 127.0 / INT8_RANGE
+
+# Rows converted to float32 at a time during the coarse scan (8MB of scratch for int8)
+SCAN_BLOCK = 16384
+
+
+def encode(encodings, codes):
+    """Quantize float encodings to the given code type"""
+    if codes == 'int8':
+        return np.clip(np.rint(encodings * INT8_SCALE), -127, 127).astype(np.int8)
+    return np.asarray(encodings, dtype=np.float16)
+
+
+def decode(block, codes):
+    """Codes back to float32 approximations of the encodings"""
+    if codes == 'int8':
+        return block.astype(np.float32) / INT8_SCALE
+    return block.astype(np.float32)
+
+
+class QuantizedEncodings:
+    """
+    Preallocated code matrix plus its memory-mapped float32 original.
+
+    Rows are addressed like FaceGallery's own buffer: the gallery decides
+    which row a student occupies and moves the last row into holes.
+    """
+
+    def __init__(self, codes, capacity=0):
+        if codes not in CODE_TYPES:
+            raise ValueError(f'Unknown gallery quantization: {codes}')
+        self.codes = codes
+        self.capacity = 0
+        self._codes = np.empty((0, ENCODING_SIZE), dtype=np.dtype(codes))
+        self._norms = np.empty(0, dtype=np.float32)
+        self._file = None
+        self.full = np.empty((0, ENCODING_SIZE), dtype=np.float32)
+        if capacity:
+            self.grow(capacity)
+
+    def grow(self, capacity, size=None):
+        """Reallocate for capacity rows, keeping the first size rows"""
+        size = self.capacity if size is None else size
+        codes = np.empty((capacity, ENCODING_SIZE), dtype=self._codes.dtype)
+        norms = np.empty(capacity, dtype=np.float32)
+        codes[:size] = self._codes[:size]
+        norms[:size] = self._norms[:size]
+
+        # An unlinked temporary file: the OS pages rows in and out, and the file goes with the process
+        handle = tempfile.TemporaryFile(prefix='facepulse-gallery-')
+        full = np.memmap(handle, dtype=np.float32, mode='w+', shape=(max(capacity, 1), ENCODING_SIZE))
+        full[:size] = self.full[:size]
+
+        old_file = self._file
+        self._codes, self._norms, self.full, self._file = codes, norms, full, handle
+        self.capacity = capacity
+        if old_file is not None:
+            old_file.close()
+
+    def set(self, row, encoding):
+        encoding = np.asarray(encoding, dtype=np.float32)
+        self.full[row] = encoding
+        self._codes[row] = encode(encoding, self.codes)
+        decoded = decode(self._codes[row:row + 1], self.codes)[0]
+        self._norms[row] = decoded @ decoded
+
+    def assign(self, encodings):
+        """Replace every row with the given encodings"""
+        encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        if len(encodings) > self.capacity:
+            self.grow(len(encodings), size=0)
+        self.full[:len(encodings)] = encodings
+        for start in range(0, len(encodings), SCAN_BLOCK):
+            stop = start + SCAN_BLOCK
+            self._codes[start:stop] = encode(encodings[start:stop], self.codes)
+            decoded = decode(self._codes[start:stop], self.codes)
+            self._norms[start:stop] = np.einsum('ij,ij->i', decoded, decoded)
+
+    def move(self, source, target):
+        self.full[target] = self.full[source]
+        self._codes[target] = self._codes[source]
+        self._norms[target] = self._norms[source]
+
+    def candidates(self, queries, size, k):
+        """
+        Rows of the k nearest codes to each query, shape (queries, k).
+
+        The scan runs block by block on decoded codes using
+        ||c - q||^2 = ||c||^2 - 2cq + ||q||^2, dropping the per-query
+        constant, and keeps each block's k best.
+        """
+        k = min(k, size)
+        best_scores = np.full((len(queries), 0), np.inf, dtype=np.float32)
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        queries = np.asarray(queries, dtype=np.float32)
+
+        for start in range(0, size, SCAN_BLOCK):
+            stop = min(start + SCAN_BLOCK, size)
+            block = decode(self._codes[start:stop], self.codes)
+            scores = self._norms[start:stop][None, :] - 2.0 * (queries @ block.T)
+            if scores.shape[1] > k:
+                keep = np.argpartition(scores, k - 1, axis=1)[:, :k]
+                scores = np.take_along_axis(scores, keep, axis=1)
+            else:
+                keep = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+            best_scores = np.concatenate([best_scores, scores], axis=1)
+            best_rows = np.concatenate([best_rows, keep + start], axis=1)
+            if best_scores.shape[1] > k:
+                keep = np.argpartition(best_scores, k - 1, axis=1)[:, :k]
+                best_scores = np.take_along_axis(best_scores, keep, axis=1)
+                best_rows = np.take_along_axis(best_rows, keep, axis=1)
+
+        return best_rows
+
+    def search(self, queries, size, k):
+        """(best row, exact float32 distance) per query, re-ranking the k coarse candidates"""
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        rows = self.candidates(queries, size, k)
+        # Only these rows of the full-precision copy are read from the memory map
+        originals = self.full[rows.ravel()].reshape(len(queries), rows.shape[1], ENCODING_SIZE)
+        distances = np.linalg.norm(originals - queries[:, None, :], axis=2)
+        best = np.argmin(distances, axis=1)
+        picked = np.arange(len(queries))
+        return rows[picked, best], distances[picked, best]
+
+    def nbytes(self, size):
+        """(resident, memory-mapped) bytes used by size rows"""
+        resident = size * (self._codes.itemsize * ENCODING_SIZE + self._norms.itemsize)
+        return resident, size * ENCODING_SIZE * 4
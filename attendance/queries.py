@@ -0,0 +1,99 @@
+# attendance/queries.py
+import heapq
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Slowest statements kept per recording
+TOP_QUERIES = 5
+
+# Recorders active in the current context; sync_to_async copies the context,
+# so queries a view runs in a worker thread still reach its request's recorder
+_recorders = ContextVar('facepulse_query_recorders', default=())
+
+
+class QueryRecorder:
+    """Query count, total database time and the slowest statements of one block"""
+
+    def __init__(self, keep=TOP_QUERIES):
+        self.keep = keep
+        self.count = 0
+        self.seconds = 0.0
+        self._slowest = []
+
+    def add(self, sql, duration):
+        self.count += 1
+        self.seconds += duration
+        item = (duration, self.count, sql)
+        if len(self._slowest) < self.keep:
+            heapq.heappush(self._slowest, item)
+        else:
+            heapq.heappushpop(self._slowest, item)
+
+    def slowest(self):
+        """(seconds, sql) of the slowest statements, slowest first"""
+        return [(duration, sql) for duration, _, sql in sorted(self._slowest, reverse=True)]
+
+    def describe(self):
+        return '\n'.join(f'  {duration * 1000:.1f}ms {sql[:300]}' for duration, sql in self.slowest())
+
+
+def record_query(execute, sql, params, many, context):
+    """Execute wrapper installed on every connection; a single lookup when nothing is recording"""
+    recorders = _recorders.get()
+    if not recorders:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - started
+        for recorder in recorders:
+            recorder.add(sql, duration)
+
+
+def instrument_connection(connection):
+    """Install record_query once per connection; reconnects reuse the same wrapper list"""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_query)
+
+
+@contextmanager
+def recording():
+    """Record the queries run by this context, including nested recordings"""
+    recorder = QueryRecorder()
+    token = _recorders.set(_recorders.get() + (recorder,))
+    try:
+        yield recorder
+    finally:
+        _recorders.reset(token)
+
+
+def query_budget(queries):
+    """Declare the most queries a view may run per request; checked by RequestMetricsMiddleware"""
+    def decorator(view):
+        view.query_budget = queries
+        return view
+    return decorator
+
+
+@contextmanager
+def assert_query_budget(view=None, queries=None):
+    """
+    Test helper: fail if the block runs more queries than allowed.
+
+    The limit is `queries` or the budget the view declared with
+    @query_budget, so a test can exercise a view with realistic data and
+    catch an N+1 regression:
+
+        with assert_query_budget(views.students_api):
+            client.get(reverse('students_api'))
+    """
+    budget = queries if queries is not None else getattr(view, 'query_budget', None)
+    if budget is None:
+        raise ValueError(f'{view} declares no query budget')
+    with recording() as recorder:
+        yield recorder
+    if recorder.count > budget:
+        raise AssertionError(
+            f'{recorder.count} queries exceed the budget of {budget}; slowest:\n{recorder.describe()}')
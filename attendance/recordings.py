@@ -0,0 +1,198 @@
+# attendance/recordings.py
+import os
+import threading
+import time
+import uuid
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from django.db import connection, transaction
+from django.utils import timezone
+from .models import Student, Attendance, AttendanceSession
+from .gallery import gallery
+from .encoding import ENCODING_SETTINGS
+from .video import scan_video
+
+logger = logging.getLogger(__name__)
+
+# Same bar the live camera uses before marking a student present
+MIN_CONFIDENCE = 0.4
+
+# Finished upload jobs kept for status polling
+MAX_JOBS = 100
+
+
+def default_start(path, duration):
+    """Assume the recording ended when the file was last written"""
+    ended = datetime.fromtimestamp(os.path.getmtime(path), tz=timezone.get_current_timezone())
+    return ended - timedelta(seconds=duration)
+
+
+def process_recording(path, user=None, started_at=None, sample_rate=2.0, workers=None,
+                      tolerance=0.5, dry_run=False, face_gallery=None):
+    """
+    Recognize students in a recorded video and mark them present.
+
+    Each student is marked once, at the time of their first sighting in the
+    recording (started_at plus the frame offset). Returns a report with the
+    recognized students and decoding throughput.
+    """
+    face_gallery = gallery if face_gallery is None else face_gallery
+    if face_gallery.loaded:
+        face_gallery.refresh(force=True)
+    else:
+        face_gallery.load()
+
+    begin = time.perf_counter()
+    # Recordings are encoded like live camera frames
+    fps, frames_decoded, sightings = scan_video(
+        path, sample_rate, workers, **ENCODING_SETTINGS['live'])
+    decode_seconds = time.perf_counter() - begin
+
+    duration = frames_decoded / fps
+    started_at = started_at or default_start(path, duration)
+
+    frame_indexes = [frame_index for frame_index, faces in sightings for _ in faces]
+    encodings = [encoding for _, faces in sightings for _, encoding in faces]
+    matches = face_gallery.match_many(encodings, tolerance)
+
+    recognized = {}
+    for frame_index, match in zip(frame_indexes, matches):
+        if match is None:
+            continue
+        student_id, name, roll_no, distance = match
+        confidence = 1 - distance
+        if confidence <= MIN_CONFIDENCE:
+            continue
+        entry = recognized.get(student_id)
+        if entry is None:
+            recognized[student_id] = {
+                'id': student_id,
+                'name': name,
+                'roll_no': roll_no,
+                'confidence': confidence,
+                'sightings': 1,
+                'marked_at': started_at + timedelta(seconds=frame_index / fps),
+            }
+        else:
+            entry['sightings'] += 1
+            entry['confidence'] = max(entry['confidence'], confidence)
+
+    session = None
+    if not dry_run:
+        session = save_recording(path, user, started_at, duration, recognized.values())
+
+    elapsed = time.perf_counter() - begin
+    return {
+        'video': os.path.basename(path),
+        'session_id': session.id if session else None,
+        'started_at': started_at.isoformat(),
+        'duration_seconds': round(duration, 1),
+        'frames_decoded': frames_decoded,
+        'frames_with_faces': len(sightings),
+        'faces': len(encodings),
+        'elapsed_seconds': round(elapsed, 2),
+        'decode_fps': round(frames_decoded / decode_seconds, 1) if decode_seconds else 0.0,
+        'realtime_factor': round(duration / elapsed, 1) if elapsed else 0.0,
+        'recognized_students': [
+            {**entry, 'confidence': round(entry['confidence'], 3),
+             'marked_at': entry['marked_at'].isoformat()}
+            for entry in sorted(recognized.values(), key=lambda entry: entry['marked_at'])
+        ],
+    }
+
+
+def save_recording(path, user, started_at, duration, recognized):
+    """Write the session and one attendance record per recognized student"""
+    recognized = list(recognized)
+    students = Student.objects.in_bulk([entry['id'] for entry in recognized])
+
+    with transaction.atomic():
+        session = None
+        if user is not None:
+            session = AttendanceSession.objects.create(
+                name=f"Recording - {os.path.basename(path)}"[:100],
+                date=started_at.date(),
+                start_time=started_at,
+                end_time=started_at + timedelta(seconds=duration),
+                camera_id='recording',
+                is_active=False,
+                total_recognized=len(recognized),
+                created_by=user,
+            )
+
+        for entry in recognized:
+            student = students.get(entry['id'])
+            if student is None:
+                # Deleted since the gallery was loaded
+                continue
+            Attendance.mark_attendance(
+                student=student,
+                status='present',
+                confidence=entry['confidence'],
+                notes=f"Recording {os.path.basename(path)} - {entry['confidence']:.2f} confidence",
+                marked_at=entry['marked_at'],
+            )
+
+    return session
+
+
+class RecordingJob:
+    """
+    A recording processed in the background for the upload endpoint.
+
+    The uploaded file is deleted when the job ends, whether it succeeded
+    or not; the report keeps its name.
+    """
+
+    def __init__(self, path, user, **options):
+        self.id = uuid.uuid4().hex
+        self.path = path
+        self.user = user
+        self.options = options
+        self.status = 'queued'
+        self.report = None
+        self.error = None
+        self.thread = threading.Thread(
+            target=self.run, name=f'recording-{self.id[:8]}', daemon=True)
+
+    def run(self):
+        self.status = 'running'
+        try:
+            self.report = process_recording(self.path, self.user, **self.options)
+            self.status = 'done'
+        except Exception as e:
+            logger.error(f"Error processing recording {self.path}: {e}")
+            self.error = str(e)
+            self.status = 'failed'
+        finally:
+            connection.close()
+            try:
+                os.remove(self.path)
+            except OSError as e:
+                logger.warning(f"Could not delete uploaded recording {self.path}: {e}")
+
+    def stats(self):
+        return {
+            'job_id': self.id,
+            'video': os.path.basename(self.path),
+            'status': self.status,
+            'report': self.report,
+            'error': self.error,
+        }
+
+
+jobs = OrderedDict()
+jobs_lock = threading.Lock()
+
+
+def start_job(path, user, **options):
+    """Process a recording on a background thread; returns the job"""
+    job = RecordingJob(path, user, **options)
+    with jobs_lock:
+        jobs[job.id] = job
+        finished = [key for key, old in jobs.items() if old.status in ('done', 'failed')]
+        for key in finished[:max(0, len(jobs) - MAX_JOBS)]:
+            del jobs[key]
+    job.thread.start()
+    return job
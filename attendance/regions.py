@@ -0,0 +1,194 @@
+# attendance/regions.py
+"""
+Second, higher-resolution detection pass over parts of live frames.
+
+The live loop detects faces on a 0.25 downscale, which misses faces under
+about 160px in the full frame, such as students at the back of a large
+room. Detecting on the whole frame at full resolution costs four to
+sixteen times more, so after the coarse pass only candidate regions are
+re-scanned at a higher resolution:
+
+- back rows configured for the camera,
+- faces seen on the previous recognized frame that the coarse pass lost,
+- areas that changed since the previous recognized frame.
+
+Candidates are padded, merged and capped to a fraction of the frame, so a
+busy scene cannot make the second pass more expensive than a full scan.
+"""
+import cv2
+import face_recognition
+
+# Region sources in priority order; configured back rows are always scanned
+SOURCES = ('back_rows', 'lost', 'motion')
+
+DEFAULT_REFINEMENT = {
+    # Off by default; the camera turns it on for cameras with configured back rows
+    'enabled': False,
+    # Resolution of the second pass relative to the full frame; at 1.0 faces down
+    # to about 40px are found, against about 160px for the 0.25 coarse pass
+    'scale': 1.0,
+    'upsample': 1,
+    # Total area re-scanned for lost faces and motion, as a fraction of the frame
+    'max_area': 0.25,
+    'max_regions': 6,
+    'motion': True,
+    # Per-pixel change (0-255) and changed area (pixels of the downscaled frame) that count as motion
+    'motion_threshold': 25,
+    'min_motion_area': 16,
+    # Recognized frames a face the coarse pass lost keeps being re-scanned for
+    'lost_frames': 5,
+}
+
+
+def covered(box, boxes, threshold=0.5):
+    """Whether most of box (top, right, bottom, left) lies inside one of boxes"""
+    top, right, bottom, left = box
+    area = max(1, (bottom - top) * (right - left))
+    for other_top, other_right, other_bottom, other_left in boxes:
+        height = min(bottom, other_bottom) - max(top, other_top)
+        width = min(right, other_right) - max(left, other_left)
+        if height > 0 and width > 0 and height * width >= threshold * area:
+            return True
+    return False
+
+
+def pad(box, amount, height, width):
+    """Grow a box by amount times its size on every side, clipped to the frame"""
+    top, right, bottom, left = box
+    grow_y = int((bottom - top) * amount)
+    grow_x = int((right - left) * amount)
+    return (max(0, top - grow_y), min(width, right + grow_x),
+            min(height, bottom + grow_y), max(0, left - grow_x))
+
+
+def merge(regions):
+    """Union overlapping (box, source) regions; a merged region keeps its first source"""
+    regions = list(regions)
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(regions)):
+            for j in range(i + 1, len(regions)):
+                (a_top, a_right, a_bottom, a_left), source = regions[i]
+                b_top, b_right, b_bottom, b_left = regions[j][0]
+                if a_top < b_bottom and b_top < a_bottom and a_left < b_right and b_left < a_right:
+                    regions[i] = ((min(a_top, b_top), max(a_right, b_right),
+                                   max(a_bottom, b_bottom), min(a_left, b_left)), source)
+                    del regions[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return regions
+
+
+def area(box):
+    top, right, bottom, left = box
+    return (bottom - top) * (right - left)
+
+
+class RegionRefiner:
+    """
+    Per-camera state for the second detection pass.
+
+    back_rows are (left, top, right, bottom) fractions of the frame. For
+    each recognized frame the camera calls motion(), plan() with the coarse
+    pass's faces, detect() on the planned regions and finally track() with
+    every face found, in that order. All four run inside recognize(), which
+    the recognition pool never runs for two frames of one camera at once,
+    so the state here needs no lock even though successive frames may be
+    recognized on different worker threads.
+    """
+
+    def __init__(self, back_rows=(), **options):
+        self.options = {**DEFAULT_REFINEMENT, **options}
+        self.back_rows = [tuple(row) for row in back_rows]
+        self.enabled = self.options['enabled']
+        self.previous = None
+        self.tracks = []
+        self.lost = []
+
+    def motion(self, small_rgb, factor):
+        """Areas that changed since the previous call, as full-frame boxes"""
+        if not self.options['motion']:
+            return []
+        gray = cv2.GaussianBlur(cv2.cvtColor(small_rgb, cv2.COLOR_RGB2GRAY), (5, 5), 0)
+        previous, self.previous = self.previous, gray
+        if previous is None or previous.shape != gray.shape:
+            return []
+
+        changed = cv2.threshold(
+            cv2.absdiff(previous, gray), self.options['motion_threshold'], 255, cv2.THRESH_BINARY)[1]
+        changed = cv2.dilate(changed, None, iterations=2)
+        contours, _ = cv2.findContours(changed, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        boxes = []
+        for contour in contours:
+            if cv2.contourArea(contour) < self.options['min_motion_area']:
+                continue
+            x, y, w, h = cv2.boundingRect(contour)
+            boxes.append((int(y * factor), int((x + w) * factor),
+                          int((y + h) * factor), int(x * factor)))
+        return boxes
+
+    def plan(self, shape, faces, motion=()):
+        """
+        Regions to re-scan given the coarse pass's full-frame face boxes.
+
+        Returns (box, source) pairs; faces the coarse pass already found
+        are not re-scanned for.
+        """
+        height, width = shape[:2]
+        options = self.options
+
+        # A face from the last pass that the coarse pass no longer sees is searched for nearby,
+        # for as long as the second pass keeps finding it and lost_frames passes after that
+        lost = [[box, options['lost_frames']] for box in self.tracks if not covered(box, faces)]
+        lost.extend(
+            [box, left - 1] for box, left in self.lost
+            if left > 1 and not covered(box, faces) and not covered(box, [entry[0] for entry in lost]))
+        self.lost = lost
+
+        regions = [
+            ((int(top * height), int(right * width), int(bottom * height), int(left * width)), 'back_rows')
+            for left, top, right, bottom in self.back_rows
+        ]
+        regions.extend((pad(box, 1.0, height, width), 'lost') for box, _ in lost)
+        regions.extend(
+            (pad(box, 0.2, height, width), 'motion')
+            for box in sorted(motion, key=area) if not covered(box, faces, 0.3))
+
+        budget = options['max_area'] * height * width
+        planned = []
+        for box, source in merge(regions):
+            if source != 'back_rows':
+                if len(planned) >= options['max_regions'] or area(box) > budget:
+                    continue
+                budget -= area(box)
+            planned.append((box, source))
+        return planned
+
+    def detect(self, frame, regions):
+        """
+        Faces inside each region of a full-size BGR frame.
+
+        Returns (rgb, locations, (top, left), factor, source) per region,
+        where rgb is the region at the refinement scale and a location maps
+        back to the full frame as location * factor + (top, left).
+        """
+        scale = self.options['scale']
+        results = []
+        for (top, right, bottom, left), source in regions:
+            crop = frame[top:bottom, left:right]
+            if crop.size == 0:
+                continue
+            if scale != 1.0:
+                crop = cv2.resize(crop, (0, 0), fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+            rgb = cv2.cvtColor(crop, cv2.COLOR_BGR2RGB)
+            locations = face_recognition.face_locations(
+                rgb, number_of_times_to_upsample=self.options['upsample'])
+            results.append((rgb, locations, (top, left), 1 / scale, source))
+        return results
+
+    def track(self, faces):
+        """Remember the full-frame boxes of every face found, for lost-face regions next time"""
+        self.tracks = list(faces)
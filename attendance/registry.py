@@ -0,0 +1,192 @@
+# attendance/registry.py
+import threading
+import logging
+from collections import OrderedDict
+from urllib.parse import urlsplit
+from django.conf import settings
+from .camera import FaceRecognitionCamera, DEFAULT_CAMERA
+from .gallery import gallery
+from .streaming import FrameHub
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# camera id -> device index, RTSP/HTTP URL or video file path
+CAMERA_SOURCES = getattr(settings, 'FACEPULSE_CAMERAS', {DEFAULT_CAMERA: 0})
+RECOGNITION_WORKERS = getattr(settings, 'FACEPULSE_RECOGNITION_WORKERS', 2)
+
+
+def describe_source(source):
+    """Source for display, without credentials embedded in stream URLs"""
+    source = str(source)
+    parts = urlsplit(source)
+    if parts.scheme and '@' in parts.netloc:
+        return source.replace(parts.netloc, parts.netloc.rpartition('@')[2], 1)
+    return source
+
+
+class RecognitionPool:
+    """
+    Recognition workers shared by every camera.
+
+    Each camera has at most one frame queued and one being recognized; a
+    newer frame replaces the queued one, so a camera that falls behind skips
+    frames instead of building a backlog. Workers take cameras in the order
+    they queued, so a crowded room cannot starve the others.
+    """
+
+    def __init__(self, workers=RECOGNITION_WORKERS):
+        self.workers = max(1, workers)
+        self.condition = threading.Condition()
+        self.queue = OrderedDict()
+        self.running = set()
+        # worker thread ident -> camera id it is recognizing, read by the stack sampler
+        self.busy = {}
+        self.threads = []
+        self.replaced = 0
+        self.completed = 0
+
+    def _start(self):
+        while len(self.threads) < self.workers:
+            thread = threading.Thread(
+                target=self._work, daemon=True,
+                name=f'recognition-{len(self.threads) + 1}')
+            self.threads.append(thread)
+            thread.start()
+
+    def submit(self, camera, frame):
+        """Queue a prepared frame, replacing any frame the camera still has waiting"""
+        with self.condition:
+            self._start()
+            replacing = camera.camera_id in self.queue
+            # Replacing keeps the camera's place in the queue
+            self.queue[camera.camera_id] = (camera, frame)
+            if replacing:
+                self.replaced += 1
+                metrics.counter(
+                    'facepulse_recognition_skipped_total',
+                    'Frames replaced by a newer one before recognition started',
+                    camera=camera.camera_id).inc()
+            else:
+                self.condition.notify()
+
+    def cancel(self, camera_id):
+        """Drop a camera's queued frame, if any; a frame already being recognized finishes"""
+        with self.condition:
+            return self.queue.pop(camera_id, None) is not None
+
+    def _next_job(self):
+        for camera_id in self.queue:
+            # Never recognize two frames of one camera at once
+            if camera_id not in self.running:
+                return camera_id, self.queue.pop(camera_id)
+        return None
+
+    def _work(self):
+        while True:
+            with self.condition:
+                job = self._next_job()
+                while job is None:
+                    self.condition.wait()
+                    job = self._next_job()
+                camera_id, (camera, frame) = job
+                self.running.add(camera_id)
+                self.busy[threading.get_ident()] = camera_id
+
+            try:
+                camera.process(frame)
+            except Exception as e:
+                logger.error(f"Recognition error on camera {camera_id}: {e}")
+            finally:
+                with self.condition:
+                    self.running.discard(camera_id)
+                    self.busy.pop(threading.get_ident(), None)
+                    self.completed += 1
+                    # A frame for this camera may have queued while it was busy
+                    if camera_id in self.queue:
+                        self.condition.notify()
+
+    def stats(self):
+        with self.condition:
+            return {
+                'workers': self.workers,
+                'queued': len(self.queue),
+                'running': len(self.running),
+                'completed': self.completed,
+                'replaced': self.replaced,
+            }
+
+
+class CameraRegistry:
+    """
+    Cameras by id, each with its own session, state and frame hub.
+
+    Cameras are created on first use from FACEPULSE_CAMERAS and all share one
+    face gallery and one recognition pool.
+    """
+
+    def __init__(self, sources=None, face_gallery=None, pool=None):
+        self.sources = dict(CAMERA_SOURCES if sources is None else sources)
+        self.gallery = gallery if face_gallery is None else face_gallery
+        self.pool = RecognitionPool() if pool is None else pool
+        self.lock = threading.Lock()
+        self.cameras = {}
+        self.hubs = {}
+
+    def __contains__(self, camera_id):
+        return camera_id in self.sources
+
+    def __iter__(self):
+        return iter(self.sources)
+
+    def _create(self, camera_id):
+        with self.lock:
+            if camera_id not in self.cameras:
+                if camera_id not in self.sources:
+                    raise KeyError(camera_id)
+                camera = FaceRecognitionCamera(
+                    camera_id, self.sources[camera_id], self.gallery, self.pool)
+                self.hubs[camera_id] = FrameHub(camera)
+                self.cameras[camera_id] = camera
+            return self.cameras[camera_id]
+
+    def camera(self, camera_id=DEFAULT_CAMERA):
+        """Camera for an id; raises KeyError for ids that are not configured"""
+        return self.cameras.get(camera_id) or self._create(camera_id)
+
+    def hub(self, camera_id=DEFAULT_CAMERA):
+        """Frame hub streaming a camera"""
+        self.camera(camera_id)
+        return self.hubs[camera_id]
+
+    def active(self):
+        """Cameras that are currently capturing"""
+        return [camera for camera in list(self.cameras.values()) if camera.is_active]
+
+    def refresh_counts(self):
+        """Recount attendance totals after a change made outside the recognizers"""
+        for camera in list(self.cameras.values()):
+            camera.snapshot.refresh_counts()
+
+    def stats(self):
+        """Per-camera state plus the shared gallery and pool"""
+        cameras = {}
+        for camera_id, source in self.sources.items():
+            camera = self.cameras.get(camera_id)
+            cameras[camera_id] = {
+                'source': describe_source(source),
+                'active': bool(camera and camera.is_active),
+                'frame_count': camera.frame_count if camera else 0,
+                'session_recognized': len(camera.attendance_marked) if camera else 0,
+                'viewers': self.hubs[camera_id].stats()['subscriber_count'] if camera else 0,
+            }
+        return {
+            'cameras': cameras,
+            'gallery_size': len(self.gallery),
+            'gallery_version': self.gallery.version,
+            'recognition': self.pool.stats(),
+        }
+
+
+# Shared by every view in this process
+registry = CameraRegistry()
@@ -0,0 +1,216 @@
+# attendance/replay.py
+"""
+Record camera sessions to a compact file and replay them as a camera.
+
+A recording is a short header followed by one JPEG per frame, each with
+the seconds since the first frame. ReplaySource reads it back behind the
+cv2.VideoCapture interface, either paced by those timestamps (optionally
+sped up) or as fast as frames can be decoded. Every replay yields the same
+frames in the same order, so pipeline runs can be compared.
+"""
+import json
+import struct
+import threading
+import time
+from datetime import datetime, timezone
+from urllib.parse import parse_qs
+import cv2
+import numpy as np
+
+MAGIC = b'FPREC\x00\x01\n'
+FRAME_HEADER = struct.Struct('<dI')  # seconds since first frame, JPEG length
+HEADER_LENGTH = struct.Struct('<I')
+
+# Camera sources starting with this are replayed recordings:
+# replay:/path/to/session.fprec?speed=2&loop=1 (speed=0 is as fast as possible)
+REPLAY_PREFIX = 'replay:'
+
+
+def is_replay(source):
+    return str(source).startswith(REPLAY_PREFIX)
+
+
+def parse_replay(source):
+    """(path, speed, loop) of a replay: camera source"""
+    path, _, query = str(source)[len(REPLAY_PREFIX):].partition('?')
+    options = parse_qs(query)
+    speed = float(options.get('speed', ['1'])[0])
+    loop = options.get('loop', ['0'])[0] not in ('0', 'false', '')
+    return path, speed, loop
+
+
+class FrameRecorder:
+    """
+    Append timestamped frames to a recording file.
+
+    The header is written with the first frame, once its size is known.
+    write() and close() may be called from different threads; frames
+    written after close() are ignored.
+    """
+
+    def __init__(self, path, fps=30.0, quality=90, camera_id=''):
+        self.path = path
+        self.fps = fps
+        self.quality = quality
+        self.camera_id = camera_id
+        self.lock = threading.Lock()
+        self.file = open(path, 'wb')
+        self.started = None
+        self.frames_written = 0
+        self.bytes_written = 0
+
+    def _write_header(self, frame):
+        header = json.dumps({
+            'width': frame.shape[1],
+            'height': frame.shape[0],
+            'fps': self.fps,
+            'quality': self.quality,
+            'camera_id': self.camera_id,
+            'recorded_at': datetime.now(timezone.utc).isoformat(),
+        }).encode()
+        self.file.write(MAGIC + HEADER_LENGTH.pack(len(header)) + header)
+
+    def write(self, frame, timestamp=None):
+        """Add a BGR frame; timestamp is seconds since the first frame (default: now)"""
+        now = time.monotonic()
+        success, jpeg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        if not success:
+            return False
+        with self.lock:
+            if self.file is None:
+                return False
+            if self.started is None:
+                self.started = now
+                self._write_header(frame)
+            if timestamp is None:
+                timestamp = now - self.started
+            data = jpeg.tobytes()
+            self.file.write(FRAME_HEADER.pack(timestamp, len(data)))
+            self.file.write(data)
+            self.frames_written += 1
+            self.bytes_written += FRAME_HEADER.size + len(data)
+        return True
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def read_header(file):
+    if file.read(len(MAGIC)) != MAGIC:
+        raise ValueError(f'Not a frame recording: {file.name}')
+    (length,) = HEADER_LENGTH.unpack(file.read(HEADER_LENGTH.size))
+    return json.loads(file.read(length))
+
+
+def index_frames(file):
+    """(offset, timestamp) of every frame, found by hopping over the JPEG payloads"""
+    index = []
+    while True:
+        offset = file.tell()
+        record = file.read(FRAME_HEADER.size)
+        if len(record) < FRAME_HEADER.size:
+            break
+        timestamp, length = FRAME_HEADER.unpack(record)
+        file.seek(length, 1)
+        index.append((offset, timestamp))
+    return index
+
+
+class ReplaySource:
+    """
+    A recording behind the parts of the cv2.VideoCapture interface the camera uses.
+
+    speed 1 replays at the recorded pace, 2 twice as fast, 0 as fast as
+    frames decode. A replay that falls behind its schedule never skips
+    frames, so every run sees exactly the recorded sequence.
+    """
+
+    def __init__(self, path, speed=1.0, loop=False):
+        self.path = path
+        self.speed = speed
+        self.loop = loop
+        self.file = open(path, 'rb')
+        try:
+            self.header = read_header(self.file)
+            self.index = index_frames(self.file)
+        except Exception:
+            self.file.close()
+            raise
+        self.position = 0
+        self.started = None
+
+    def isOpened(self):
+        return self.file is not None
+
+    def read(self):
+        if self.file is None:
+            return False, None
+        if self.position >= len(self.index):
+            if not self.loop or not self.index:
+                return False, None
+            self.position = 0
+            self.started = None
+
+        offset, timestamp = self.index[self.position]
+        if self.speed > 0:
+            now = time.monotonic()
+            if self.started is None:
+                self.started = now - timestamp / self.speed
+            delay = self.started + timestamp / self.speed - now
+            if delay > 0:
+                time.sleep(delay)
+
+        self.file.seek(offset)
+        _, length = FRAME_HEADER.unpack(self.file.read(FRAME_HEADER.size))
+        data = np.frombuffer(self.file.read(length), dtype=np.uint8)
+        self.position += 1
+        frame = cv2.imdecode(data, cv2.IMREAD_COLOR)
+        return frame is not None, frame
+
+    def grab(self):
+        success, _ = self.read()
+        return success
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FPS:
+            return float(self.header.get('fps') or 0)
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self.header['width'])
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self.header['height'])
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return float(len(self.index))
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            return float(self.position)
+        return 0.0
+
+    def set(self, prop, value):
+        if prop == cv2.CAP_PROP_POS_FRAMES and 0 <= value <= len(self.index):
+            self.position = int(value)
+            self.started = None
+            return True
+        return False
+
+    def release(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    @property
+    def duration(self):
+        return self.index[-1][1] if self.index else 0.0
+
+
+def open_replay(source):
+    """ReplaySource for a replay: camera source"""
+    path, speed, loop = parse_replay(source)
+    return ReplaySource(path, speed=speed, loop=loop)
@@ -0,0 +1,102 @@
+# attendance/shortlist.py
+"""
+Students recently recognized on a camera, searched before the gallery.
+
+Within a session most faces in view belong to students the camera already
+recognized, so each encoding is first compared with a few dozen recent
+identities. A shortlisted student is accepted without a gallery search
+only when the face is provably closest to them: besides being within
+accept_distance and the camera's tolerance, the face must be closer than
+half the distance from the student's gallery encoding to the nearest
+other student. By the triangle inequality every other student is then
+further away, so a hit gives the same answer as the full search.
+"""
+import threading
+from collections import OrderedDict
+import numpy as np
+
+DEFAULT_SHORTLIST = {
+    'enabled': True,
+    # Identities kept per camera; the least recently matched is evicted first
+    'size': 32,
+    # Furthest a face may be from a shortlisted encoding to be accepted
+    'accept_distance': 0.4,
+}
+
+
+class RecentShortlist:
+    """
+    LRU of (encoding, name, roll number, radius) by student id for one camera.
+
+    search returns the gallery the camera decides with; the shortlist is
+    emptied whenever that gallery is written to (its generation changes),
+    since a new or re-encoded student may sit closer to a shortlisted one
+    than before. tolerance is the furthest the gallery search matches at.
+    """
+
+    def __init__(self, search, tolerance, enabled=True, size=32, accept_distance=0.4):
+        self.search = search
+        self.tolerance = tolerance
+        self.enabled = enabled
+        self.size = size
+        self.accept_distance = accept_distance
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            self.entries = OrderedDict()
+            self.gallery = None
+            self.generation = None
+            self._ids = []
+            self._encodings = None
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _check_gallery(self):
+        gallery = self.search()
+        if gallery is not self.gallery or gallery.generation != self.generation:
+            self.entries.clear()
+            self._encodings = None
+            self.gallery, self.generation = gallery, gallery.generation
+        return gallery
+
+    def lookup(self, encoding):
+        """(student_id, name, roll_no, distance) when a shortlisted student is certainly the best match"""
+        if not self.enabled:
+            return None
+        with self.lock:
+            self._check_gallery()
+            if not self.entries:
+                return None
+            if self._encodings is None:
+                self._ids = list(self.entries)
+                self._encodings = np.array([self.entries[student_id][0] for student_id in self._ids])
+            distances = np.linalg.norm(self._encodings - encoding, axis=1)
+            best = int(np.argmin(distances))
+            distance = float(distances[best])
+            student_id = self._ids[best]
+            _, name, roll_no, radius = self.entries[student_id]
+            if distance > min(self.accept_distance, self.tolerance) or distance >= radius:
+                return None
+            self.entries.move_to_end(student_id)
+            return student_id, name, roll_no, distance
+
+    def add(self, student_id):
+        """Shortlist a student the full search just matched"""
+        if not self.enabled:
+            return
+        with self.lock:
+            gallery = self._check_gallery()
+            if student_id in self.entries:
+                self.entries.move_to_end(student_id)
+                return
+            neighbour = gallery.nearest_other(student_id)
+            if neighbour is None:
+                return
+            encoding, name, roll_no, separation = neighbour
+            self.entries[student_id] = (encoding, name, roll_no, separation / 2)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+            self._encodings = None
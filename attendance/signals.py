@@ -0,0 +1,51 @@
+# attendance/signals.py
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+from .models import Student, GalleryChange
+from .queries import instrument_connection
+
+# Fields that running recognizers keep in memory
+GALLERY_FIELDS = {'face_encoding', 'name', 'roll_no'}
+
+
+@receiver(post_save, sender=Student)
+def publish_student_saved(sender, instance, created, update_fields=None, **kwargs):
+    """Publish a gallery delta when a student's recognition data may have changed"""
+    if update_fields is not None and not GALLERY_FIELDS.intersection(update_fields):
+        return
+    if created and instance.face_encoding is None:
+        return
+    GalleryChange.publish(instance.id, 'upsert')
+
+
+@receiver(post_delete, sender=Student)
+def publish_student_deleted(sender, instance, **kwargs):
+    """Publish a gallery delta when a student is removed"""
+    GalleryChange.publish(instance.id, 'delete')
+
+
+@receiver(m2m_changed, sender=Student.classes.through)
+def publish_class_membership(sender, instance, action, reverse, pk_set, **kwargs):
+    """Class membership is part of the gallery; republish the students whose classes changed"""
+    if action == 'pre_clear' and reverse:
+        # The removed students are only known before the clear
+        instance._cleared_student_ids = list(instance.students.values_list('id', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if not reverse:
+        student_ids = [instance.id]
+    elif action == 'post_clear':
+        student_ids = getattr(instance, '_cleared_student_ids', [])
+    else:
+        student_ids = pk_set or []
+    for student_id in student_ids:
+        GalleryChange.publish(student_id, 'upsert')
+
+
+@receiver(connection_created)
+def record_connection_queries(sender, connection, **kwargs):
+    """Let request and test recordings see every query on new connections"""
+    instrument_connection(connection)
@@ -0,0 +1,136 @@
+# attendance/snapshot.py
+import bisect
+import json
+import threading
+import time
+import logging
+from datetime import date
+from .models import Student, Attendance
+
+logger = logging.getLogger(__name__)
+
+
+class StatusSnapshot:
+    """
+    In-memory attendance status kept current by the recognizer.
+
+    Every change bumps version, which is exposed as an ETag of the form
+    "<token>-<version>". The token is unique per process, so a tag issued by
+    another process or before a restart never matches. The recognized list
+    remembers the version each student was added at, so a client can ask for
+    only the entries added after the version it already has.
+    """
+
+    def __init__(self, count_interval=60.0):
+        self.lock = threading.Lock()
+        self.token = f'{time.time_ns():x}'
+        self.count_interval = count_interval
+        self.version = 0
+        self.reset_version = 0
+        self.total_students = 0
+        self.present_count = 0
+        self.present_date = None
+        self.counted_at = 0.0
+        self.recognition_active = False
+        self.recognized = []
+        self._body = None
+
+    @property
+    def etag(self):
+        return f'"{self.token}-{self.version}"'
+
+    def _changed(self):
+        self.version += 1
+        self._body = None
+
+    def refresh_counts(self):
+        """Recount students and today's present records from the database"""
+        try:
+            today = date.today()
+            total = Student.objects.count()
+            present = Attendance.objects.filter(
+                date=today, status='present').count()
+        except Exception as e:
+            logger.error(f"Error counting attendance: {e}")
+            return
+
+        with self.lock:
+            self.counted_at = time.monotonic()
+            if (total, present, today) != (self.total_students, self.present_count, self.present_date):
+                self.total_students = total
+                self.present_count = present
+                self.present_date = today
+                self._changed()
+
+    def maybe_refresh_counts(self):
+        """Recount if the counts are stale or the day has rolled over"""
+        if (time.monotonic() - self.counted_at >= self.count_interval
+                or self.present_date != date.today()):
+            self.refresh_counts()
+
+    def start_session(self):
+        with self.lock:
+            self.recognition_active = True
+            self.recognized = []
+            self._changed()
+            self.reset_version = self.version
+        self.refresh_counts()
+
+    def stop_session(self):
+        with self.lock:
+            self.recognition_active = False
+            self._changed()
+
+    def add_recognized(self, data, created):
+        """Append a recognized student; created means a new present record for today"""
+        with self.lock:
+            self._changed()
+            self.recognized.append((self.version, data))
+            if created and self.present_date == date.today():
+                self.present_count += 1
+
+    def parse_version(self, tag):
+        """Version number of an ETag or since value from this snapshot, or None"""
+        tag = (tag or '').strip().strip('"')
+        if tag.startswith('W/'):
+            tag = tag[2:].strip('"')
+        token, _, version = tag.rpartition('-')
+        if token != self.token or not version.isdigit():
+            return None
+        return int(version)
+
+    def not_modified(self, if_none_match):
+        """Whether an If-None-Match header already names the current version"""
+        if not if_none_match:
+            return False
+        return any(
+            self.parse_version(tag) == self.version
+            for tag in if_none_match.split(',')
+        )
+
+    def body(self, since=None):
+        """JSON body for attendance_status; a delta when since is a version of this session"""
+        with self.lock:
+            delta = since is not None and self.reset_version <= since <= self.version
+            if not delta and self._body is not None:
+                return self._body, self.etag
+
+            first = bisect.bisect_right(
+                self.recognized, since, key=lambda entry: entry[0]) if delta else 0
+            payload = {
+                'success': True,
+                'version': f'{self.token}-{self.version}',
+                'delta': delta,
+                'total_students': self.total_students,
+                'present_count': self.present_count,
+                'recognition_active': self.recognition_active,
+                'session_recognized': len(self.recognized),
+                'recognized_students': [
+                    {'id': data['id'], 'name': data['name'], 'roll_no': data['roll_no']}
+                    for _, data in self.recognized[first:]
+                ],
+            }
+            body = json.dumps(payload)
+            if not delta:
+                self._body = body
+            return body, self.etag
@@ -0,0 +1,332 @@
+# attendance/streaming.py
+import asyncio
+import itertools
+import threading
+import time
+import logging
+import cv2
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+BOUNDARY = b'--frame\r\nContent-Type: image/jpeg\r\n\r\n'
+
+# width=None keeps the camera resolution; fps caps how often a profile is encoded
+STREAM_PROFILES = getattr(settings, 'FACEPULSE_STREAM_PROFILES', {
+    'thumbnail': {'width': 320, 'quality': 60, 'fps': 5},
+    'standard': {'width': 640, 'quality': 75, 'fps': 15},
+    'full': {'width': None, 'quality': 85, 'fps': 30},
+})
+DEFAULT_PROFILE = 'full'
+
+
+def multipart_chunk(jpeg):
+    """Wrap one JPEG in an MJPEG multipart chunk"""
+    return BOUNDARY + jpeg + b'\r\n'
+
+
+def is_asgi(request):
+    """Whether the request is served by the ASGI handler and can stream from async generators"""
+    return isinstance(request, ASGIRequest)
+
+
+class Subscriber:
+    """Delivery statistics for one connected viewer"""
+    _ids = itertools.count(1)
+
+    def __init__(self, profile):
+        self.id = next(self._ids)
+        self.profile = profile
+        self.connected_at = time.time()
+        self.last_sequence = 0
+        self.delivered = 0
+        self.dropped = 0
+
+    def stats(self):
+        seen = self.delivered + self.dropped
+        return {
+            'id': self.id,
+            'profile': self.profile,
+            'connected_seconds': round(time.time() - self.connected_at, 1),
+            'delivered': self.delivered,
+            'dropped': self.dropped,
+            'drop_rate': round(self.dropped / seen, 3) if seen else 0.0,
+        }
+
+
+class LoopWaiter:
+    """
+    Shared wake-up future for all async viewers on one event loop.
+
+    The producer schedules a single wake per loop per frame, no matter how
+    many viewers are waiting on that loop.
+    """
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.future = loop.create_future()
+        self.viewers = 0
+
+    def wake(self):
+        future, self.future = self.future, self.loop.create_future()
+        future.set_result(None)
+
+
+class ProfileChannel:
+    """Latest encoded frame for one resolution/quality/fps profile"""
+
+    def __init__(self, name, width=None, quality=85, fps=30):
+        self.name = name
+        self.width = width
+        self.params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+        self.interval = 1.0 / fps if fps else 0.0
+        # (sequence, jpeg) replaced as a whole so async readers need no lock
+        self.latest = (0, None)
+        self.subscribers = {}
+        self.next_due = 0.0
+        self.resized = None
+
+    @property
+    def sequence(self):
+        return self.latest[0]
+
+    def due(self, now):
+        return bool(self.subscribers) and now >= self.next_due
+
+    def encode(self, frame, now):
+        """Scale into a reused buffer and JPEG-encode; returns the bytes or None"""
+        # Deadlines advance from the previous deadline, not from when the frame arrived, so
+        # frames arriving a little late do not lower the rate; once a whole interval behind
+        # (say after an idle spell) the schedule restarts one interval from now
+        self.next_due += self.interval
+        if self.next_due < now:
+            self.next_due = now + self.interval
+        height, width = frame.shape[:2]
+        if self.width and self.width < width:
+            size = (self.width, round(height * self.width / width))
+            if self.resized is not None and self.resized.shape[1::-1] != size:
+                self.resized = None
+            self.resized = cv2.resize(
+                frame, size, dst=self.resized, interpolation=cv2.INTER_AREA)
+            frame = self.resized
+        ret, buffer = cv2.imencode('.jpg', frame, self.params)
+        return buffer.tobytes() if ret else None
+
+
+class FrameHub:
+    """
+    Single producer for a camera, fanned out to any number of viewers.
+
+    One thread reads and recognizes frames. Frames are annotated only when at
+    least one profile is due, and each profile is encoded at most once per
+    frame, only while someone is subscribed to it and no faster than its fps
+    cap; with no viewers the thread does recognition alone. Viewers only
+    ever read the latest frame of their profile, so a slow client skips
+    frames (counted as drops) instead of holding back the producer or other
+    viewers.
+    """
+
+    def __init__(self, camera, profiles=None):
+        self.camera = camera
+        self.condition = threading.Condition()
+        self.thread = None
+        self.channels = {
+            name: ProfileChannel(name, **options)
+            for name, options in (profiles or STREAM_PROFILES).items()
+        }
+        self.loop_waiters = {}
+        self.frames_rendered = 0
+        camera_id = getattr(camera, 'camera_id', 'default')
+        self.jpeg_timer = metrics.histogram(
+            'facepulse_stage_seconds', 'Time spent in each pipeline stage',
+            camera=camera_id, stage='jpeg')
+        self.dropped_counter = metrics.counter(
+            'facepulse_frames_dropped_total', 'Frames skipped by slow viewers', camera=camera_id)
+
+    @property
+    def sequence(self):
+        return max(channel.sequence for channel in self.channels.values())
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    @property
+    def has_viewers(self):
+        return any(channel.subscribers for channel in self.channels.values())
+
+    def channel(self, profile):
+        """Channel for a profile name, falling back to the default profile"""
+        return self.channels.get(profile) or self.channels.get(DEFAULT_PROFILE) \
+            or next(iter(self.channels.values()))
+
+    def start(self):
+        """Start the producer thread if it is not already running"""
+        with self.condition:
+            if self.running:
+                return
+            self.thread = threading.Thread(
+                target=self._produce, daemon=True,
+                name=f"frame-hub-{getattr(self.camera, 'camera_id', 'default')}")
+            self.thread.start()
+
+    def stop(self, timeout=2.0):
+        """
+        Stop the camera loop and wake every viewer so it can disconnect.
+
+        Waits up to timeout for the producer to exit. One still blocked in
+        a read releases the capture itself once the read returns.
+        """
+        self.camera.is_active = False
+        thread = self.thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+        self.wake_all()
+
+    def wake_all(self):
+        """Wake threaded and async viewers"""
+        with self.condition:
+            self.condition.notify_all()
+            waiters = list(self.loop_waiters.values())
+        for waiter in waiters:
+            try:
+                waiter.loop.call_soon_threadsafe(waiter.wake)
+            except RuntimeError:
+                # Loop already closed
+                pass
+
+    def _produce(self):
+        try:
+            for frame in self.camera.frames():
+                now = time.monotonic()
+                # Profiles nobody is watching are never encoded
+                due = [channel for channel in self.channels.values() if channel.due(now)]
+                if not due:
+                    # Recognition still ran; skip drawing as well as encoding
+                    continue
+
+                self.camera.annotate(frame)
+                self.frames_rendered += 1
+                published = False
+                for channel in due:
+                    started = time.perf_counter()
+                    jpeg = channel.encode(frame, now)
+                    self.jpeg_timer.since(started)
+                    if jpeg is not None:
+                        with self.condition:
+                            channel.latest = (channel.sequence + 1, jpeg)
+                        published = True
+                if published:
+                    self.wake_all()
+        except Exception as e:
+            logger.error(f"Frame producer error: {e}")
+        finally:
+            self.wake_all()
+
+    def next_frame(self, subscriber, timeout=5.0):
+        """Block until a frame newer than the subscriber's last one exists; None once stopped"""
+        channel = self.channels[subscriber.profile]
+        with self.condition:
+            while channel.sequence <= subscriber.last_sequence:
+                if not self.running:
+                    return None
+                self.condition.wait(timeout)
+            sequence, jpeg = channel.latest
+
+        return self._deliver(subscriber, sequence, jpeg)
+
+    async def next_frame_async(self, subscriber, waiter, timeout=5.0):
+        """Async variant of next_frame; waits on the loop instead of a thread"""
+        channel = self.channels[subscriber.profile]
+        while channel.sequence <= subscriber.last_sequence:
+            if not self.running:
+                return None
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter.future), timeout)
+            except asyncio.TimeoutError:
+                pass
+        sequence, jpeg = channel.latest
+        return self._deliver(subscriber, sequence, jpeg)
+
+    def _deliver(self, subscriber, sequence, jpeg):
+        if subscriber.last_sequence:
+            dropped = sequence - subscriber.last_sequence - 1
+            if dropped:
+                subscriber.dropped += dropped
+                self.dropped_counter.inc(dropped)
+        subscriber.last_sequence = sequence
+        subscriber.delivered += 1
+        return jpeg
+
+    def _attach(self, profile):
+        channel = self.channel(profile)
+        subscriber = Subscriber(channel.name)
+        with self.condition:
+            # Start from the current frame instead of counting history as drops
+            subscriber.last_sequence = max(0, channel.sequence - 1)
+            channel.subscribers[subscriber.id] = subscriber
+        return subscriber
+
+    def _detach(self, subscriber):
+        with self.condition:
+            self.channels[subscriber.profile].subscribers.pop(subscriber.id, None)
+
+    def subscribe(self, profile=DEFAULT_PROFILE):
+        """Yield MJPEG multipart chunks for one viewer until the stream stops"""
+        subscriber = self._attach(profile)
+        try:
+            while True:
+                jpeg = self.next_frame(subscriber)
+                if jpeg is None:
+                    break
+                yield multipart_chunk(jpeg)
+        finally:
+            self._detach(subscriber)
+
+    async def async_subscribe(self, profile=DEFAULT_PROFILE):
+        """Async generator of MJPEG chunks; no thread is held while waiting for frames"""
+        loop = asyncio.get_running_loop()
+        with self.condition:
+            waiter = self.loop_waiters.get(loop)
+            if waiter is None:
+                waiter = self.loop_waiters[loop] = LoopWaiter(loop)
+            waiter.viewers += 1
+        subscriber = self._attach(profile)
+        try:
+            while True:
+                jpeg = await self.next_frame_async(subscriber, waiter)
+                if jpeg is None:
+                    break
+                yield multipart_chunk(jpeg)
+        finally:
+            self._detach(subscriber)
+            with self.condition:
+                waiter.viewers -= 1
+                if not waiter.viewers:
+                    self.loop_waiters.pop(loop, None)
+
+    def stats(self):
+        """Subscriber count and per-client delivery statistics"""
+        with self.condition:
+            subscribers = [
+                subscriber
+                for channel in self.channels.values()
+                for subscriber in channel.subscribers.values()
+            ]
+            profiles = {
+                name: {
+                    'subscribers': len(channel.subscribers),
+                    'frames_encoded': channel.sequence,
+                }
+                for name, channel in self.channels.items()
+            }
+        return {
+            'running': self.running,
+            'frames_rendered': self.frames_rendered,
+            'frames_published': sum(p['frames_encoded'] for p in profiles.values()),
+            'subscriber_count': len(subscribers),
+            'profiles': profiles,
+            'subscribers': [subscriber.stats() for subscriber in subscribers],
+        }
@@ -1,3 +1,900 @@
-from django.test import TestCase
+# attendance/tests.py
+"""
+Run with `python manage.py test --settings=facepulse.settings_bench`, which
+uses SQLite so no Postgres server is needed.
+"""
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from unittest import mock
+import cv2
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import OperationalError
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from facepulse import views as dashboard_views
+from faculty.models import StudentClass
+from . import views
+from .audit import AUDIT_SETTINGS, AuditLogger
+from .events import EventLog, EventStream
+from .camera import DEFAULT_CAMERA, FaceRecognitionCamera
+from .detection import detect_faces, non_max_suppression, tiles
+from .gallery import GAP_TIMEOUT, FaceGallery
+from .management.commands.watch_students import FolderIndex
+from .models import Student, Attendance, AttendanceSession, GalleryChange, RecognitionLog
+from .quality import QualityGate
+from .queries import assert_query_budget
+from .regions import RegionRefiner
+from .registry import CameraRegistry, RecognitionPool
+from .replay import FrameRecorder, ReplaySource, open_replay
+from .streaming import FrameHub, ProfileChannel
 
-# Create your tests here.
+
+def use_own_registry(test):
+    """Give the views a camera registry of their own, with a fresh gallery, for the length of a test"""
+    registry = CameraRegistry(face_gallery=FaceGallery(), pool=RecognitionPool(workers=1))
+    patcher = mock.patch.object(views, 'registry', registry)
+    patcher.start()
+    test.addCleanup(patcher.stop)
+    return registry
+
+
+class QueryBudgetTests(TestCase):
+    """Every budgeted view stays within its @query_budget with several rows per table"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', password='x', is_staff=True)
+        cls.user = User.objects.create_user('student', password='x')
+        students = [
+            Student.objects.create(
+                user=User.objects.create_user(f'student{number}'),
+                name=f'Student {number}', roll_no=f'STU{number:03d}',
+                face_encoding=[0.01 * number] * 128)
+            for number in range(5)
+        ]
+        cls.student = Student.objects.create(user=cls.user, name='Student', roll_no='STU100')
+        students.append(cls.student)
+        now = timezone.now()
+        for days in range(3):
+            for student in students:
+                Attendance.objects.create(
+                    student=student, date=date.today() - timedelta(days=days),
+                    status='present', marked_at=now - timedelta(days=days), confidence=0.9)
+
+    def setUp(self):
+        use_own_registry(self)
+
+    def get(self, user, view, url):
+        self.client.force_login(user)
+        with assert_query_budget(view):
+            response = self.client.get(url)
+        self.assertLess(response.status_code, 400)
+        return response
+
+    def test_take_attendance(self):
+        # Worst case first: the visit creates the camera and loads the gallery
+        self.get(self.staff, views.take_attendance, reverse('take_attendance'))
+        self.get(self.staff, views.take_attendance, reverse('take_attendance') + '?class=CS101')
+
+    def test_students_api(self):
+        self.get(self.staff, views.students_api, reverse('students_api'))
+
+    def test_dashboard_redirect(self):
+        self.get(self.staff, dashboard_views.dashboard_redirect, reverse('dashboard_redirect'))
+        self.get(self.user, dashboard_views.dashboard_redirect, reverse('dashboard_redirect'))
+
+    def test_admin_dashboard(self):
+        self.get(self.staff, dashboard_views.admin_dashboard, reverse('admin_dashboard'))
+
+    def test_student_dashboard(self):
+        response = self.get(self.user, dashboard_views.student_dashboard, reverse('student_dashboard'))
+        # The normal page, not the error fallback, must have been rendered within the budget
+        context = response.context
+        self.assertNotIn('error', context)
+        self.assertEqual(context['student'], self.student)
+        self.assertEqual((context['total_days'], context['present_days']), (3, 3))
+
+    def test_budget_is_enforced(self):
+        self.client.force_login(self.staff)
+        with self.assertRaises(AssertionError):
+            with assert_query_budget(queries=0):
+                self.client.get(reverse('students_api'))
+
+
+class StatusSnapshotTests(TestCase):
+    """attendance_status answers polls with 304s and deltas from the camera's snapshot"""
+
+    def setUp(self):
+        self.snapshot = use_own_registry(self).camera(DEFAULT_CAMERA).snapshot
+        self.snapshot.start_session()
+        self.snapshot.add_recognized({'id': 1, 'name': 'Ada', 'roll_no': 'STU001'}, True)
+        self.client.force_login(User.objects.create_user('staff', is_staff=True))
+
+    def get(self, since=None, etag=None):
+        headers = {'If-None-Match': etag} if etag else {}
+        data = {'since': since} if since else {}
+        return self.client.get(reverse('attendance_status'), data, headers=headers)
+
+    def names(self, body):
+        return [student['name'] for student in body['recognized_students']]
+
+    def test_etag(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.names(response.json()), ['Ada'])
+        etag = response['ETag']
+
+        response = self.get(etag=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+        self.snapshot.add_recognized({'id': 2, 'name': 'Alan', 'roll_no': 'STU002'}, True)
+        response = self.get(etag=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        # Tags from another process never match
+        self.assertEqual(self.get(etag=f'"0-{self.snapshot.version}"').status_code, 200)
+
+    def test_delta(self):
+        version = self.get().json()['version']
+        self.snapshot.add_recognized({'id': 2, 'name': 'Alan', 'roll_no': 'STU002'}, True)
+
+        body = self.get(since=version).json()
+        self.assertTrue(body['delta'])
+        self.assertEqual(self.names(body), ['Alan'])
+        self.assertEqual((body['session_recognized'], body['present_count']), (2, 2))
+
+        # A version from before the session started cannot be a delta base
+        self.snapshot.start_session()
+        body = self.get(since=version).json()
+        self.assertFalse(body['delta'])
+        self.assertEqual(body['recognized_students'], [])
+
+
+class AuditLoggerTests(TestCase):
+    """Failed audit writes neither lose good events nor block later ones"""
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.media_root = media.name
+        media_settings = override_settings(MEDIA_ROOT=self.media_root)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        self.audit = AuditLogger(AUDIT_SETTINGS)
+        # Flushed by the tests instead of the background thread
+        self.audit.thread = threading.current_thread()
+        self.face = np.zeros((8, 8, 3), dtype=np.uint8)
+
+    def images(self):
+        return sum(len(files) for _, _, files in os.walk(self.media_root))
+
+    def test_bad_event_is_isolated(self):
+        self.audit.record('success', 'room', image=self.face, force=True)
+        self.audit.record('failed', 'room', image=self.face, details={'frame': object()}, force=True)
+        self.audit.record('failed', 'room', image=self.face, force=True)
+
+        self.assertEqual(self.audit.flush(), 2)
+        self.assertEqual(len(self.audit.buffer), 0)
+        self.assertEqual(self.audit.failed_counter.value, 1)
+        self.assertEqual(RecognitionLog.objects.count(), 2)
+        self.assertEqual(self.images(), 2)
+
+    def test_unreachable_database_keeps_batch(self):
+        self.audit.record('success', 'room', image=self.face, force=True)
+        with mock.patch.object(RecognitionLog.objects, 'bulk_create', side_effect=OperationalError):
+            with self.assertRaises(OperationalError):
+                self.audit.flush()
+        self.assertEqual(len(self.audit.buffer), 1)
+        self.assertEqual(self.images(), 0)
+
+        self.assertEqual(self.audit.flush(), 1)
+        self.assertEqual(self.images(), 1)
+
+
+class GalleryChangeTests(TestCase):
+    """Running galleries follow GalleryChange rows, including ones committed out of order"""
+
+    def setUp(self):
+        self.rng = np.random.default_rng(11)
+
+    def student(self, number, encoding):
+        return Student.objects.create(
+            user=User.objects.create_user(f'gallery{number}'), name=f'Gallery {number}',
+            roll_no=f'GAL{number:03d}', face_encoding=list(encoding))
+
+    def skip_change(self, face_gallery, student, encoding):
+        """Re-encode a student through a change id that commits after a higher one; returns the id"""
+        Student.objects.filter(id=student.id).update(face_encoding=list(encoding))
+        skipped = GalleryChange.publish(student.id)
+        GalleryChange.publish(0, 'delete')
+        skipped_id = skipped.id
+        skipped.delete()
+        face_gallery.apply_changes()
+        self.assertIn(skipped_id, face_gallery.pending_gaps)
+        return skipped_id
+
+    def commit_change(self, face_gallery, student, skipped_id):
+        """Let the skipped change become visible; the gallery applies it without a new version"""
+        version = face_gallery.version
+        GalleryChange.objects.create(id=skipped_id, student_id=student.id, operation='upsert')
+        self.assertEqual(face_gallery.apply_changes(), 1)
+        self.assertEqual(face_gallery.version, version)
+        self.assertNotIn(skipped_id, face_gallery.pending_gaps)
+
+    def test_deltas_follow_saves_and_deletes(self):
+        encodings = self.rng.normal(0, 0.06, (3, 128))
+        first, second = self.student(1, encodings[0]), self.student(2, encodings[1])
+        face_gallery = FaceGallery()
+        face_gallery.load()
+        self.assertEqual(len(face_gallery), 2)
+
+        third = self.student(3, encodings[2])
+        first.name = 'Renamed'
+        first.save()
+        second.delete()
+        self.assertEqual(face_gallery.apply_changes(), 3)
+        self.assertEqual(face_gallery.version, GalleryChange.objects.latest('id').id)
+        self.assertEqual(sorted(face_gallery.student_ids), sorted([first.id, third.id]))
+        self.assertEqual(face_gallery.match(encodings[0], 0.1)[:2], (first.id, 'Renamed'))
+        self.assertEqual(face_gallery.match(encodings[2], 0.1)[0], third.id)
+        self.assertIsNone(face_gallery.match(encodings[1], 0.1))
+
+        # Saves that leave the recognition fields alone publish nothing
+        third.save(update_fields=['updated_at'])
+        self.assertEqual(face_gallery.apply_changes(), 0)
+
+    def test_skipped_change_is_polled_until_timeout(self):
+        student = self.student(1, self.rng.normal(0, 0.06, 128))
+        face_gallery = FaceGallery()
+        face_gallery.load()
+        skipped_id = self.skip_change(face_gallery, student, self.rng.normal(0, 0.06, 128))
+
+        # A skipped id that never commits was rolled back; it stops being polled
+        face_gallery.apply_changes(now=time.monotonic() + GAP_TIMEOUT + 1)
+        self.assertNotIn(skipped_id, face_gallery.pending_gaps)
+
+    def test_class_membership_changes_reach_subsets(self):
+        encoding = self.rng.normal(0, 0.06, 128)
+        student = self.student(1, encoding)
+        physics = StudentClass.objects.create(name='Physics', code='PHY101')
+        face_gallery = FaceGallery()
+        face_gallery.load()
+        self.assertEqual(len(face_gallery.subset([physics.id])), 0)
+
+        student.classes.add(physics)
+        face_gallery.apply_changes()
+        self.assertEqual(face_gallery.subset([physics.id]).match(encoding, 0.1)[0], student.id)
+
+        physics.students.clear()
+        face_gallery.apply_changes()
+        self.assertEqual(len(face_gallery.subset([physics.id])), 0)
+
+    def test_late_change_reaches_unknown_cache(self):
+        student = self.student(1, self.rng.normal(0, 0.06, 128))
+        face = self.rng.normal(0, 0.06, 128)
+        face_gallery = FaceGallery()
+        face_gallery.load()
+        camera = FaceRecognitionCamera('late-unknown', 0, face_gallery)
+
+        skipped_id = self.skip_change(face_gallery, student, face)
+        self.assertIsNone(camera.search(face)[0])
+        self.assertEqual(camera.search(face)[1], 'unknown_cache')
+
+        self.commit_change(face_gallery, student, skipped_id)
+        match, scope, _ = camera.search(face)
+        self.assertEqual(match and match[0], student.id)
+        self.assertEqual(scope, 'global')
+
+    def test_late_change_reaches_shortlist(self):
+        encoding = self.rng.normal(0, 0.06, 128)
+        student = self.student(1, encoding)
+        face = encoding + self.rng.normal(0, 0.015, 128)
+        face_gallery = FaceGallery()
+        face_gallery.load()
+        camera = FaceRecognitionCamera('late-shortlist', 0, face_gallery)
+
+        skipped_id = self.skip_change(face_gallery, student, self.rng.normal(0, 0.06, 128))
+        self.assertEqual(camera.search(face)[1], 'global')
+        match, scope, _ = camera.search(face)
+        self.assertEqual((match[0], scope), (student.id, 'shortlist'))
+
+        # The student's new encoding is far from the face, so the old shortlist entry must not answer
+        self.commit_change(face_gallery, student, skipped_id)
+        match, scope, _ = camera.search(face)
+        self.assertIsNone(match)
+        self.assertEqual(scope, 'global')
+
+
+class FolderIndexTests(SimpleTestCase):
+    """watch_students only reports images that are new or changed"""
+
+    def setUp(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.root = folder.name
+        os.mkdir(os.path.join(self.root, 'cs101'))
+        self.index = FolderIndex(self.root)
+
+    def write(self, name, data=b'x'):
+        path = os.path.join(self.root, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def touch_dir(self, name, mtime_ns):
+        # Explicit directory mtimes, so the test does not depend on timestamp resolution
+        path = os.path.join(self.root, name)
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+
+    def scan(self, full=False):
+        changed = self.index.scan(full=full)
+        self.index.files.update(changed)
+        return sorted(os.path.relpath(path, self.root) for path, _ in changed)
+
+    def test_scan(self):
+        self.write('STU001_Ada.jpg')
+        self.write(os.path.join('cs101', 'STU002_Alan.PNG'))
+        self.write('notes.txt')
+        self.assertEqual(self.scan(full=True), ['STU001_Ada.jpg', os.path.join('cs101', 'STU002_Alan.PNG')])
+        self.assertEqual(self.scan(), [])
+
+        self.write(os.path.join('cs101', 'STU003_Grace.jpg'))
+        self.touch_dir('cs101', 10**18)
+        self.assertEqual(self.scan(), [os.path.join('cs101', 'STU003_Grace.jpg')])
+
+        # Rewriting a file in place leaves its directory alone; only a full scan sees it
+        self.write('STU001_Ada.jpg', b'rewritten')
+        self.assertEqual(self.scan(), [])
+        self.assertEqual(self.scan(full=True), ['STU001_Ada.jpg'])
+
+    def test_removed_directory_is_forgotten(self):
+        path = self.write(os.path.join('cs101', 'STU002_Alan.jpg'))
+        self.scan(full=True)
+        os.remove(path)
+        os.rmdir(os.path.join(self.root, 'cs101'))
+        self.assertEqual(self.scan(), [])
+        self.assertEqual(self.index.files, {})
+        self.assertNotIn(os.path.join(self.root, 'cs101'), self.index.dirs)
+
+
+class EventStreamTests(SimpleTestCase):
+    """Reconnecting SSE clients get exactly the events they missed, or a fresh snapshot"""
+
+    def setUp(self):
+        self.log = EventLog(maxlen=3)
+        self.log.append('recognized', {'name': 'Ada'})
+        self.log.append('recognized', {'name': 'Alan'})
+
+    def stream(self, last_event_id):
+        return EventStream(
+            self.log, lambda: {'recognized': 2}, lambda: {'active': True}, last_event_id=last_event_id)
+
+    def events(self, chunks):
+        """(event type, id) of each formatted event"""
+        events = []
+        for chunk in chunks:
+            fields = dict(line.split(': ', 1) for line in chunk.decode().splitlines() if ': ' in line)
+            if 'event' in fields:
+                events.append((fields['event'], fields.get('id')))
+        return events
+
+    def test_replays_missed_events(self):
+        stream = self.stream(self.log.format_id(1))
+        self.assertEqual(self.events(stream.opening()), [
+            ('recognized', self.log.format_id(2)), ('status', None)])
+
+        self.log.append('recognized', {'name': 'Grace'})
+        self.assertEqual(self.events(stream.pending()), [('recognized', self.log.format_id(3))])
+        self.assertEqual(stream.pending(), [])
+
+    def test_snapshot_when_replay_is_impossible(self):
+        snapshot = [('snapshot', self.log.format_id(2)), ('status', None)]
+        # New client, an id from an earlier server process, and an id from the future
+        for last_event_id in (None, f'{self.log.epoch - 1}-1', self.log.format_id(9)):
+            self.assertEqual(self.events(self.stream(last_event_id).opening()), snapshot)
+
+        # Events the client missed have fallen out of the buffer
+        stream = self.stream(self.log.format_id(1))
+        for name in ('Grace', 'Edsger', 'Barbara'):
+            self.log.append('recognized', {'name': name})
+        self.assertEqual(self.events(stream.opening()), [
+            ('snapshot', self.log.format_id(5)), ('status', None)])
+
+
+class ReplayTests(TestCase):
+    """A recorded session replays as the same frames, in order, on every run"""
+
+    def setUp(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.path = os.path.join(folder.name, 'room.fprec')
+        gradient = np.tile(np.arange(0, 256, 4, dtype=np.uint8), (48, 1))
+        self.frames = [np.dstack([gradient, np.roll(gradient, number, axis=1), gradient]) for number in range(5)]
+        with FrameRecorder(self.path, fps=25.0, camera_id='room') as recorder:
+            for number, frame in enumerate(self.frames):
+                self.assertTrue(recorder.write(frame, timestamp=number * 0.02))
+        self.assertFalse(recorder.write(self.frames[0]))
+
+    def read_all(self, source):
+        frames = []
+        while True:
+            success, frame = source.read()
+            if not success:
+                return frames
+            frames.append(frame)
+
+    def test_round_trip(self):
+        source = ReplaySource(self.path, speed=0)
+        self.addCleanup(source.release)
+        self.assertEqual((source.header['width'], source.header['height']), (64, 48))
+        self.assertEqual(source.header['camera_id'], 'room')
+        self.assertEqual(source.get(cv2.CAP_PROP_FPS), 25.0)
+        self.assertEqual(source.get(cv2.CAP_PROP_FRAME_COUNT), 5)
+        self.assertAlmostEqual(source.duration, 0.08)
+
+        first = self.read_all(source)
+        self.assertEqual(len(first), 5)
+        for original, replayed in zip(self.frames, first):
+            # JPEG is lossy, but only slightly at quality 90
+            self.assertLess(np.abs(original.astype(int) - replayed).mean(), 3)
+
+        # Seeking back replays exactly the same decoded frames
+        self.assertTrue(source.set(cv2.CAP_PROP_POS_FRAMES, 0))
+        for expected, replayed in zip(first, self.read_all(source)):
+            np.testing.assert_array_equal(expected, replayed)
+
+    def test_paced_and_looped(self):
+        source = open_replay(f'replay:{self.path}?speed=2&loop=1')
+        self.addCleanup(source.release)
+        started = time.monotonic()
+        for _ in range(7):
+            self.assertTrue(source.read()[0])
+        # Five frames 0.02s apart at double speed, then the loop restarts its schedule
+        self.assertGreaterEqual(time.monotonic() - started, 0.04)
+        self.assertEqual(source.get(cv2.CAP_PROP_POS_FRAMES), 2)
+
+    def test_replay_command_writes_nothing(self):
+        output = io.StringIO()
+        call_command('replay_session', self.path, '--runs', '2', '--json', stdout=output)
+        report = json.loads(output.getvalue())
+        self.assertTrue(report['deterministic'])
+        self.assertEqual([run['frames'] for run in report['runs']], [5, 5])
+        self.assertFalse(AttendanceSession.objects.exists())
+        self.assertFalse(Attendance.objects.exists())
+
+
+class FakeCamera:
+    """Frame source for hub tests; frames() yields whatever was queued since the last call"""
+
+    def __init__(self, camera_id):
+        self.camera_id = camera_id
+        self.pending = []
+        self.annotated = 0
+
+    def frames(self):
+        frames, self.pending = self.pending, []
+        return iter(frames)
+
+    def annotate(self, frame):
+        self.annotated += 1
+
+
+class BlockingCapture:
+    """Capture whose read() blocks until the test lets it return"""
+
+    def __init__(self):
+        self.reading = threading.Event()
+        self.proceed = threading.Event()
+        self.released = False
+
+    def isOpened(self):
+        return True
+
+    def read(self):
+        self.reading.set()
+        self.proceed.wait(5)
+        return True, np.zeros((48, 64, 3), dtype=np.uint8)
+
+    def release(self):
+        self.released = True
+
+
+class FrameHubTests(SimpleTestCase):
+    """One producer serves every viewer; slow viewers skip frames instead of queueing them"""
+
+    profiles = {
+        'full': {'width': None, 'quality': 80, 'fps': None},
+        'thumbnail': {'width': 16, 'quality': 60, 'fps': None},
+    }
+
+    def produce(self, hub, count):
+        # The producer loop, run in the test thread so every frame is published before reading
+        hub.camera.pending = [np.zeros((48, 64, 3), dtype=np.uint8)] * count
+        hub._produce()
+
+    def test_slow_viewer_drops_frames(self):
+        hub = FrameHub(FakeCamera('hub-drops'), self.profiles)
+        subscriber = hub._attach('full')
+        self.produce(hub, 1)
+        self.assertIsNotNone(hub.next_frame(subscriber))
+
+        self.produce(hub, 3)
+        self.assertIsNotNone(hub.next_frame(subscriber))
+        self.assertEqual((subscriber.delivered, subscriber.dropped), (2, 2))
+        self.assertEqual(hub.dropped_counter.value, 2)
+        # Stopped and nothing newer: the viewer is told to disconnect
+        self.assertIsNone(hub.next_frame(subscriber))
+
+        # Only watched profiles are encoded, and nothing is drawn without viewers
+        self.assertEqual(hub.channels['full'].sequence, 4)
+        self.assertEqual(hub.channels['thumbnail'].sequence, 0)
+        hub._detach(subscriber)
+        self.produce(hub, 2)
+        self.assertEqual((hub.camera.annotated, hub.frames_rendered), (4, 4))
+
+    def test_profile_pacing(self):
+        channel = ProfileChannel('thumbnail', width=16, quality=60, fps=10)
+        frame = np.zeros((48, 64, 3), dtype=np.uint8)
+        self.assertFalse(channel.due(0.0))
+        channel.subscribers[1] = None
+
+        # A 30fps camera: every third frame is encoded, and late frames do not lower the rate
+        encoded = []
+        for number in range(30):
+            now = number / 30 + (0.01 if number % 2 else 0.0)
+            if channel.due(now):
+                channel.encode(frame, now)
+                encoded.append(number)
+        self.assertEqual(len(encoded), 10)
+
+        # After an idle spell the schedule restarts instead of bursting to catch up
+        channel.encode(frame, 5.0)
+        self.assertFalse(channel.due(5.05))
+        self.assertTrue(channel.due(5.1))
+
+    def test_stop_waits_for_blocked_read(self):
+        face_gallery = FaceGallery()
+        face_gallery.replace([], [], [], [])
+        pool = RecognitionPool(workers=1)
+        camera = FaceRecognitionCamera('hub-stop', 0, face_gallery, pool)
+        # Keep the loop off the database: no gallery poll or recount is due
+        face_gallery.last_poll = time.monotonic()
+        camera.snapshot.counted_at, camera.snapshot.present_date = time.monotonic(), date.today()
+        capture = camera.camera = BlockingCapture()
+        camera.is_active = True
+
+        # A frame still waiting for a recognition worker is dropped when the camera stops
+        with mock.patch.object(pool, '_start'):
+            pool.submit(camera, None)
+        hub = FrameHub(camera)
+        hub.start()
+        self.assertTrue(capture.reading.wait(5))
+        hub.stop(timeout=0.01)
+        camera.stop_camera()
+        self.assertEqual(pool.stats()['queued'], 0)
+        self.assertIsNone(camera.camera)
+        # Releasing a capture inside read() is unsafe; the producer does it once the read returns
+        self.assertFalse(capture.released)
+
+        capture.proceed.set()
+        hub.thread.join(5)
+        self.assertFalse(hub.running)
+        self.assertTrue(capture.released)
+
+    def test_viewers_share_frames(self):
+        hub = FrameHub(FakeCamera('hub-shared'), self.profiles)
+        viewers = [hub._attach('full'), hub._attach('full'), hub._attach('thumbnail')]
+        self.produce(hub, 1)
+        jpegs = [hub.next_frame(viewer) for viewer in viewers]
+        self.assertIs(jpegs[0], jpegs[1])
+        self.assertLess(len(jpegs[2]), len(jpegs[0]))
+        self.assertEqual(hub.camera.annotated, 1)
+        self.assertEqual(hub.stats()['subscriber_count'], 3)
+
+
+def bright_box(image, number_of_times_to_upsample=0):
+    """Stand-in for face_recognition.face_locations that finds the one bright square, even when cut"""
+    rows, cols = np.nonzero(image[:, :, 0] > 64)
+    if not len(rows):
+        return []
+    return [(int(rows.min()), int(cols.max()) + 1, int(rows.max()) + 1, int(cols.min()))]
+
+
+class PhotoDetectionTests(SimpleTestCase):
+    """Group photos are tiled so every small face is whole in some tile, and duplicates are merged"""
+
+    def test_tiles_cover_with_overlap(self):
+        height, width, tile, overlap = 2000, 3000, 1024, 256
+        origins = tiles(height, width, tile, overlap)
+        tops = sorted({top for top, _ in origins})
+        lefts = sorted({left for _, left in origins})
+        self.assertEqual(len(origins), len(tops) * len(lefts))
+        for starts, length in ((tops, height), (lefts, width)):
+            self.assertEqual((starts[0], starts[-1] + tile), (0, length))
+            for previous, start in zip(starts, starts[1:]):
+                self.assertGreaterEqual(previous + tile - start, overlap)
+        self.assertEqual(tiles(500, 800, tile, overlap), [(0, 0)])
+
+    def test_non_max_suppression(self):
+        face = (100, 200, 200, 100)
+        shifted = (105, 205, 205, 105)
+        # A face cut by a tile edge: too small a part for the overlap test, but inside the face
+        partial = (100, 125, 200, 100)
+        other = (100, 400, 200, 300)
+        self.assertEqual(non_max_suppression([partial, other, shifted, face]), [other, shifted])
+        self.assertEqual(non_max_suppression([]), [])
+
+    def test_faces_cut_by_tile_edges_are_found_once(self):
+        image = np.zeros((2000, 3000, 3), dtype=np.uint8)
+        # Straddles the right edge of the first tile column, so that tile sees only part of it
+        image[900:940, 1014:1054] = 255
+        with mock.patch('attendance.detection.face_recognition.face_locations', side_effect=bright_box):
+            self.assertEqual(detect_faces(image, tile=1024, overlap=256, coarse_scale=1.0),
+                             [(900, 1054, 940, 1014)])
+            # The downscaled pass finds it too, a few pixels off; only the larger box is kept
+            locations = detect_faces(image, tile=1024, overlap=256)
+        self.assertEqual(len(locations), 1)
+        self.assertLessEqual(np.abs(np.subtract(locations[0], (900, 1054, 940, 1014))).max(), 4)
+
+
+class ClassSubsetTests(SimpleTestCase):
+    """Per-class sub-galleries are reused until one of their students changes"""
+
+    def setUp(self):
+        rng = np.random.default_rng(13)
+        self.encodings = rng.normal(0, 0.06, (4, 128))
+        self.gallery = FaceGallery()
+        self.gallery.replace(range(4), ['Ada', 'Alan', 'Grace', 'Edsger'],
+                             ['STU0', 'STU1', 'STU2', 'STU3'], self.encodings)
+        for student_id, class_ids in ((0, {1}), (1, {1, 2}), (2, {2}), (3, {3})):
+            self.gallery.set_classes(student_id, class_ids)
+
+    def test_subsets_are_cached(self):
+        first = self.gallery.subset([1])
+        self.assertIs(self.gallery.subset({1}), first)
+        self.assertEqual(sorted(first.student_ids), [0, 1])
+        self.assertEqual(sorted(self.gallery.subset([1, 2]).student_ids), [0, 1, 2])
+        # Students outside the classes are not matched
+        self.assertIsNone(first.match(self.encodings[2], 0.1))
+
+    def test_changes_drop_affected_subsets(self):
+        one, two, three = (self.gallery.subset([class_id]) for class_id in (1, 2, 3))
+
+        self.gallery.upsert(2, 'Grace', 'STU2', self.encodings[2] + 0.01)
+        self.assertIs(self.gallery.subset([1]), one)
+        self.assertIsNot(self.gallery.subset([2]), two)
+        two = self.gallery.subset([2])
+
+        self.gallery.set_classes(3, {1})
+        self.assertIsNot(self.gallery.subset([1]), one)
+        self.assertIsNot(self.gallery.subset([3]), three)
+        self.assertEqual(sorted(self.gallery.subset([1]).student_ids), [0, 1, 3])
+        self.assertEqual(self.gallery.subset([3]).student_ids, [])
+
+        self.gallery.remove(1)
+        self.assertIsNot(self.gallery.subset([2]), two)
+        self.assertEqual(self.gallery.subset([2]).student_ids, [2])
+
+
+class Point:
+    def __init__(self, x, y):
+        self.x, self.y = x, y
+
+
+class Shape:
+    """Stand-in for a dlib 5-point landmark shape: two corners of each eye, then the nose"""
+
+    def __init__(self, points):
+        self.points = [Point(x, y) for x, y in points]
+
+    def parts(self):
+        return self.points
+
+
+class QualityGateTests(SimpleTestCase):
+    """Faces too small, blurry, turned or tilted to match are skipped before encoding"""
+
+    frontal = Shape([(30, 40), (40, 40), (60, 40), (70, 40), (50, 60)])
+    turned = Shape([(30, 40), (40, 40), (60, 40), (70, 40), (62, 60)])
+    tilted = Shape([(30, 30), (37, 37), (58, 58), (65, 65), (40, 60)])
+
+    def setUp(self):
+        # A sharp checkerboard face next to a flat grey one
+        self.image = np.full((100, 200, 3), 128, dtype=np.uint8)
+        self.image[:, :100] = np.kron((np.indices((10, 10)).sum(axis=0) % 2) * 255, np.ones((10, 10)))[..., None]
+        self.sharp = (0, 100, 100, 0)
+        self.flat = (0, 200, 100, 100)
+
+    def test_reasons(self):
+        gate = QualityGate()
+        faces = [
+            (self.sharp, self.frontal),
+            ((0, 30, 30, 0), self.frontal),
+            (self.flat, self.frontal),
+            (self.sharp, self.turned),
+            (self.sharp, self.tilted),
+        ]
+        self.assertEqual(gate.check(self.image, *zip(*faces)), [None, 'small', 'blurry', 'turned', None])
+
+        strict = QualityGate(max_roll=20)
+        self.assertEqual(strict.check(self.image, [self.sharp], [self.tilted]), ['tilted'])
+        self.assertEqual(QualityGate(enabled=False).check(self.image, [self.flat], [self.turned]), [None])
+
+    def test_size_in_full_frame_pixels(self):
+        # A 30px face in a 0.25 downscale is 120px in the full frame
+        gate = QualityGate(min_sharpness=None)
+        self.assertEqual(gate.check(self.image, [(0, 30, 30, 0)], [self.frontal], factor=4), [None])
+        self.assertEqual(gate.check(self.image, [(0, 30, 30, 0)], [self.frontal]), ['small'])
+
+
+class RegionRefinerTests(SimpleTestCase):
+    """The second detection pass only re-scans back rows, lost faces and motion, within its budget"""
+
+    shape = (1000, 2000, 3)
+    back_row = ((0, 2000, 250, 0), 'back_rows')
+
+    def refiner(self, **options):
+        return RegionRefiner([(0.0, 0.0, 1.0, 0.25)], enabled=True, **options)
+
+    def test_lost_faces(self):
+        refiner = self.refiner(lost_frames=2)
+        face = (500, 600, 560, 540)
+        refiner.track([face])
+        # Still found by the coarse pass: nothing to look for
+        self.assertEqual(refiner.plan(self.shape, [face]), [self.back_row])
+
+        # Lost: its surroundings are searched for lost_frames passes, then given up on
+        lost = [self.back_row, ((440, 660, 620, 480), 'lost')]
+        self.assertEqual(refiner.plan(self.shape, []), lost)
+        refiner.track([])
+        self.assertEqual(refiner.plan(self.shape, []), lost)
+        self.assertEqual(refiner.plan(self.shape, []), [self.back_row])
+
+    def test_motion_budget(self):
+        refiner = self.refiner(max_area=0.011)
+        face = (600, 100, 700, 0)
+        small, large, huge = (500, 1100, 520, 1080), (800, 1150, 900, 1050), (400, 1900, 950, 1300)
+        motion = [huge, large, (600, 90, 690, 10), small]
+        # Motion over a face the coarse pass found is skipped, the rest is taken smallest
+        # first within max_area of the frame; back rows do not count against the budget
+        self.assertEqual(refiner.plan(self.shape, [face], motion), [
+            self.back_row, ((496, 1104, 524, 1076), 'motion'), ((780, 1170, 920, 1030), 'motion')])
+        self.assertEqual(len(self.refiner(max_regions=2).plan(self.shape, [], motion)), 2)
+
+        # Overlapping regions are merged
+        touching = [(500, 1100, 520, 1080), (515, 1120, 540, 1095)]
+        self.assertEqual(refiner.plan(self.shape, [], touching)[1:], [((496, 1125, 545, 1076), 'motion')])
+
+    def test_motion(self):
+        refiner = self.refiner()
+        frame = np.zeros((60, 80, 3), dtype=np.uint8)
+        self.assertEqual(refiner.motion(frame, 4), [])
+        moved = frame.copy()
+        moved[20:30, 40:50] = 255
+        [(top, right, bottom, left)] = refiner.motion(moved, 4)
+        # Full-frame pixels around the 10x10 change at (20, 40) in the downscale
+        self.assertTrue(top <= 80 and bottom >= 120 and left <= 160 and right >= 200)
+        self.assertEqual(refiner.motion(moved, 4), [])
+
+    def test_prepare_leaves_motion_to_recognition(self):
+        face_gallery = FaceGallery()
+        face_gallery.replace([], [], [], [])
+        camera = FaceRecognitionCamera('refine-prepare', 0, face_gallery)
+        camera.refiner = self.refiner()
+        prepared = camera.prepare(np.zeros((240, 320, 3), dtype=np.uint8))
+        self.assertEqual(prepared.full.shape, (240, 320, 3))
+        # A frame the recognition pool replaces before it runs must not move the motion baseline
+        self.assertIsNone(camera.refiner.previous)
+
+
+class CachedSearchTests(SimpleTestCase):
+    """
+    The shortlist and the unknown-face cache only answer when the gallery
+    search would have given the same answer.
+    """
+
+    students = 2000
+
+    def stream(self, rng, encodings, strangers, count):
+        """Faces as a camera sees them: recurring students and recurring unknown visitors"""
+        for _ in range(count):
+            if rng.random() < 0.6:
+                # Most faces belong to a few dozen students in the room
+                base = encodings[rng.integers(40)]
+            elif rng.random() < 0.8:
+                base = strangers[rng.integers(len(strangers))]
+            else:
+                base = encodings[rng.integers(len(encodings))]
+            yield base + rng.normal(0, 0.015, 128)
+
+    def check(self, codes):
+        rng = np.random.default_rng(7)
+        encodings = rng.normal(0, 0.06, (self.students, 128))
+        # Near-twins of half the students in the room, so the shortlist's separation rule is exercised
+        encodings[1000:1020] = encodings[:20] + rng.normal(0, 0.02, (20, 128))
+        strangers = rng.normal(0, 0.06, (10, 128))
+        face_gallery = FaceGallery(codes=codes)
+        face_gallery.replace(
+            range(self.students), [f'Student {row}' for row in range(self.students)],
+            [f'STU{row:04d}' for row in range(self.students)], encodings)
+
+        cached = FaceRecognitionCamera(f'cached-{codes}', 0, face_gallery)
+        plain = FaceRecognitionCamera(f'plain-{codes}', 0, face_gallery)
+        plain.shortlist.enabled = False
+        plain.unknowns.enabled = False
+
+        for number, face in enumerate(self.stream(rng, encodings, strangers, 3000)):
+            if number == 1500:
+                # Enrolling a visitor the unknown cache knows must make them recognizable at once
+                face_gallery.upsert(self.students, 'Visitor', 'VIS001', strangers[0])
+            match, scope, _ = cached.search(face)
+            expected, _, _ = plain.search(face)
+            self.assertEqual(match and match[0], expected and expected[0], f'face {number} ({scope})')
+            if match is not None:
+                self.assertAlmostEqual(match[3], expected[3], places=5)
+
+        # Both caches answered often enough for the comparison to mean something
+        self.assertGreater(cached.shortlist_hits_counter.value, 500)
+        self.assertGreater(cached.unknown_hits_counter.value, 100)
+
+    def test_float64(self):
+        self.check(None)
+
+    def test_shortlist_within_threshold(self):
+        rng = np.random.default_rng(5)
+        encoding = rng.normal(0, 0.06, 128)
+        face_gallery = FaceGallery()
+        face_gallery.replace([1], ['Student'], ['STU001'], [encoding])
+        camera = FaceRecognitionCamera('shortlist-threshold', 0, face_gallery)
+        camera.shortlist.accept_distance = camera.recognition_threshold + 0.2
+        camera.unknowns.enabled = False
+        self.assertEqual(camera.search(encoding)[1], 'global')
+
+        direction = rng.normal(0, 1, 128)
+        face = encoding + direction / np.linalg.norm(direction) * (camera.recognition_threshold + 0.1)
+        self.assertEqual(camera.search(face), (None, 'global', None))
+
+    def test_int8(self):
+        self.check('int8')
+
+
+class QuantizedGalleryTests(SimpleTestCase):
+    """float16 and int8 galleries re-ranking only 4 candidates agree with the float64 search"""
+
+    def check(self, codes):
+        rng = np.random.default_rng(3)
+        size = 20000
+        encodings = rng.normal(0, 0.06, (size, 128))
+        exact, quantized = FaceGallery(), FaceGallery(codes=codes, rerank=4)
+        for face_gallery in (exact, quantized):
+            face_gallery.replace(range(size), [''] * size, [''] * size, encodings)
+            # Deltas go through the same row moves as live updates
+            for student_id in range(0, 200, 2):
+                face_gallery.remove(student_id)
+            face_gallery.upsert(size, '', '', encodings[1] + 0.01)
+
+        probes = np.vstack([
+            encodings[rng.integers(size, size=400)] + rng.normal(0, 0.015, (400, 128)),
+            rng.normal(0, 0.06, (100, 128)),
+        ])
+        for probe, expected, match in zip(
+                probes, exact.match_many(probes, float('inf')), quantized.match_many(probes, float('inf'))):
+            self.assertEqual(match[0], expected[0])
+            # Re-ranking uses float32 copies of the encodings
+            self.assertAlmostEqual(match[3], expected[3], places=5)
+            self.assertEqual(quantized.match(probe, float('inf'))[0], expected[0])
+
+    def test_float16(self):
+        self.check('float16')
+
+    def test_int8(self):
+        self.check('int8')
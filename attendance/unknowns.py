@@ -0,0 +1,190 @@
+# attendance/unknowns.py
+"""
+Short-lived cache of faces that matched no student.
+
+Visitors, staff and unenrolled students stay in view for minutes and are
+searched against the whole gallery on every processed frame. Their
+encodings are clustered online instead; a face close enough to a cluster
+is known to be unknown without a gallery search.
+
+Each cluster stores a lower bound (margin) on the distance from its
+centre to the nearest student. A face within margin - tolerance of the
+centre is, by the triangle inequality, further than tolerance from every
+student, so a cache hit never hides a match the full search would have
+made. A new cluster's margin is the nearest-student distance of the
+search that just missed, so adding costs no extra search; when a centre
+moves by some shift its margin drops by that shift. Margins are measured
+against the gallery the camera decides with (a class sub-gallery for
+class-bound sessions) and recomputed in one batched search whenever that
+gallery is written to, so enrolling or re-encoding someone the cache had
+seen makes their next sighting go through the full search again.
+"""
+import itertools
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+
+DEFAULT_UNKNOWNS = {
+    'enabled': True,
+    # Faces within this distance of a cluster centre skip the gallery search
+    # (never more than the centre's margin allows) or, on a miss, join it
+    'radius': 0.35,
+    # Seconds since a cluster was last seen before it expires
+    'ttl': 600,
+    # Clusters kept per camera; the least recently seen is evicted first
+    'max_clusters': 256,
+}
+
+
+class UnknownCluster:
+    """An unknown face seen one or more times"""
+
+    def __init__(self, cluster_id, encoding, margin, image, now):
+        self.id = cluster_id
+        self.centroid = np.asarray(encoding, dtype=np.float64)
+        self.margin = margin
+        self.members = 1
+        self.hits = 0
+        self.first_seen = now
+        self.last_seen = now
+        self.image = image
+
+    @property
+    def sightings(self):
+        return self.members + self.hits
+
+    def join(self, encoding, image, now):
+        """Move the centre towards another encoding of the same face; returns how far it moved"""
+        self.members += 1
+        step = (np.asarray(encoding) - self.centroid) / self.members
+        self.centroid += step
+        self.last_seen = now
+        if image is not None:
+            self.image = image
+        return float(np.linalg.norm(step))
+
+
+class UnknownCache:
+    """
+    Bounded, expiring clusters of unknown face encodings for one camera.
+
+    search returns the gallery the camera's decision comes from. lookup()
+    answers from the cache; add() is called after a full search found
+    nothing, with the distance to the nearest student that search saw.
+    All methods are safe to call from several threads.
+    """
+
+    def __init__(self, search, tolerance, enabled=True, radius=0.35, ttl=600, max_clusters=256):
+        self.search = search
+        self.tolerance = tolerance
+        self.enabled = enabled
+        self.radius = radius
+        self.ttl = ttl
+        self.max_clusters = max_clusters
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            self.clusters = OrderedDict()
+            self.gallery = None
+            self.generation = None
+            self._clusters = []
+            self._centroids = None
+
+    def __len__(self):
+        return len(self.clusters)
+
+    def _margin(self, encoding):
+        """Distance from an encoding to the nearest student"""
+        match = self.gallery.match(encoding, float('inf'))
+        return float('inf') if match is None else float(match[3])
+
+    def _revalidate(self):
+        """Re-measure every margin if the gallery changed or was replaced; returns whether it did"""
+        gallery = self.search()
+        # generation rather than version: late-committed changes are applied without a new version
+        if gallery is self.gallery and gallery.generation == self.generation:
+            return False
+        self.gallery, self.generation = gallery, gallery.generation
+        if self.clusters:
+            clusters = list(self.clusters.values())
+            matches = gallery.match_many([cluster.centroid for cluster in clusters], float('inf'))
+            for cluster, match in zip(clusters, matches):
+                cluster.margin = float('inf') if match is None else float(match[3])
+        return True
+
+    def _expire(self, now):
+        while self.clusters:
+            cluster = next(iter(self.clusters.values()))
+            if now - cluster.last_seen <= self.ttl:
+                break
+            self.clusters.popitem(last=False)
+            self._centroids = None
+
+    def _nearest(self, encoding):
+        """(cluster, distance) of the closest centre, or (None, inf)"""
+        if not self.clusters:
+            return None, float('inf')
+        if self._centroids is None:
+            self._clusters = list(self.clusters.values())
+            self._centroids = np.array([cluster.centroid for cluster in self._clusters])
+        distances = np.linalg.norm(self._centroids - encoding, axis=1)
+        best = int(np.argmin(distances))
+        return self._clusters[best], float(distances[best])
+
+    def lookup(self, encoding, now=None):
+        """The cluster this face certainly belongs to, or None when the gallery must be searched"""
+        if not self.enabled:
+            return None
+        now = time.time() if now is None else now
+        with self.lock:
+            self._revalidate()
+            self._expire(now)
+            cluster, distance = self._nearest(encoding)
+            if cluster is None or distance > min(self.radius, cluster.margin - self.tolerance):
+                return None
+            cluster.hits += 1
+            cluster.last_seen = now
+            self.clusters.move_to_end(cluster.id)
+            return cluster
+
+    def add(self, encoding, image=None, now=None, distance=None):
+        """
+        Record a face the full search did not match; returns its cluster.
+
+        distance is how far that search found the nearest student to be.
+        It is measured here when not given or when the gallery has changed
+        since.
+        """
+        if not self.enabled:
+            return None
+        now = time.time() if now is None else now
+        with self.lock:
+            if self._revalidate() or distance is None:
+                distance = self._margin(encoding)
+            cluster, offset = self._nearest(encoding)
+            if cluster is not None and offset <= self.radius:
+                shift = cluster.join(encoding, image, now)
+                # Both the old centre's margin and the face's own distance bound the new centre's
+                cluster.margin = max(cluster.margin - shift,
+                                     distance - float(np.linalg.norm(cluster.centroid - encoding)))
+                self.clusters.move_to_end(cluster.id)
+            else:
+                cluster = UnknownCluster(next(self.ids), encoding, distance, image, now)
+                self.clusters[cluster.id] = cluster
+                while len(self.clusters) > self.max_clusters:
+                    self.clusters.popitem(last=False)
+            self._centroids = None
+            return cluster
+
+    def export(self, min_sightings=1):
+        """Clusters seen at least min_sightings times, most seen first"""
+        now = time.time()
+        with self.lock:
+            self._expire(now)
+            clusters = [cluster for cluster in self.clusters.values()
+                        if cluster.sightings >= min_sightings]
+        return sorted(clusters, key=lambda cluster: cluster.sightings, reverse=True)
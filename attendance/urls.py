@@ -6,7 +6,29 @@ urlpatterns = [
     path('take/', views.take_attendance, name='take_attendance'),
     path('video_feed/', views.video_feed, name='video_feed'),
     path('stop_camera/', views.stop_camera, name='stop_camera'),
+    path('status_stream/', views.status_stream, name='status_stream'),
+    path('stream_stats/', views.stream_stats, name='stream_stats'),
     path('attendance_status/', views.attendance_status, name='attendance_status'),
+    path('cameras/', views.cameras_api, name='cameras_api'),
+    path('cameras/<str:camera_id>/video_feed/',
+         views.video_feed, name='camera_video_feed'),
+    path('cameras/<str:camera_id>/stop_camera/',
+         views.stop_camera, name='camera_stop_camera'),
+    path('cameras/<str:camera_id>/status_stream/',
+         views.status_stream, name='camera_status_stream'),
+    path('cameras/<str:camera_id>/stream_stats/',
+         views.stream_stats, name='camera_stream_stats'),
+    path('cameras/<str:camera_id>/attendance_status/',
+         views.attendance_status, name='camera_attendance_status'),
+    path('cameras/<str:camera_id>/recording/',
+         views.recording_view, name='camera_recording'),
+    path('cameras/<str:camera_id>/profile/',
+         views.profile_view, name='camera_profile'),
+    path('cameras/<str:camera_id>/unknowns/',
+         views.unknowns_view, name='camera_unknowns'),
     path('load-encodings/', views.load_encodings_view, name='load_encodings_view'),
+    path('process-video/', views.process_video_view, name='process_video'),
+    path('process-video/<str:job_id>/',
+         views.process_video_status, name='process_video_status'),
     path('students/', views.students_api, name='students_api'),
 ]
@@ -0,0 +1,123 @@
+# attendance/video.py
+"""
+Parallel face extraction from recorded video files.
+
+Nothing here touches Django, so chunk workers can run in separate processes
+that only need OpenCV and face_recognition.
+"""
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+import cv2
+import face_recognition
+from .detection import encode_faces
+
+
+def probe(path):
+    """Return (fps, frame_count) of a video file; frame_count is 0 when unknown"""
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise ValueError(f"Could not open video: {path}")
+    try:
+        fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+        frame_count = max(0, int(capture.get(cv2.CAP_PROP_FRAME_COUNT)))
+        return fps, frame_count
+    finally:
+        capture.release()
+
+
+def plan_chunks(frame_count, chunks):
+    """Split [0, frame_count) into contiguous (start, end) ranges; end None reads to the end"""
+    if frame_count <= 0 or chunks <= 1:
+        return [(0, None)]
+    size = -(-frame_count // chunks)
+    return [(start, min(start + size, frame_count)) for start in range(0, frame_count, size)]
+
+
+def decode_chunk(path, start, end, step, scale=0.25, model='small', num_jitters=1):
+    """
+    Decode frames [start, end) and find faces in every step-th frame.
+
+    Faces are encoded with the given landmark model and num_jitters, the
+    live recognition settings when called from scan_video.
+
+    Sampled frame indices are multiples of step, so adjacent chunks never
+    sample the same frame. Returns (frames_decoded, sightings) where each
+    sighting is (frame_index, [(location, encoding), ...]) in full-frame
+    coordinates.
+    """
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise ValueError(f"Could not open video: {path}")
+
+    sightings = []
+    frame_index = start
+    try:
+        if start:
+            capture.set(cv2.CAP_PROP_POS_FRAMES, start)
+        while end is None or frame_index < end:
+            # grab() skips the colour conversion for frames that are not sampled
+            if not capture.grab():
+                break
+            if frame_index % step == 0:
+                success, frame = capture.retrieve()
+                if success:
+                    faces = find_faces(frame, scale, model, num_jitters)
+                    if faces:
+                        sightings.append((frame_index, faces))
+            frame_index += 1
+    finally:
+        capture.release()
+
+    return frame_index - start, sightings
+
+
+def find_faces(frame, scale=0.25, model='small', num_jitters=1):
+    """Locations (full-frame) and encodings of the faces in a BGR frame"""
+    small_frame = cv2.resize(frame, (0, 0), fx=scale, fy=scale)
+    rgb_small_frame = cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB)
+    locations = face_recognition.face_locations(rgb_small_frame)
+    if not locations:
+        return []
+    encodings = encode_faces(rgb_small_frame, locations, num_jitters, model)
+    factor = round(1 / scale)
+    return [
+        (tuple(value * factor for value in location), encoding)
+        for location, encoding in zip(locations, encodings)
+    ]
+
+
+def scan_video(path, sample_rate=2.0, workers=None, model='small', num_jitters=1):
+    """
+    Find faces in a recording, decoding contiguous chunks in parallel.
+
+    sample_rate is the number of frames analysed per second of video;
+    model and num_jitters are the encoding settings (see attendance.encoding).
+    Returns (fps, frames_decoded, sightings) with sightings ordered by frame.
+    """
+    fps, frame_count = probe(path)
+    step = max(1, round(fps / sample_rate)) if sample_rate > 0 else 1
+    workers = workers or os.cpu_count() or 1
+    chunks = plan_chunks(frame_count, workers)
+
+    if len(chunks) == 1:
+        frames_decoded, sightings = decode_chunk(path, 0, None, step, model=model, num_jitters=num_jitters)
+        return fps, frames_decoded, sightings
+
+    # Spawned workers do not inherit the server's threads or database connections
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=len(chunks), mp_context=context) as executor:
+        results = list(executor.map(
+            decode_chunk,
+            [path] * len(chunks),
+            [start for start, _ in chunks],
+            [end for _, end in chunks],
+            [step] * len(chunks),
+            [0.25] * len(chunks),
+            [model] * len(chunks),
+            [num_jitters] * len(chunks),
+        ))
+
+    frames_decoded = sum(decoded for decoded, _ in results)
+    sightings = [sighting for _, chunk in results for sighting in chunk]
+    return fps, frames_decoded, sightings
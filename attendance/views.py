@@ -1,11 +1,13 @@
 # attendance/views.py
-import cv2
-import numpy as np
-import face_recognition
+import base64
 import json
-from datetime import date, datetime
+import os
+from datetime import date, datetime, timezone as dt_timezone
+from functools import partial
+import cv2
 from django.shortcuts import render, redirect
-from django.http import StreamingHttpResponse, JsonResponse, HttpResponse
+from django.http import StreamingHttpResponse, JsonResponse, HttpResponse, Http404
+from django.urls import reverse
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
@@ -13,253 +15,35 @@ from django.contrib import messages
 from django.utils import timezone
 from django.core.management import call_command
 from django.db import transaction
-from .models import Student, Attendance, AttendanceSession
-import threading
+from django.db.models import Count, Q
+from django.core.files.storage import default_storage
+from django.utils.dateparse import parse_datetime
+from faculty.models import StudentClass
+from .models import Student, Attendance
+from .camera import DEFAULT_CAMERA, resolve_classes
+from .registry import registry
+from .streaming import DEFAULT_PROFILE, is_asgi
+from .events import EventStream
+from .metrics import metrics
+from .recordings import start_job, jobs
+from .profiling import profile_camera
+from .queries import query_budget
 import logging
+from asgiref.sync import sync_to_async
 
 logger = logging.getLogger(__name__)
 
 
-class FaceRecognitionCamera:
-    def __init__(self):
-        self.camera = None
-        self.is_active = False
-        self.known_face_encodings = []
-        self.known_face_names = []
-        self.known_face_roll_nos = []
-        self.known_student_ids = []
-        self.attendance_marked = set()
-        self.frame_count = 0
-        self.recognition_threshold = 0.5
-        self.current_session = None
-
-        # Load face encodings
-        self.load_face_encodings()
-
-    def load_face_encodings(self):
-        """Load face encodings from database"""
-        try:
-            students = Student.objects.filter(face_encoding__isnull=False)
-
-            self.known_face_encodings = []
-            self.known_face_names = []
-            self.known_face_roll_nos = []
-            self.known_student_ids = []
-
-            for student in students:
-                if student.face_encoding and len(student.face_encoding) == 128:
-                    self.known_face_encodings.append(
-                        np.array(student.face_encoding))
-                    self.known_face_names.append(student.name)
-                    self.known_face_roll_nos.append(student.roll_no)
-                    self.known_student_ids.append(student.id)
-
-            logger.info(
-                f"Loaded {len(self.known_face_encodings)} face encodings")
-            return True
-
-        except Exception as e:
-            logger.error(f"Error loading face encodings: {e}")
-            return False
-
-    def start_camera(self, user=None):
-        """Start camera and create session"""
-        try:
-            if self.camera is not None:
-                self.stop_camera()
-
-            self.camera = cv2.VideoCapture(0)
-            if not self.camera.isOpened():
-                logger.error("Could not open camera")
-                return False
-
-            # Set camera properties
-            self.camera.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-            self.camera.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
-            self.camera.set(cv2.CAP_PROP_FPS, 30)
-
-            self.is_active = True
-            self.attendance_marked.clear()
-            self.frame_count = 0
-
-            # Create attendance session
-            if user:
-                self.current_session = AttendanceSession.objects.create(
-                    name=f"Face Recognition - {datetime.now().strftime('%H:%M')}",
-                    created_by=user,
-                    is_active=True
-                )
-
-            logger.info("Camera started successfully")
-            return True
-
-        except Exception as e:
-            logger.error(f"Error starting camera: {e}")
-            return False
-
-    def stop_camera(self):
-        """Stop camera and end session"""
-        try:
-            self.is_active = False
-
-            if self.camera is not None:
-                self.camera.release()
-                self.camera = None
-
-            # End current session
-            if self.current_session:
-                self.current_session.total_recognized = len(
-                    self.attendance_marked)
-                self.current_session.end_session()
-                self.current_session = None
-
-            cv2.destroyAllWindows()
-            logger.info("Camera stopped successfully")
-            return True
-
-        except Exception as e:
-            logger.error(f"Error stopping camera: {e}")
-            return False
-
-    def generate_frames(self):
-        """Generate camera frames with face recognition"""
-        while self.is_active and self.camera is not None:
-            try:
-                success, frame = self.camera.read()
-                if not success:
-                    break
-
-                self.frame_count += 1
-
-                # Process every 3rd frame for performance
-                if self.frame_count % 3 == 0:
-                    frame = self.process_frame(frame)
-
-                # Encode frame as JPEG
-                ret, buffer = cv2.imencode(
-                    '.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
-                if ret:
-                    frame_bytes = buffer.tobytes()
-                    yield (b'--frame\r\n'
-                           b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-
-            except Exception as e:
-                logger.error(f"Error generating frame: {e}")
-                break
-
-    def process_frame(self, frame):
-        """Process frame for face recognition"""
-        try:
-            # Resize frame for faster processing
-            small_frame = cv2.resize(frame, (0, 0), fx=0.25, fy=0.25)
-            rgb_small_frame = cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB)
-
-            # Find faces in current frame
-            face_locations = face_recognition.face_locations(rgb_small_frame)
-            face_encodings = face_recognition.face_encodings(
-                rgb_small_frame, face_locations)
-
-            # Process each face
-            for (top, right, bottom, left), face_encoding in zip(face_locations, face_encodings):
-                # Scale back coordinates
-                top *= 4
-                right *= 4
-                bottom *= 4
-                left *= 4
-
-                # Compare with known faces
-                matches = face_recognition.compare_faces(
-                    self.known_face_encodings, face_encoding, tolerance=self.recognition_threshold
-                )
-
-                name = "Unknown"
-                confidence = 0
-                student_id = None
-
-                if matches and any(matches):
-                    # Find best match
-                    face_distances = face_recognition.face_distance(
-                        self.known_face_encodings, face_encoding
-                    )
-                    best_match_index = np.argmin(face_distances)
-
-                    if matches[best_match_index]:
-                        name = self.known_face_names[best_match_index]
-                        confidence = 1 - face_distances[best_match_index]
-                        student_id = self.known_student_ids[best_match_index]
-
-                        # Mark attendance if not already marked
-                        if student_id not in self.attendance_marked and confidence > 0.4:
-                            self.mark_attendance(student_id, confidence)
-                            self.attendance_marked.add(student_id)
-
-                # Draw rectangle and label
-                color = (0, 255, 0) if student_id else (0, 0, 255)
-                cv2.rectangle(frame, (left, top), (right, bottom), color, 2)
-
-                # Draw label
-                label = f"{name} ({confidence:.2f})" if confidence > 0 else name
-                cv2.rectangle(frame, (left, bottom - 35),
-                              (right, bottom), color, cv2.FILLED)
-                cv2.putText(frame, label, (left + 6, bottom - 6),
-                            cv2.FONT_HERSHEY_DUPLEX, 0.6, (255, 255, 255), 1)
-
-            # Add status overlay
-            self.add_status_overlay(frame)
-
-            return frame
-
-        except Exception as e:
-            logger.error(f"Error processing frame: {e}")
-            return frame
-
-    def add_status_overlay(self, frame):
-        """Add status information to frame"""
-        try:
-            height, width = frame.shape[:2]
-
-            # Status background
-            cv2.rectangle(frame, (10, 10), (300, 100), (0, 0, 0), -1)
-            cv2.rectangle(frame, (10, 10), (300, 100), (255, 255, 255), 2)
-
-            # Status text
-            cv2.putText(frame, f"Students: {len(self.known_face_encodings)}",
-                        (20, 35), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
-            cv2.putText(frame, f"Present: {len(self.attendance_marked)}",
-                        (20, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
-            cv2.putText(frame, f"Frame: {self.frame_count}",
-                        (20, 85), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
-
-        except Exception as e:
-            logger.error(f"Error adding overlay: {e}")
-
-    def mark_attendance(self, student_id, confidence):
-        """Mark attendance for recognized student"""
-        try:
-            student = Student.objects.get(id=student_id)
-            attendance, created = Attendance.mark_attendance(
-                student=student,
-                status='present',
-                confidence=confidence,
-                notes=f'Face recognition - {confidence:.2f} confidence'
-            )
-
-            if created:
-                logger.info(
-                    f"Marked attendance for {student.name} ({confidence:.2f})")
-            else:
-                logger.info(
-                    f"Updated attendance for {student.name} ({confidence:.2f})")
-
-        except Exception as e:
-            logger.error(f"Error marking attendance: {e}")
-
-
-# Global camera instance
-camera = FaceRecognitionCamera()
+def get_camera(camera_id):
+    """Camera and frame hub for a configured id; 404 for unknown ids"""
+    if camera_id not in registry:
+        raise Http404(f"Unknown camera: {camera_id}")
+    return registry.camera(camera_id), registry.hub(camera_id)
 
 
 @login_required
+# Includes the one-off gallery load when the first visit creates the camera
+@query_budget(7)
 def take_attendance(request):
     """Main attendance taking page"""
     if not (request.user.is_staff or request.user.is_superuser):
@@ -267,24 +51,54 @@ def take_attendance(request):
             request, 'You do not have permission to take attendance.')
         return redirect('student_dashboard')
 
+    # ?camera=<id> picks the classroom; every stream URL on the page is scoped to it
+    camera_id = request.GET.get('camera', DEFAULT_CAMERA)
+    get_camera(camera_id)
+    # ?class=<code> (repeatable) binds the session the camera starts to those classes
+    selected_classes = request.GET.getlist('class')
+    counts = Student.objects.aggregate(
+        total=Count('id'), with_encodings=Count('id', filter=Q(face_encoding__isnull=False)))
+
     context = {
+        'camera_id': camera_id,
+        'cameras': list(registry),
+        'classes': StudentClass.objects.order_by('code'),
+        'selected_classes': selected_classes,
+        'class_query': ','.join(selected_classes),
         'today_date': date.today(),
-        'total_students': Student.objects.count(),
-        'students_with_encodings': Student.objects.filter(face_encoding__isnull=False).count(),
+        'total_students': counts['total'],
+        'students_with_encodings': counts['with_encodings'],
     }
     return render(request, 'attendance/take_attendance.html', context)
 
 
-def video_feed(request):
+async def video_feed(request, camera_id=DEFAULT_CAMERA):
     """Video streaming endpoint"""
+    # The first lookup of a camera may load the gallery from the database
+    camera, hub = await sync_to_async(get_camera)(camera_id)
     try:
         if not camera.is_active:
-            # Start camera if not active
-            if not camera.start_camera(request.user if request.user.is_authenticated else None):
+            # ?classes=CS101,CS102 binds the new session to those classes
+            try:
+                class_ids = await sync_to_async(resolve_classes)(
+                    request.GET.get('classes', '').split(','))
+            except ValueError as e:
+                return HttpResponse(str(e), status=400)
+            # Start camera if not active; opening the device blocks, so keep it off the event loop
+            user = await request.auser()
+            started = await sync_to_async(camera.start_camera)(
+                user if user.is_authenticated else None, class_ids)
+            if not started:
                 return HttpResponse("Camera not available", status=503)
 
+        hub.start()
+        # ?profile=thumbnail|standard|full picks resolution, quality and fps
+        profile = request.GET.get('profile', DEFAULT_PROFILE)
+        # Under ASGI viewers wait on the event loop instead of holding a thread each
+        frames = hub.async_subscribe(profile) if is_asgi(
+            request) else hub.subscribe(profile)
         return StreamingHttpResponse(
-            camera.generate_frames(),
+            frames,
             content_type='multipart/x-mixed-replace; boundary=frame'
         )
     except Exception as e:
@@ -292,11 +106,46 @@ def video_feed(request):
         return HttpResponse("Video feed error", status=500)
 
 
+def live_status(camera, hub):
+    """In-memory recognition status; runs no database queries"""
+    return {
+        'camera_id': camera.camera_id,
+        'recognition_active': camera.is_active,
+        'session_recognized': len(camera.attendance_marked),
+        'frame_count': camera.frame_count,
+        'gallery_size': len(camera.gallery),
+        'gallery_version': camera.gallery.version,
+        'stream': hub.stats(),
+        'metrics': metrics.summary(camera=camera.camera_id),
+    }
+
+
+def recognized_snapshot(camera):
+    """Students recognized in the current session, for (re)connecting event streams"""
+    return {'recognized_students': list(camera.recognized.values())}
+
+
+@login_required
+async def status_stream(request, camera_id=DEFAULT_CAMERA):
+    """Server-sent events: recognitions as they happen plus periodic status totals"""
+    camera, hub = await sync_to_async(get_camera)(camera_id)
+    stream = EventStream(
+        camera.events, partial(recognized_snapshot, camera), partial(live_status, camera, hub),
+        last_event_id=request.headers.get('Last-Event-ID'))
+    events = stream.asynchronous() if is_asgi(request) else stream.blocking()
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
 @login_required
 @require_http_methods(["POST"])
-def stop_camera(request):
+def stop_camera(request, camera_id=DEFAULT_CAMERA):
     """Stop camera endpoint"""
+    camera, hub = get_camera(camera_id)
     try:
+        hub.stop()
         success = camera.stop_camera()
         return JsonResponse({
             'success': success,
@@ -309,28 +158,65 @@ def stop_camera(request):
 
 
 @login_required
-def attendance_status(request):
-    """Get current attendance status"""
+@require_http_methods(["POST"])
+def recording_view(request, camera_id=DEFAULT_CAMERA):
+    """Start or stop recording a running camera to media/recordings/sessions/ for later replay"""
+    if not (request.user.is_staff or request.user.is_superuser):
+        return JsonResponse({'success': False, 'message': 'Permission denied'}, status=403)
+
+    camera, hub = get_camera(camera_id)
+    action = request.POST.get('action', 'start')
+    try:
+        if action == 'stop':
+            recorder = camera.stop_recording()
+            if recorder is None:
+                return JsonResponse({'success': False, 'message': 'Camera is not recording'})
+            return JsonResponse({
+                'success': True,
+                'name': os.path.relpath(recorder.path, default_storage.location),
+                'frames': recorder.frames_written,
+            })
+
+        if not camera.is_active:
+            return JsonResponse({'success': False, 'message': f'Camera {camera_id} is not running'})
+        name = f"recordings/sessions/{camera_id}-{timezone.now():%Y%m%d-%H%M%S}.fprec"
+        name = default_storage.get_available_name(name)
+        path = default_storage.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        camera.start_recording(path)
+        # The storage name, not the server's filesystem path
+        return JsonResponse({'success': True, 'name': name})
+
+    except Exception as e:
+        logger.error(f"Error recording camera {camera_id}: {e}")
+        return JsonResponse({'success': False, 'message': str(e)})
+
+
+@login_required
+def attendance_status(request, camera_id=DEFAULT_CAMERA):
+    """
+    Get current attendance status from the camera's in-memory snapshot.
+
+    Responses carry an ETag; a poll whose If-None-Match is still current gets
+    an empty 304. Passing ?since=<version> returns only the students
+    recognized after that version.
+    """
+    camera, hub = get_camera(camera_id)
     try:
-        total_students = Student.objects.count()
-        today_attendance = Attendance.objects.filter(date=date.today())
-        present_count = today_attendance.filter(status='present').count()
+        snapshot = camera.snapshot
+        snapshot.maybe_refresh_counts()
 
-        # Get recognized students in current session
-        recognized_students = []
-        if camera.attendance_marked:
-            recognized_students = list(Student.objects.filter(
-                id__in=camera.attendance_marked
-            ).values('id', 'name', 'roll_no'))
+        if snapshot.not_modified(request.headers.get('If-None-Match')):
+            response = HttpResponse(status=304)
+            response['ETag'] = snapshot.etag
+            return response
 
-        return JsonResponse({
-            'success': True,
-            'total_students': total_students,
-            'present_count': present_count,
-            'recognition_active': camera.is_active,
-            'session_recognized': len(camera.attendance_marked),
-            'recognized_students': recognized_students,
-        })
+        body, etag = snapshot.body(
+            since=snapshot.parse_version(request.GET.get('since')))
+        response = HttpResponse(body, content_type='application/json')
+        response['ETag'] = etag
+        response['Cache-Control'] = 'no-cache'
+        return response
 
     except Exception as e:
         logger.error(f"Error getting attendance status: {e}")
@@ -338,6 +224,100 @@ def attendance_status(request):
 
 
 @login_required
+def stream_stats(request, camera_id=DEFAULT_CAMERA):
+    """Get viewer count and per-client frame drop rates"""
+    camera, hub = get_camera(camera_id)
+    return JsonResponse({
+        'success': True,
+        'camera_id': camera_id,
+        'stream': hub.stats(),
+        'metrics': metrics.summary(camera=camera_id),
+    })
+
+
+def metrics_view(request):
+    """Per-stage latency histograms and counters in Prometheus text format"""
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@login_required
+async def profile_view(request, camera_id=DEFAULT_CAMERA):
+    """Profile a running camera for ?seconds= and return collapsed stacks or pstats as text"""
+    user = await request.auser()
+    if not (user.is_staff or user.is_superuser):
+        return JsonResponse({'success': False, 'message': 'Permission denied'}, status=403)
+
+    camera, hub = await sync_to_async(get_camera)(camera_id)
+    try:
+        seconds = float(request.GET.get('seconds', 10))
+    except ValueError:
+        return JsonResponse({'success': False, 'message': 'Invalid seconds'})
+    if not camera.is_active:
+        return JsonResponse({'success': False, 'message': f'Camera {camera_id} is not running'})
+
+    try:
+        # The capture waits for seconds; keep it off the thread shared by sync views
+        report = await sync_to_async(profile_camera, thread_sensitive=False)(
+            camera, seconds, mode=request.GET.get('mode', 'sample'), pool=registry.pool,
+            sort=request.GET.get('sort', 'cumulative'))
+    except ValueError as e:
+        return JsonResponse({'success': False, 'message': str(e)})
+    except RuntimeError as e:
+        return JsonResponse({'success': False, 'message': str(e)}, status=409)
+    return HttpResponse(report, content_type='text/plain; charset=utf-8')
+
+
+@login_required
+def unknowns_view(request, camera_id=DEFAULT_CAMERA):
+    """
+    Export the camera's clusters of recently seen unknown faces, most seen first.
+
+    Each cluster has its mean encoding and, unless ?images=0, its latest face
+    crop as a base64 JPEG, so frequent unknown visitors can be enrolled.
+    ?min_sightings= drops rarely seen faces.
+    """
+    if not (request.user.is_staff or request.user.is_superuser):
+        return JsonResponse({'success': False, 'message': 'Permission denied'}, status=403)
+
+    camera, hub = get_camera(camera_id)
+    try:
+        min_sightings = int(request.GET.get('min_sightings', 1))
+    except ValueError:
+        return JsonResponse({'success': False, 'message': 'Invalid min_sightings'})
+    with_images = request.GET.get('images', '1') not in ('0', 'false')
+
+    clusters = []
+    for cluster in camera.unknowns.export(min_sightings):
+        exported = {
+            'id': cluster.id,
+            'sightings': cluster.sightings,
+            'first_seen': datetime.fromtimestamp(cluster.first_seen, dt_timezone.utc).isoformat(),
+            'last_seen': datetime.fromtimestamp(cluster.last_seen, dt_timezone.utc).isoformat(),
+            'encoding': [round(float(value), 6) for value in cluster.centroid],
+        }
+        if with_images and cluster.image is not None and cluster.image.size:
+            success, jpeg = cv2.imencode('.jpg', cv2.cvtColor(cluster.image, cv2.COLOR_RGB2BGR))
+            if success:
+                exported['image'] = base64.b64encode(jpeg.tobytes()).decode('ascii')
+        clusters.append(exported)
+
+    return JsonResponse({'success': True, 'camera': camera_id, 'clusters': clusters})
+
+
+@login_required
+def cameras_api(request):
+    """List configured cameras with their stream URLs and the shared recognition load"""
+    stats = registry.stats()
+    for camera_id, camera_stats in stats['cameras'].items():
+        camera_stats['video_feed'] = reverse(
+            'camera_video_feed', args=[camera_id])
+        camera_stats['status_stream'] = reverse(
+            'camera_status_stream', args=[camera_id])
+    return JsonResponse({'success': True, **stats})
+
+
+@login_required
+@query_budget(3)
 def students_api(request):
     """Get students list for attendance"""
     try:
@@ -375,13 +355,13 @@ def load_encodings_view(request):
         # Run load encodings command
         call_command('load_encodings', '--force')
 
-        # Reload encodings in camera
-        camera.load_face_encodings()
+        # Apply the published changes to the running gallery
+        registry.gallery.refresh(force=True)
 
         return JsonResponse({
             'success': True,
             'message': 'Face encodings loaded successfully',
-            'count': len(camera.known_face_encodings)
+            'count': len(registry.gallery)
         })
 
     except Exception as e:
@@ -389,6 +369,57 @@ def load_encodings_view(request):
         return JsonResponse({'success': False, 'message': str(e)})
 
 
+@login_required
+@require_http_methods(["POST"])
+def process_video_view(request):
+    """Upload a recorded lecture and mark attendance from it in the background"""
+    if not (request.user.is_staff or request.user.is_superuser):
+        return JsonResponse({'success': False, 'message': 'Permission denied'})
+
+    video = request.FILES.get('video')
+    if not video:
+        return JsonResponse({'success': False, 'message': 'Video file required'})
+
+    started_at = None
+    if request.POST.get('start'):
+        started_at = parse_datetime(request.POST['start'])
+        if started_at is None:
+            return JsonResponse({'success': False, 'message': 'Invalid start time'})
+        if timezone.is_naive(started_at):
+            started_at = timezone.make_aware(started_at)
+
+    try:
+        sample_rate = float(request.POST.get('sample_rate', 2.0))
+    except ValueError:
+        return JsonResponse({'success': False, 'message': 'Invalid sample rate'})
+
+    try:
+        name = default_storage.save(f'recordings/{video.name}', video)
+        job = start_job(default_storage.path(name), request.user,
+                        started_at=started_at, sample_rate=sample_rate)
+        return JsonResponse({
+            'success': True,
+            'job_id': job.id,
+            'status_url': reverse('process_video_status', args=[job.id]),
+        }, status=202)
+
+    except Exception as e:
+        logger.error(f"Error starting video processing: {e}")
+        return JsonResponse({'success': False, 'message': str(e)})
+
+
+@login_required
+def process_video_status(request, job_id):
+    """Progress and report of an uploaded recording"""
+    if not (request.user.is_staff or request.user.is_superuser):
+        return JsonResponse({'success': False, 'message': 'Permission denied'}, status=403)
+
+    job = jobs.get(job_id)
+    if job is None:
+        return JsonResponse({'success': False, 'message': 'Job not found'}, status=404)
+    return JsonResponse({'success': True, **job.stats()})
+
+
 @login_required
 @require_http_methods(["POST"])
 def mark_attendance_api(request):
@@ -412,6 +443,8 @@ def mark_attendance_api(request):
             notes=notes
         )
 
+        registry.refresh_counts()
+
         action = 'created' if created else 'updated'
         return JsonResponse({
             'success': True,
@@ -427,6 +460,7 @@ def mark_attendance_api(request):
 
 
 @login_required
+@query_budget(6)
 def manual_attendance(request):
     """Manual attendance entry page"""
     if not (request.user.is_staff or request.user.is_superuser):
@@ -447,6 +481,8 @@ def manual_attendance(request):
                 notes=f'Manual entry: {notes}' if notes else 'Manual entry'
             )
 
+            registry.refresh_counts()
+
             action = 'marked' if created else 'updated'
             messages.success(
                 request, f'Attendance {action} for {student.name}')
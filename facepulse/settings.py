@@ -34,11 +34,14 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
 
-    # Only keep attendance app - remove faculty and student to fix conflicts
+    # The student app stays out to avoid conflicts; faculty provides StudentClass
     'attendance',
+    'faculty',
 ]
 
 MIDDLEWARE = [
+    # First, so the queries of every other middleware are counted too
+    'attendance.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -111,6 +114,105 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Cameras served by this process: id -> device index, RTSP/HTTP URL, video file
+# or 'replay:<recording>?speed=N' for a session saved by record_session
+FACEPULSE_CAMERAS = {
+    'default': 0,
+}
+
+# Recognition worker threads shared by all cameras
+FACEPULSE_RECOGNITION_WORKERS = 2
+
+# Gallery storage: codes None keeps float64 encodings; 'float16' or 'int8' keeps compact
+# codes resident and re-ranks the `rerank` nearest codes from a memory-mapped float32 copy
+FACEPULSE_GALLERY_QUANTIZATION = {
+    'codes': None,
+    'rerank': 16,
+}
+
+# Sessions bound to classes only match those classes' students; with this on,
+# a face no class member matches is retried against the whole gallery
+FACEPULSE_CLASS_FALLBACK = False
+
+# Landmark model ('small' 5-point or 'large' 68-point) and num_jitters for live
+# recognition (cameras, recorded lectures, group photos) and for enrollment
+# (load_encodings, watch_students); compare combinations with
+# `python manage.py benchmark_encoding <labelled folder>`
+FACEPULSE_ENCODING = {
+    'live': {'model': 'small', 'num_jitters': 1},
+    'enrollment': {'model': 'small', 'num_jitters': 1},
+}
+
+# Group photo detection: overlapping tiles of `tile` pixels at full resolution.
+# workers > 1 spreads the tiles of each photo over a process pool that stays
+# up inside the web server, with each worker holding its own dlib models; raise
+# it only on hosts that have cores to spare for uploads
+FACEPULSE_PHOTO_DETECTION = {
+    'tile': 1024,
+    'overlap': 256,
+    'upsample': 0,
+    'workers': 1,
+}
+
+# Second detection pass: after the 0.25 downscale pass, re-scan back rows,
+# recently lost faces and moving areas at `scale` of full resolution. back_rows
+# maps camera ids to (left, top, right, bottom) fractions of the frame and turns
+# the pass on for those cameras; 'enabled': True turns it on for every camera.
+# Lost faces and motion are capped to max_area of the frame per recognized frame
+FACEPULSE_REFINEMENT = {
+    'enabled': False,
+    'scale': 1.0,
+    'max_area': 0.25,
+    'back_rows': {
+        # 'room-101': [(0.0, 0.0, 1.0, 0.35)],
+    },
+}
+
+# Students recently recognized on a camera are compared before the whole
+# gallery; a face within accept_distance of one (capped at the recognition
+# threshold, and provably closer to them than to anyone else) is accepted
+# without a gallery search
+FACEPULSE_SHORTLIST = {
+    'enabled': True,
+    'size': 32,
+    'accept_distance': 0.4,
+}
+
+# Unknown faces are clustered per camera; a face close to a cluster that is far
+# enough from every student skips the gallery search. Clusters expire after ttl
+# seconds unseen and are exported at /attendance/cameras/<id>/unknowns/
+FACEPULSE_UNKNOWNS = {
+    'enabled': True,
+    'radius': 0.35,
+    'ttl': 600,
+    'max_clusters': 256,
+}
+
+# Face quality gate run before encoding: faces smaller than min_size pixels of
+# the full frame, blurrier than min_sharpness, or turned/tilted beyond
+# max_yaw/max_roll are skipped for that frame (None disables a check)
+FACEPULSE_QUALITY = {
+    'enabled': True,
+    'min_size': 40,
+    'min_sharpness': 50.0,
+    'max_yaw': 0.6,
+    'max_roll': None,
+}
+
+# Requests slower than this are logged with their slowest queries
+FACEPULSE_SLOW_REQUEST_SECONDS = 1.0
+
+# Recognition audit log: fraction of outcomes kept per status (attendance marks
+# are always kept), ring buffer and batch sizes, and days kept by prune_recognition_logs
+FACEPULSE_AUDIT = {
+    'sample_rates': {'success': 0.05, 'failed': 0.2, 'multiple': 0.05, 'none': 0.0},
+    'buffer_size': 5000,
+    'batch_size': 500,
+    'flush_interval': 2.0,
+    'save_images': True,
+    'retention_days': 30,
+}
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
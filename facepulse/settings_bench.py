@@ -0,0 +1,49 @@
+"""
+Settings for `python manage.py benchmark --settings=facepulse.settings_bench`.
+
+Runs against a throwaway SQLite database so benchmarks need neither
+Postgres nor a camera. SQLite has no array type, so face encodings are
+stored as JSON text: lists are adapted to JSON on the way in, the column's
+declared type ("real[128]") selects the converter on the way out, and the
+Postgres "::real[128]" cast is left out of insert placeholders.
+"""
+import json
+import sqlite3
+
+from django.contrib.postgres.fields import ArrayField
+
+from .settings import *  # noqa: F401,F403
+
+# Kept out of the source tree proper; .bench/ is ignored by git
+BENCH_DIR = BASE_DIR / '.bench'  # noqa: F405
+BENCH_DIR.mkdir(exist_ok=True)
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BENCH_DIR / 'benchmark.sqlite3',
+    }
+}
+
+sqlite3.register_adapter(list, json.dumps)
+sqlite3.register_converter('real[128]', json.loads)
+
+_array_placeholder = ArrayField.get_placeholder
+
+
+def _get_placeholder(self, value, compiler, connection):
+    if connection.vendor == 'sqlite':
+        return '%s'
+    return _array_placeholder(self, value, compiler, connection)
+
+
+ArrayField.get_placeholder = _get_placeholder
+
+# Keep sampled audit writes out of the timings; attendance marks are still logged
+FACEPULSE_AUDIT = {'sample_rates': {}}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'root': {'level': 'WARNING'},
+}
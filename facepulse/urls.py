@@ -20,6 +20,8 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 from . import views
+from attendance import views as attendance_views
+from faculty import views as faculty_views
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -27,7 +29,9 @@ urlpatterns = [
     path('dashboard/', views.dashboard_redirect, name='dashboard_redirect'),
     path('dashboard/admin/', views.admin_dashboard, name='admin_dashboard'),
     path('dashboard/student/', views.student_dashboard, name='student_dashboard'),
+    path('dashboard/take-attendance/', faculty_views.take_attendance, name='group_photo_attendance'),
     path('attendance/', include('attendance.urls')),
+    path('metrics', attendance_views.metrics_view, name='metrics'),
     path('', views.home, name='home'),
 ]
 
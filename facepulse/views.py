@@ -4,7 +4,9 @@ from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
 from django.contrib import messages
 from django.db import connection
+from django.db.models import Count, Q
 from attendance.models import Student, Attendance
+from attendance.queries import query_budget
 from datetime import date, timedelta
 import logging
 
@@ -19,6 +21,7 @@ def home(request):
 
 
 @login_required
+@query_budget(5)
 def dashboard_redirect(request):
     """Redirect users to appropriate dashboard based on their role"""
     try:
@@ -47,6 +50,7 @@ def dashboard_redirect(request):
 
 
 @login_required
+@query_budget(7)
 def admin_dashboard(request):
     """Admin dashboard view"""
     try:
@@ -67,6 +71,7 @@ def admin_dashboard(request):
 
 
 @login_required
+@query_budget(8)
 def student_dashboard(request):
     """Student dashboard view"""
     try:
@@ -150,13 +155,15 @@ def get_admin_dashboard_context():
 def get_student_dashboard_context(student):
     """Get context data for student dashboard with error handling"""
     try:
-        # Get student's attendance records safely
-        attendance_records = Attendance.objects.filter(
-            student=student).order_by('-date')[:30]
+        # Get student's attendance records safely; a sliced queryset cannot be
+        # filtered again, so the statistics are counted from the fetched rows
+        attendance_records = list(Attendance.objects.filter(
+            student=student).order_by('-date')[:30])
 
         # Calculate attendance statistics safely
-        total_days = attendance_records.count()
-        present_days = attendance_records.filter(status='present').count()
+        total_days = len(attendance_records)
+        present_days = sum(
+            1 for record in attendance_records if record.status == 'present')
 
         if total_days > 0:
             attendance_percentage = round((present_days / total_days * 100), 2)
@@ -170,9 +177,12 @@ def get_student_dashboard_context(student):
             student=student,
             date__gte=month_start,
             date__lte=today
+        ).aggregate(
+            total=Count('id'),
+            present=Count('id', filter=Q(status='present')),
         )
-        month_present = month_attendance.filter(status='present').count()
-        month_total = month_attendance.count()
+        month_present = month_attendance['present']
+        month_total = month_attendance['total']
 
         if month_total > 0:
             month_percentage = round((month_present / month_total * 100), 2)
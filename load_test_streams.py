@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+"""
+Load test for the streaming endpoints
+Opens many concurrent MJPEG viewers and status-stream pollers against a running
+server and reports how many frames/events each client received.
+
+Run the server under ASGI first, for example:
+    uvicorn facepulse.asgi:application --port 8000
+Then:
+    python load_test_streams.py --viewers 200 --pollers 200 --sessionid <cookie>
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from urllib.parse import urlsplit
+
+
+async def open_stream(url, sessionid):
+    """Send a GET request and return the reader positioned after the headers"""
+    parts = urlsplit(url)
+    reader, writer = await asyncio.open_connection(parts.hostname, parts.port or 80)
+    path = parts.path + (f'?{parts.query}' if parts.query else '')
+
+    request = f'GET {path} HTTP/1.1\r\nHost: {parts.netloc}\r\nConnection: close\r\n'
+    if sessionid:
+        request += f'Cookie: sessionid={sessionid}\r\n'
+    writer.write((request + '\r\n').encode())
+    await writer.drain()
+
+    status_line = await reader.readline()
+    while (await reader.readline()) not in (b'\r\n', b''):
+        pass
+    return reader, writer, status_line
+
+
+async def run_client(url, sessionid, marker, duration):
+    """Read one stream for duration seconds and count marker occurrences"""
+    result = {'events': 0, 'bytes': 0, 'error': None}
+    writer = None
+    deadline = time.monotonic() + duration
+
+    try:
+        reader, writer, status_line = await open_stream(url, sessionid)
+        if b' 200 ' not in status_line:
+            result['error'] = status_line.decode(errors='replace').strip()
+            return result
+
+        tail = b''
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                chunk = await asyncio.wait_for(reader.read(65536), remaining)
+            except asyncio.TimeoutError:
+                break
+            if not chunk:
+                break
+            data = tail + chunk
+            result['events'] += data.count(marker)
+            result['bytes'] += len(chunk)
+            tail = data[-(len(marker) - 1):]
+
+    except OSError as e:
+        result['error'] = str(e)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    return result
+
+
+def summarize(name, results, duration):
+    """Print per-client rates for one kind of client"""
+    ok = [r for r in results if r['error'] is None]
+    errors = len(results) - len(ok)
+    print(f"{name}: {len(ok)}/{len(results)} connected, {errors} errors")
+    if not ok:
+        return
+
+    rates = [r['events'] / duration for r in ok]
+    total_bytes = sum(r['bytes'] for r in ok)
+    print(f"  per-client rate: mean {statistics.mean(rates):.1f}/s, "
+          f"min {min(rates):.1f}/s, max {max(rates):.1f}/s")
+    print(f"  total throughput: {total_bytes / duration / 1e6:.2f} MB/s")
+
+    first_error = next((r['error'] for r in results if r['error']), None)
+    if first_error:
+        print(f"  first error: {first_error}")
+
+
+async def main_async(args):
+    base = args.url.rstrip('/')
+    video_url = f"{base}/attendance/video_feed/"
+    status_url = f"{base}/attendance/status_stream/"
+
+    tasks = []
+    total = args.viewers + args.pollers
+    delay = args.ramp / total if total else 0
+
+    print(f"Opening {args.viewers} viewers and {args.pollers} pollers "
+          f"for {args.duration:.0f}s against {base}")
+
+    for _ in range(args.viewers):
+        tasks.append(('viewers', asyncio.create_task(
+            run_client(video_url, args.sessionid, b'--frame', args.duration))))
+        await asyncio.sleep(delay)
+    for _ in range(args.pollers):
+        tasks.append(('pollers', asyncio.create_task(
+            run_client(status_url, args.sessionid, b'data: ', args.duration))))
+        await asyncio.sleep(delay)
+
+    results = {'viewers': [], 'pollers': []}
+    for kind, task in tasks:
+        results[kind].append(await task)
+
+    print("=" * 40)
+    summarize('Viewers', results['viewers'], args.duration)
+    summarize('Pollers', results['pollers'], args.duration)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--url', default='http://127.0.0.1:8000',
+                        help='Server base URL')
+    parser.add_argument('--viewers', type=int, default=100,
+                        help='Concurrent video_feed clients')
+    parser.add_argument('--pollers', type=int, default=100,
+                        help='Concurrent status_stream clients')
+    parser.add_argument('--duration', type=float, default=30.0,
+                        help='Seconds each client stays connected')
+    parser.add_argument('--ramp', type=float, default=5.0,
+                        help='Seconds over which clients are opened')
+    parser.add_argument('--sessionid', default='',
+                        help='Session cookie of a logged-in user (status_stream requires login)')
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()